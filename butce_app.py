@@ -1,22 +1,39 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import re, io, os, time, datetime as dt, unicodedata
+import os, time, json, uuid, hashlib, importlib.util, datetime as dt
 from urllib.parse import unquote
+from butce_core import (  # çekirdek: ayarlar, ayrıştırıcı, depo, ortak durum, çalışma alanı, izleme
+    CMD_MIN_CONFIDENCE, DEFAULT_EXCEL_PATH, DEFAULT_MULTIPLIER, DERIVED_COLS, OPS, RULES_PATH, RULES_SHEET,
+    SOURCE_COL, SOURCE_PATH, STORE_BACKEND, TRACE_DEFAULT, WORKSTORE_PATH,
+    extract_amount, extract_personref, find_personref_by_name, name_candidates, parse_command, parse_commands,
+    parse_op_from_text, tl, tr_lower,
+    get_journal, get_store, load_history, merge_columns, needed_columns, to_bytes,
+    SharedState, Branch, derive, kpi_apply, kpi_rollup, num_at, rule_at,
+    ov_edit, ws_apply, ws_kpi_delta, ws_rebind, ws_values, ws_view,
+    current_trace, trace_count, trace_export, trace_span, trace_stage, trace_start, trace_stop, traced,
+)
+from functools import wraps
 
 # ================== AYAR ==================
-DEFAULT_EXCEL_PATH = "BÜTÇE ÇALIŞMAA.xlsx"
+# Veri/depo ayarları butce_core'da; burada sadece arayüze ait olanlar
+CHANGE_POLL_SECONDS = 5    # diğer kullanıcıların kayıtlarını kontrol aralığı
+EXPORT_CACHE_MAX = 8       # önbellekte tutulan hazır indirme dosyası sayısı (en eski atılır)
+UNDO_MAX = 50              # çalışma alanı başına geri alınabilecek adım sayısı
+TRACE_KEEP = 30            # izleme açıkken oturumda tutulan son çalıştırma izi sayısı
+# Ses kanalı: sayfa yenilemeden metin gönderen / yanıtları okuyan bileşen (ses_kanali/index.html)
+SES_KANALI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ses_kanali")
+
+_ses_kanali = st.components.v1.declare_component("ses_kanali", path=SES_KANALI_DIR)
 
 st.set_page_config(page_title="Bütçe Uygulaması", page_icon="💰")
 st.title("Bütçe Uygulaması 💰")
 
 # ================== YARDIMCI ==================
 def speak(text: str):
-    st.components.v1.html(
-        "<script>try{const u=new SpeechSynthesisUtterance("
-        + repr(str(text)) +
-        ");u.lang='tr-TR';speechSynthesis.cancel();speechSynthesis.speak(u);}catch(e){}</script>", height=0
-    )
+    # sesli yanıt kuyruğa alınır; ses kanalı bileşeni bir sonraki çiziminde tarayıcıda okur
+    st.session_state.say_seq = st.session_state.get("say_seq", 0) + 1
+    st.session_state.setdefault("say_queue", []).append([st.session_state.say_seq, str(text)])
 
 def get_query_param(name: str):
     try:
@@ -28,179 +45,45 @@ def get_query_param(name: str):
     except Exception:
         return None
 
-@st.cache_data(show_spinner=False)
-def read_excel_path(path: str, mtime: float) -> pd.DataFrame:
-    return pd.read_excel(path)
-
-def _strip_accents(s: str) -> str:
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def _canon(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = _strip_accents(s)
-    s = re.sub(r"[^a-z0-9çğıöşü]+", "", s)
-    return s
-
-def tl(x):
-    try: return f"{x:,.2f} TL".replace(",", "X").replace(".", ",").replace("X", ".")
-    except Exception: return f"{x} TL"
-
-def get_numeric(val, default=0.0):
-    try:
-        if pd.isna(val): return float(default)
-        return float(val)
-    except Exception: return float(default)
-
-# ==== TR sayı kelimeleri ====
-TR1={"sıfır":0,"sifir":0,"bir":1,"iki":2,"üç":3,"uc":3,"dört":4,"dort":4,"beş":5,"bes":5,"altı":6,"alti":6,"yedi":7,"sekiz":8,"dokuz":9}
-TR10={"on":10,"yirmi":20,"otuz":30,"kırk":40,"kirk":40,"elli":50,"altmış":60,"altmis":60,"yetmiş":70,"yetmis":70,"seksen":80,"doksan":90}
-TRM={"yüz":100,"yuz":100,"bin":1000}
-def parse_tr_words(words):
-    total=0; cur=0; used=False
-    for w in words:
-        w=w.lower()
-        if w in TR1: cur+=TR1[w]; used=True
-        elif w in TR10: cur+=TR10[w]; used=True
-        elif w in TRM:
-            mul=TRM[w]
-            if mul==100: cur=(cur or 1)*100
-            else: cur=(cur or 1)*mul; total+=cur; cur=0
-            used=True
-        else:
-            if used: break
-    total+=cur
-    return total if used and total>0 else None
-
-def splitw(txt):
-    return [re.sub(r"[^a-zçğıöşü0-9]", "", w.lower()) for w in txt.split()]
-
-# ==== PersonRef çıkarımı (tutarla karışmaz) ====
-def extract_personref(txt):
-    txt = txt or ""
-    m = re.search(r"(?:person|ref|sicil|kişi|kisi)\D*([0-9][0-9\s]{3,})", txt, re.I)
-    if m:
-        d = re.sub(r"\D", "", m.group(1))
-        if d.isdigit() and len(d) >= 4:
-            return int(d), d
-    m2 = re.search(r"\b(\d[ \d]{3,})\b", txt)
-    if m2:
-        d = re.sub(r"\D", "", m2.group(1))
-        if d.isdigit() and len(d) >= 4:
-            return int(d), d
-    return None, None
-
-def extract_amount(txt, pref_digits):
-    m=re.search(r"(\d[\d\.\,]*)\s*(tl|lira)?\b", txt, re.I)
-    if m:
-        raw=m.group(1).replace(".","").replace(",",".")
-        try:
-            val=float(raw); return val if val>0 else None
-        except: pass
-    ws=splitw(txt)
-    if "tl" in ws or "lira" in ws:
-        idxs=[i for i,w in enumerate(ws) if w in ("tl","lira")]
-        for idx in reversed(idxs):
-            val=parse_tr_words(ws[max(0,idx-6):idx])
-            if val: return float(val)
-    toks=re.findall(r"\d[\d\.\,]*", txt)
-    if pref_digits: toks=[t for t in toks if re.sub(r"\D","",t)!=pref_digits]
-    if toks:
-        raw=toks[-1].replace(".","").replace(",",".")
-        try: val=float(raw); return val if val>0 else None
-        except: pass
-    val=parse_tr_words(ws[::-1])
-    return float(val) if val else None
-
-# ==== İsimden kişi bulma ====
-def build_fullname_columns(df: pd.DataFrame) -> pd.DataFrame:
-    out=df.copy()
-    full = None
-    for c in out.columns:
-        if _canon(c) in {"adsoyad","adsoyadi","ad soyad","ad soyadi"}:
-            full = out[c].astype(str).fillna("").str.strip(); break
-    if full is None:
-        ad_col=None; soyad_col=None
-        for c in out.columns:
-            if _canon(c) in {"ad","adi","isim"}: ad_col=c
-            if _canon(c) in {"soyad","soyadi"}: soyad_col=c
-        if ad_col and soyad_col:
-            full = (out[ad_col].astype(str).fillna("") + " " + out[soyad_col].astype(str).fillna("")).str.strip()
-    out["FULLNAME"] = full if full is not None else ""
-    out["FULLNAME_NORM"]=out["FULLNAME"].astype(str).map(_canon)
-    return out
-
-@st.cache_data(show_spinner=False)
-def normalize_all(df_in: pd.DataFrame) -> pd.DataFrame:
-    df = df_in.copy()
-    c2orig = {_canon(c): c for c in df.columns}
-    def need(name, alts, default):
-        if name in df.columns: return
-        src = None
-        if _canon(name) in c2orig: src = c2orig[_canon(name)]
-        else:
-            for a in alts:
-                if _canon(a) in c2orig: src = c2orig[_canon(a)]; break
-        if src: df.rename(columns={src: name}, inplace=True)
-        else: df[name] = default
-    need("PersonRef", ["sicil","sicil no","person","employee id","id","ref","personref"], pd.NA)
-    need("CurrentSalary", ["mevcut maaş","mevcut ucret","salary","maas"], 0.0)
-    need("NewSalary", ["yeni maaş","yeni ucret","new salary"], 0.0)
-    need("BÜTÇE DIŞI TALEPLER İLE", ["butce disi","budget extra","ekstra"], 0.0)
-    need("DEPARTMAN", ["departman","bölüm","bolum","department","birim"], "")
-
-    for y in ["1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ"]:
-        if y not in df.columns: df[y] = ""
-        df[y] = df[y].fillna("").astype(str)
-    for c in ["PersonRef","CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    df = build_fullname_columns(df)
-
-    used = df["CurrentSalary"].fillna(0)*1.4
-    df["KULLANILAN BÜTÇE DIŞI DAHİL"] = used
-    df["SİSTEM KALAN"] = used - df["NewSalary"].fillna(0)
-    df["BÜTÇE DIŞI KALAN"] = used - df["BÜTÇE DIŞI TALEPLER İLE"].fillna(0)
-    return df
-
-def find_personref_by_name(df: pd.DataFrame, text: str):
-    norm_t=_canon(text)
-    best_len=0; best_ref=None; best_name=None
-    ser_ref=pd.to_numeric(df["PersonRef"], errors="coerce")
-    for i,row in df.iterrows():
-        fn=str(row.get("FULLNAME","") or "")
-        fnn=str(row.get("FULLNAME_NORM","") or "")
-        if not fnn: continue
-        if fnn in norm_t and pd.notna(ser_ref.iat[i]):
-            L=len(fnn)
-            if L>best_len:
-                best_len=L; best_ref=int(float(ser_ref.iat[i])); best_name=fn
-    return (best_ref, best_name) if best_ref is not None else (None, None)
-
-def parse_op_from_text(text: str, fallback_ui_op: str | None = None) -> str | None:
-    t = (text or "").lower()
-    act = None
-    if re.search(r"\b(düş|dus|düşür|çıkar|cikar|eksilt|azalt)\b", t): act = "düş"
-    elif re.search(r"\b(ekle|arttır|artır|yükselt|yukselt)\b", t): act = "ekle"
-    is_dis = ("bütçe dış" in t) or ("butce dis" in t) or bool(re.search(r"\bbütçe\b.*\bdış", t)) or bool(re.search(r"\bbutce\b.*\bdis", t))
-    pool = "dis" if is_dis else "sistem"
-    if act:
-        if pool == "sistem":
-            return "Bütçeden Düş (Sistem Kalan)" if act == "düş" else "Bütçeye Ekle (Sistem Kalan)"
-        else:
-            return "Bütçeden Düş (Bütçe Dışı Kalan)" if act == "düş" else "Bütçeye Ekle (Bütçe Dışı Kalan)"
-    return fallback_ui_op
-
-def manager_chain(row):
-    mans = [str(row.get(k,"")).strip() for k in ["1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ"]]
-    mans = [m for m in mans if m]
-    return " > ".join(mans) if mans else ""
-
-def pool_from_op(op: str):
-    return "Bütçe Dışı" if ("Bütçe Dışı" in (op or "")) else "Sistem"
+@st.cache_resource(show_spinner=False)
+def get_shared() -> SharedState:
+    return SharedState()
+
+# ==== İzleme (🔬 anahtarı, ?izle=1 ya da BUTCE_IZLEME=1) ====
+def iz_baslat():
+    # önceki çalıştırma st.rerun/st.stop ile kesildiyse izi burada kapanır (sesli komut sonrası rerun gibi)
+    ss = st.session_state
+    onceki = ss.get("iz_aktif"); ss.iz_aktif = None
+    if onceki is not None and onceki.ms is None: iz_sakla(onceki.finish("yarıda (rerun/stop)", cut=True))
+    if ss.get("izleme", TRACE_DEFAULT) or get_query_param("izle"):
+        ss.iz_sayac = ss.get("iz_sayac", 0) + 1
+        ss.iz_aktif = trace_start(f"#{ss.iz_sayac}")
+        trace_stage("HAZIRLIK")
+
+def iz_sakla(tr):
+    g = st.session_state.setdefault("iz_gecmis", [])
+    g.append(tr); del g[:-TRACE_KEEP]
+
+def cache_probe(name: str):
+    # st.cache_data'nın dışına: gövde ıskada "ıska" sayar; sayaç değişmediyse çağrı isabettir
+    def deco(cached):
+        @wraps(cached)
+        def call(*a, **k):
+            tr = current_trace()
+            if tr is None: return cached(*a, **k)
+            miss = f"önbellek:{name}:ıska"; before = tr.counters.get(miss, 0)
+            with trace_span(f"önbellek:{name}"): out = cached(*a, **k)
+            if tr.counters.get(miss, 0) == before: trace_count(f"önbellek:{name}:isabet")
+            return out
+        return call
+    return deco
+
+iz_baslat()
 
 # ================== STATE ==================
 defaults = {
     "_last_voice": "",
-    "history": [],
+    "_last_voice_id": None,
     "unsaved_ops": [],
     "pending_batch": None,
     "selected_ref": None,
@@ -210,9 +93,328 @@ defaults = {
     "sticky_amount": None,
     "sticky_amount_ts": 0.0,
     "auto_apply": True,
+    "overlay": {},      # konum -> kaydedilmemiş farklar (bkz. SharedState.commit)
+    "kpi_delta": {},    # overlay'in yönetici KPI toplamlarına etkisi
+    "conflicts": [],    # çakışan konumlar (Kaydet'te ya da değişiklik akışında tespit edilen)
+    "seen_version": 0,  # oturumun en son çektiği ortak durum sürümü
+    "scenarios": {},    # ad -> {"overlay": Branch, "ops": [...]} (bkz. SENARYOLAR)
+    "scenario": None,   # etkin senaryo (None = gerçek çalışma alanı)
+    "real_ws": None,    # senaryo etkinken gerçek (overlay, unsaved_ops)
+    "history": {},      # çalışma alanı (None = gerçek) -> {"undo": [...], "redo": [...]} (bkz. Geri al / Yinele)
+    "ov_gen": None,     # overlay konumlarının ait olduğu ortak yükleme (bkz. rebind_workspaces)
+    "sid": None,
 }
 for k,v in defaults.items():
     if k not in st.session_state: st.session_state[k]=v
+if st.session_state.sid is None: st.session_state.sid = uuid.uuid4().hex
+
+def ref_pos(person_ref):
+    return get_shared().ref_pos(person_ref)
+
+def ov_values(col: str, positions, overlay=None) -> np.ndarray:
+    # oturumun gördüğü değer (overlay verilmezse oturumun etkin çalışma alanı)
+    return ws_values(get_shared(), col, positions, st.session_state.overlay if overlay is None else overlay)
+
+
+def view_rows(positions=None, overlay=None) -> pd.DataFrame:
+    # oturum görünümü: kaydedilmiş satırların kopyası + bu oturumun kaydedilmemiş farkları
+    # (overlay verilirse oturum durumu yerine o kullanılır: betik dışında çalışan indirmeler için)
+    return ws_view(get_shared(), positions, st.session_state.overlay if overlay is None else overlay)
+
+def sort_values(col: str, positions) -> np.ndarray:
+    # sıralama anahtarı (oturum görünümüyle): temel kolonlarda overlay, türetilenlerde vektörel yeniden hesap
+    S = get_shared(); pos = np.asarray(positions, dtype=np.int64)
+    if col in ("NewSalary","BÜTÇE DIŞI TALEPLER İLE"): return ov_values(col, pos)
+    if col in DERIVED_COLS:
+        d = derive(num_at(S.df,"CurrentSalary",pos), ov_values("NewSalary",pos), ov_values("BÜTÇE DIŞI TALEPLER İLE",pos), rule_at(S.df,pos))
+        return d[:, DERIVED_COLS.index(col)]
+    if col == "CurrentSalary" or col == "PersonRef": return num_at(S.df, col, pos)
+    return S.df[col].fillna("").astype(str).to_numpy()[pos]
+
+@traced()
+def page_view(positions, query="", sort_col=None, desc=False, page=1, size=50):
+    # sunucu tarafı arama + sıralama + sayfalama: sadece görünen pencere view_rows'tan geçer (serileştirilir)
+    # dönüş: (sayfa DataFrame'i, eşleşen satır sayısı, sayfa sayısı)
+    pos = np.arange(len(get_shared().df)) if positions is None else np.asarray(positions, dtype=np.int64)
+    q = tr_lower(query).strip()
+    if q:
+        hay = get_shared().search_text[pos]
+        pos = pos[np.fromiter((q in h for h in hay), dtype=bool, count=len(pos))]
+    if sort_col and len(pos):
+        order = np.argsort(sort_values(sort_col, pos), kind="stable")
+        pos = pos[order[::-1] if desc else order]
+    total = len(pos); pages = max(1, -(-total // size))
+    page = min(max(1, int(page)), pages)
+    win = pos[(page-1)*size : page*size]
+    out = view_rows(win)  # view_rows konum sırasına dizer; sayfanın sırasına geri getir
+    return out.iloc[np.searchsorted(np.sort(win), win)], total, pages
+
+def overlay_kpi_delta(ov) -> dict:
+    return ws_kpi_delta(get_shared(), ov)
+
+def rebuild_kpi_delta():
+    # overlay değişince (kayıt/çakışma çözümü/senaryo değişimi) KPI farklarını baştan kur
+    st.session_state.kpi_delta = overlay_kpi_delta(st.session_state.overlay)
+
+def session_kpi(key) -> np.ndarray:
+    return get_shared().kpi[key] + st.session_state.kpi_delta.get(key, 0.0)
+
+# ==== Geri al / Yinele ====
+# Adım: tek apply_op (ya da aynı gruptaki birleşik/toplu işlemler) için satır farkları
+# (konum, kolon, önceden var mıydı, önceki, sonraki, base, ver, PersonRef) + eklenen kayıtlar. Kare kopyası yok; O(değişen satır).
+def _hist() -> dict:
+    return st.session_state.history.setdefault(st.session_state.scenario, {"undo": [], "redo": []})
+
+def clear_history(ws="__etkin__"):
+    st.session_state.history.pop(st.session_state.scenario if ws == "__etkin__" else ws, None)
+
+def push_step(label: str, group, cells: list, recs: list):
+    h = _hist(); h["redo"].clear()
+    top = h["undo"][-1] if h["undo"] else None
+    if group is not None and top is not None and top["group"] == group:
+        top["cells"].extend(cells); top["recs"].extend(recs); top["label"] = f"Birleşik işlem ({len(top['recs'])} kayıt)"
+        return
+    h["undo"].append({"label": label, "group": group, "cells": cells, "recs": recs})
+    del h["undo"][:-UNDO_MAX]
+
+def _replay_cells(cells, forward: bool):
+    # hücre farklarını ileri/geri uygula; KPI farkı sadece dokunulan satırlar için güncellenir
+    S = get_shared(); ov = st.session_state.overlay
+    pos = np.unique(np.fromiter((c[0] for c in cells), dtype=np.int64, count=len(cells)))
+    cur = num_at(S.df, "CurrentSalary", pos); rule = rule_at(S.df, pos)
+    pre = derive(cur, ov_values("NewSalary",pos), ov_values("BÜTÇE DIŞI TALEPLER İLE",pos), rule)
+    for p, col, had, before, after, base, ver, ref in (cells if forward else reversed(cells)):
+        e = ov_edit(ov, p, ver, ref)
+        if forward or had:
+            e["base"].setdefault(col, base); e["val"][col] = after if forward else before
+        else:
+            e["val"].pop(col, None); e["base"].pop(col, None)
+            if not e["val"]: del ov[p]
+    post = derive(cur, ov_values("NewSalary",pos), ov_values("BÜTÇE DIŞI TALEPLER İLE",pos), rule)
+    kpi_apply(st.session_state.kpi_delta, S.mgr_index, pos, post - pre)
+
+def undo_step() -> str | None:
+    h = _hist()
+    if not h["undo"]: return None
+    step = h["undo"].pop()
+    _replay_cells(step["cells"], forward=False)
+    ids = {id(r) for r in step["recs"]}
+    st.session_state.unsaved_ops[:] = [r for r in st.session_state.unsaved_ops if id(r) not in ids]  # liste yerinde (senaryo da tutar)
+    h["redo"].append(step)
+    return step["label"]
+
+def redo_step() -> str | None:
+    h = _hist()
+    if not h["redo"]: return None
+    step = h["redo"].pop()
+    _replay_cells(step["cells"], forward=True)
+    st.session_state.unsaved_ops.extend(step["recs"])
+    h["undo"].append(step)
+    return step["label"]
+
+def _op_pos(rec):
+    return get_shared().ref_index.get(int(rec["PersonRef"]))
+
+def rebind_workspaces():
+    # ortak veri tam yeniden yüklendiyse (kurallar / kaynak dosya değişimi) satırlar yer değiştirmiş olabilir:
+    # gerçek ve senaryo farkları PersonRef ile yeni konumlara taşınır; eski konumlu geri al adımları silinir
+    ss = st.session_state; S = get_shared()
+    if ss.ov_gen == S.generation: return
+    real_ov, real_ops = real_workspace()
+    moved = ws_rebind(S, real_ov, real_ops)
+    for sc in ss.scenarios.values(): ws_rebind(S, sc["overlay"], sc["ops"])
+    ss.conflicts = sorted(moved[p] for p in ss.conflicts if p in moved)
+    ss.history = {}
+    ss.ov_gen = S.generation
+    rebuild_kpi_delta()
+
+@traced()
+def pull_changes():
+    # başkalarının son çekimden beri kaydettiği satırlar: bildirim + overlay'deki satırlar için erken çakışma
+    S = get_shared(); seen = st.session_state.seen_version
+    if seen == S.version: return []
+    entries, complete = S.changes_since(seen)
+    ov = st.session_state.overlay
+    others = sorted({p for _,origin,ps in entries if origin != st.session_state.sid for p in ps})
+    cand = others if complete else list(ov)
+    stale = [p for p in cand if p in ov and S.row_ver[p] != ov[p]["ver"]]
+    if stale: st.session_state.conflicts = sorted(set(st.session_state.conflicts) | set(stale))
+    if seen and others: st.toast(f"🔄 {len(others)} kişi başka bir kullanıcı tarafından güncellendi.")
+    st.session_state.seen_version = S.version
+    return others
+
+@traced()
+def kaydet():
+    # çakışmayan farkları ortak duruma + günlüğe işle; çakışanlar overlay'de kalır
+    S = get_shared(); ov = st.session_state.overlay
+    ok, bad = S.commit(ov, st.session_state.unsaved_ops, origin=st.session_state.sid)
+    okset = set(ok)
+    st.session_state.unsaved_ops = [r for r in st.session_state.unsaved_ops if _op_pos(r) not in okset]
+    for p in ok: ov.pop(p, None)
+    st.session_state.conflicts = bad
+    clear_history()  # kaydedilen işlemler geri alınmaz
+    rebuild_kpi_delta()
+    return ok, bad
+
+def resolve_conflicts(rebase: bool):
+    # rebase: farkımı güncel (başkasının kaydettiği) değerin üzerine uygula; değilse değişikliklerimi bırak
+    S = get_shared(); ov = st.session_state.overlay; bad = set(st.session_state.conflicts)
+    if rebase:
+        with S.lock:
+            for p in bad:
+                e = ov[p]
+                for col in list(e["val"]):
+                    now = float(num_at(S.df, col, [p])[0]); shift = now - e["base"][col]
+                    e["base"][col] = now; e["val"][col] += shift
+                    kalan = "Önce_SistemKalan" if col=="NewSalary" else "Önce_BütçeDışıKalan"
+                    for r in st.session_state.unsaved_ops:
+                        if r["_kolon"]==col and _op_pos(r)==p:
+                            r["_deger"] += shift; r[kalan] -= shift; r[kalan.replace("Önce","Sonra")] -= shift
+                e["ver"] = int(S.row_ver[p])
+    else:
+        for p in bad: ov.pop(p, None)
+        st.session_state.unsaved_ops = [r for r in st.session_state.unsaved_ops if _op_pos(r) not in bad]
+    st.session_state.conflicts = []
+    clear_history()  # adımların önceki değerleri artık geçerli değil
+    rebuild_kpi_delta()
+
+# ==== Senaryolar (ne olur? dalları) ====
+# Senaryo, gerçek çalışma alanının (kaydedilmiş veri + kaydedilmemiş farklar) üzerine açılan bir Branch'tir.
+# Etkin senaryo oturumun overlay/unsaved_ops'unun yerine geçer: işlem fonksiyonları değişmeden dal üzerinde çalışır.
+def real_workspace():
+    ss = st.session_state
+    return ss.real_ws if ss.scenario is not None else (ss.overlay, ss.unsaved_ops)
+
+def activate_scenario(name):
+    ss = st.session_state
+    if name == ss.scenario: return
+    real_ov, real_ops = real_workspace()
+    if name is None:
+        ss.overlay, ss.unsaved_ops, ss.real_ws = real_ov, real_ops, None
+    else:
+        sc = ss.scenarios[name]; sc["overlay"].parent = real_ov
+        ss.real_ws = (real_ov, real_ops)
+        ss.overlay, ss.unsaved_ops = sc["overlay"], sc["ops"]
+    ss.scenario = name
+    rebuild_kpi_delta()
+
+def new_scenario(name: str):
+    st.session_state.scenarios[name] = {"overlay": Branch(real_workspace()[0]), "ops": []}
+    activate_scenario(name)
+
+def drop_scenario(name: str):
+    if st.session_state.scenario == name: activate_scenario(None)
+    st.session_state.scenarios.pop(name, None); clear_history(name)
+
+def promote_scenario(name: str):
+    # dalın farklarını gerçek çalışma alanına aktar; dal açıldıktan sonra gerçekte değişen satırlarda
+    # senaryonun farkı güncel değerin üzerine uygulanır (çakışma çözümündeki kaydırmayla aynı)
+    activate_scenario(None)
+    sc = st.session_state.scenarios.pop(name); br = sc["overlay"]; real = st.session_state.overlay
+    clear_history(name); clear_history(None)
+    for p, e in br.own.items():
+        now = real.get(p)
+        for col in list(e["val"]):
+            start = br.src.get(p, {}).get(col, e["base"][col])
+            cur = now["val"].get(col, start) if now is not None else start
+            shift = cur - start
+            if not shift: continue
+            e["val"][col] += shift
+            kalan = "Önce_SistemKalan" if col=="NewSalary" else "Önce_BütçeDışıKalan"
+            for r in sc["ops"]:
+                if r["_kolon"]==col and _op_pos(r)==p:
+                    r["_deger"] += shift; r[kalan] -= shift; r[kalan.replace("Önce","Sonra")] -= shift
+        if now is not None: e["ver"], e["base"] = now["ver"], {**e["base"], **now["base"]}
+        real[p] = e
+    st.session_state.unsaved_ops.extend(sc["ops"])
+    rebuild_kpi_delta()
+
+def scenario_compare(key) -> pd.DataFrame:
+    # gerçek + her senaryo için seçili kapsamın KPI'ları (O(toplam fark))
+    S = get_shared(); real_ov, real_ops = real_workspace()
+    items = [("(gerçek)", real_ov, real_ops)] + [(n, sc["overlay"], sc["ops"]) for n, sc in st.session_state.scenarios.items()]
+    rows = []
+    for n, ov, ops in items:
+        v = S.kpi[key] + overlay_kpi_delta(ov).get(key, 0.0)
+        rows.append({"Senaryo": n, "İşlem": len(ops), "Değişen kişi": len(ov.own) if hasattr(ov, "own") else len(ov),
+                     DERIVED_COLS[0]: v[0], DERIVED_COLS[1]: v[1], DERIVED_COLS[2]: v[2]})
+    out = pd.DataFrame(rows)
+    out["Fark (Sistem Kalan)"] = out[DERIVED_COLS[1]] - out[DERIVED_COLS[1]].iloc[0]
+    return out
+
+# ================== DIŞA AKTARIM ==================
+# İndirme dosyaları her çalıştırmada değil, tıklanınca üretilir; (biçim, veri sürümü, filtre, fark imzası)
+# anahtarıyla önbelleğe alınır. Aynı veri tekrar istenirse yeniden yazılmaz.
+try:
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    LAZY_DOWNLOAD = hasattr(MediaFileManager, "add_deferred")  # download_button(data=callable) desteği
+except Exception:
+    LAZY_DOWNLOAD = False
+
+EXPORT_FORMATS = {"Excel (.xlsx)": "xlsx", "CSV (.csv)": "csv"}
+if importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet"):
+    EXPORT_FORMATS["Parquet (.parquet)"] = "parquet"
+EXPORT_MIME = {"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+               "csv": "text/csv", "parquet": "application/octet-stream"}
+
+def overlay_signature(ov: dict) -> str:
+    if not ov: return ""
+    return hashlib.md5(json.dumps(sorted((p, sorted(e["val"].items())) for p, e in list(ov.items()))).encode()).hexdigest()
+
+@cache_probe("data_export")
+@st.cache_data(max_entries=EXPORT_CACHE_MAX, show_spinner=False)
+def data_export(fmt: str, version: int, manager, ov_sig: str, _ov: dict) -> bytes:
+    trace_count("önbellek:data_export:ıska")
+    S = get_shared()
+    pos = None if manager is None else S.mgr_index.rows[manager]
+    return to_bytes(with_extras(view_rows(pos, overlay=_ov), pos), fmt, "Veri")
+
+@cache_probe("store_extras")
+@st.cache_data(max_entries=1, show_spinner=False)
+def store_extras(version) -> pd.DataFrame:
+    trace_count("önbellek:store_extras:ıska")
+    # yüklemede atlanan kaynak kolonlar: sadece indirme istendiğinde okunur
+    store = get_store(); hdr = store.header(); need = set(needed_columns(hdr))
+    return store.load([c for c in hdr if c not in need])
+
+@traced()
+def with_extras(view: pd.DataFrame, positions=None) -> pd.DataFrame:
+    store = get_store(); ex = store_extras(store.version()); hdr = store.header()
+    if positions is not None: ex = ex.iloc[np.sort(np.asarray(positions, dtype=np.int64))]
+    out = merge_columns(ex.reset_index(drop=True), view, hdr)
+    # kaynağın kolon sırası ve adları korunur, uygulamanın eklediği kolonlar sona
+    hdr = [c for c in hdr if c in out.columns]
+    return out[hdr + [c for c in out.columns if c not in set(hdr)]]
+
+@cache_probe("history_frame")
+@st.cache_data(max_entries=2, show_spinner=False)
+def history_frame(version) -> pd.DataFrame:
+    trace_count("önbellek:history_frame:ıska")
+    hd = pd.DataFrame(load_history(version))
+    if hd.empty: return hd
+    hd = hd.drop(columns=[c for c in hd.columns if c=="seq" or c.startswith("_")])
+    try:
+        hd["Zaman_dt"]=pd.to_datetime(hd["Zaman"]); hd=hd.sort_values("Zaman_dt",ascending=False).drop(columns=["Zaman_dt"])
+    except Exception: pass
+    return hd
+
+@cache_probe("history_export")
+@st.cache_data(max_entries=EXPORT_CACHE_MAX, show_spinner=False)
+def history_export(fmt: str, version) -> bytes:
+    trace_count("önbellek:history_export:ıska")
+    return to_bytes(history_frame(version), fmt, "Islem_Gecmisi")
+
+def lazy_download(label: str, make, file_name: str, fmt: str, key: str):
+    # make() sadece indirme istendiğinde çağrılır
+    if LAZY_DOWNLOAD:
+        st.download_button(label, data=make, file_name=file_name, mime=EXPORT_MIME[fmt], use_container_width=True, key=key)
+        return
+    # eski Streamlit: önce "Hazırla", sonra indir
+    if st.button(f"{label} — hazırla", use_container_width=True, key=key+"_hz"):
+        st.session_state[key+"_veri"] = make()
+    data = st.session_state.get(key+"_veri")
+    if data is not None:
+        st.download_button(label, data=data, file_name=file_name, mime=EXPORT_MIME[fmt], use_container_width=True, key=key)
 
 def set_sticky_amount(val: float):
     st.session_state.sticky_amount = float(val)
@@ -226,151 +428,75 @@ def get_sticky_amount():
 
 st.session_state.listening = bool(st.session_state.get("force_listen", True))
 
-# ================== SİDEBAR - AYARLAR ==================
-with st.sidebar:
-    st.header("⚙️ Ayarlar")
-    st.session_state.auto_apply = st.toggle("🎤 Sesle otomatik uygula", value=st.session_state.get("auto_apply", True))
-
-# ================== VERİ YÜKLEME ==================
-with st.sidebar:
-    st.header("📄 Veri Kaynağı")
-    use_default = st.toggle("Varsayılan dosya (BÜTÇE ÇALIŞMAA.xlsx)", value=True)
-
-try:
-    file_mtime = os.path.getmtime(DEFAULT_EXCEL_PATH) if use_default and os.path.exists(DEFAULT_EXCEL_PATH) else 0.0
-    base_df = read_excel_path(DEFAULT_EXCEL_PATH, file_mtime) if use_default else st.stop()
-except FileNotFoundError:
-    st.error(f"'{DEFAULT_EXCEL_PATH}' bulunamadı."); st.stop()
-except Exception as e:
-    st.error(f"Excel okunamadı: {e}"); st.stop()
-
-# --- ÖNEMLİ: Excel'i HER SEFERİNDE ezme! ---
-# İlk çalıştırmada Excel'den yükle; sonrasında hep session_state.df'yi koru.
-if "df" not in st.session_state or st.session_state.df is None:
-    st.session_state.df = normalize_all(base_df)
-else:
-    # sadece türetilen kolonları tazele
-    st.session_state.df = normalize_all(st.session_state.df)
-
-df = st.session_state.df  # bundan sonra hep bunu kullan
-
-# ================== FİLTRE ==================
-with st.sidebar:
-    st.header("🎛️ Filtreler & İşlemler")
-    managers = pd.concat([df["1.YÖNETİCİSİ"],df["2.YÖNETİCİSİ"],df["3.YÖNETİCİSİ"],df["4.YÖNETİCİSİ"]], ignore_index=True)
-    opts = sorted([m for m in managers.dropna().unique() if str(m).strip()!=""])
-    selected_manager = st.selectbox("Bütçe işlemi yapılacak yönetici", opts if opts else ["(yok)"])
-
-if opts and selected_manager!="(yok)":
-    msk = (df["1.YÖNETİCİSİ"]==selected_manager)|(df["2.YÖNETİCİSİ"]==selected_manager)|(df["3.YÖNETİCİSİ"]==selected_manager)|(df["4.YÖNETİCİSİ"]==selected_manager)
-    df_filtered = df[msk].copy()
-else:
-    df_filtered = df.copy()
-
-# ================== KPI ==================
-kullanilan=(df_filtered["CurrentSalary"].fillna(0).sum())*1.4
-sistem_kalan=(df_filtered["SİSTEM KALAN"].fillna(0).sum())
-butce_disi_kalan=(df_filtered["BÜTÇE DIŞI KALAN"].fillna(0).sum())
-c1,c2,c3=st.columns(3)
-c1.metric("KULLANILAN BÜTÇE DIŞI DAHİL", tl(kullanilan))
-c2.metric("SİSTEM KALAN", tl(sistem_kalan))
-c3.metric("BÜTÇE DIŞI KALAN", tl(butce_disi_kalan))
-
-# ================== TABLO ==================
-cols = ["PersonRef","FULLNAME","DEPARTMAN","1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ",
-        "CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE","KULLANILAN BÜTÇE DIŞI DAHİL","SİSTEM KALAN","BÜTÇE DIŞI KALAN"]
-for c in cols:
-    if c not in df_filtered.columns: df_filtered[c]=np.nan
-df_show=df_filtered[cols].copy(); df_show.insert(0,"Seç",False)
-st.write("**Bağlı kişiler (satır seç → PersonRef atanır)**")
-edited = st.data_editor(df_show, use_container_width=True, hide_index=True, height=420,
-                        disabled=[c for c in df_show.columns if c!="Seç"])
-sel=None
-chosen=edited.index[edited.get("Seç",False)==True].tolist() if "Seç" in edited.columns else []
-if chosen:
-    try:
-        v=edited.loc[chosen[0],"PersonRef"]
-        if pd.notna(v): sel=int(float(v))
-    except: sel=None
-if sel is not None: st.session_state.selected_ref=sel
-selected_ref = st.session_state.selected_ref
-
-# ================== SİDEBAR İŞLEM ALANLARI ==================
-with st.sidebar:
-    st.markdown("---"); st.subheader("🛠️ İşlem")
-    if selected_ref is not None: st.success(f"Seçili PersonRef: {selected_ref}")
-    manuel_ref = st.text_input("Veya Manuel PersonRef", value="" if selected_ref is None else str(selected_ref))
-    tutar = st.number_input("Tutar (TL) — (istersen boş bırak)", step=100.0, min_value=0.0, value=0.0)
-    islem = st.radio("İşlem Türü",
-        ["Bütçeden Düş (Sistem Kalan)","Bütçeye Ekle (Sistem Kalan)","Bütçeden Düş (Bütçe Dışı Kalan)","Bütçeye Ekle (Bütçe Dışı Kalan)"], index=0)
-
 # ================== İŞLEM FONKSİYONU ==================
+@traced()
+def apply_op(refs, tutar:float, islem_tipi:str, group:str|None=None):
+    # ws_apply'ı oturumun etkin çalışma alanına uygular ve geri alma adımı olarak kaydeder
+    ss = st.session_state
+    applied, fails, cells, recs = ws_apply(get_shared(), ss.overlay, ss.unsaved_ops, ss.kpi_delta, refs, tutar, islem_tipi, group)
+    if recs: push_step(f"{islem_tipi}: {float(tutar):,.2f} TL × {len(recs)} kişi", group, cells, recs)
+    return applied, fails
+
+@traced()
 def islem_yap(person_ref:int, tutar:float, islem_tipi:str, announce=True, do_rerun=True):
-    dff=st.session_state.df.copy()
-    ser=pd.to_numeric(dff["PersonRef"], errors="coerce")
-    idxs=dff.index[ser==float(person_ref)]
-    if len(idxs)==0:
+    if islem_tipi not in OPS:
+        st.warning("Bilinmeyen işlem tipi."); return
+    applied, _fails = apply_op([person_ref], tutar, islem_tipi)
+    if not applied:
         st.warning("Girilen PersonRef ile eşleşen kişi bulunamadı.")
         if announce: speak("Girilen kişi bulunamadı.")
         return
-    i=idxs[0]
-
-    # ---- Önceki değerler ----
-    cur_sal = get_numeric(dff.at[i,"CurrentSalary"],0.0)
-    new     = get_numeric(dff.at[i,"NewSalary"],0.0)
-    bd      = get_numeric(dff.at[i,"BÜTÇE DIŞI TALEPLER İLE"],0.0)
-    used    = cur_sal*1.4
-    pre_sys = used - new
-    pre_dis = used - bd
-
-    # ---- Güncelle ----
-    if islem_tipi=="Bütçeden Düş (Sistem Kalan)":
-        dff.at[i,"NewSalary"]=new+float(tutar); verb="sistem kalandan düşüldü"; pool="Sistem"
-    elif islem_tipi=="Bütçeye Ekle (Sistem Kalan)":
-        dff.at[i,"NewSalary"]=new-float(tutar); verb="sistem kalana eklendi"; pool="Sistem"
-    elif islem_tipi=="Bütçeden Düş (Bütçe Dışı Kalan)":
-        dff.at[i,"BÜTÇE DIŞI TALEPLER İLE"]=bd+float(tutar); verb="bütçe dışı kalandan düşüldü"; pool="Bütçe Dışı"
-    elif islem_tipi=="Bütçeye Ekle (Bütçe Dışı Kalan)":
-        dff.at[i,"BÜTÇE DIŞI TALEPLER İLE"]=bd-float(tutar); verb="bütçe dışı kalana eklendi"; pool="Bütçe Dışı"
-    else:
-        st.warning("Bilinmeyen işlem tipi."); return
-
-    # ---- Sonraki (normalize) ----
-    dff = normalize_all(dff)
-    st.session_state.df = dff
-
-    # Satır tekrar bulunup sonrası metrikleri okunur
-    ser2=pd.to_numeric(dff["PersonRef"], errors="coerce")
-    j = dff.index[ser2==float(person_ref)][0]
-    post_sys = get_numeric(dff.at[j,"SİSTEM KALAN"],0.0)
-    post_dis = get_numeric(dff.at[j,"BÜTÇE DIŞI KALAN"],0.0)
-
-    # Kim bilgileri
-    row = dff.loc[j]
-    fullname = str(row.get("FULLNAME","") or "")
-    dep = str(row.get("DEPARTMAN","") or "")
-    mans = manager_chain(row)
-
-    # Kaydedilmemiş işlem kaydı (Kaydet'te geçmişe yazılır)
-    st.session_state.unsaved_ops.append({
-        "Zaman": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "PersonRef": int(person_ref),
-        "AdSoyad": fullname,
-        "Departman": dep,
-        "Yöneticiler": mans,
-        "Tür": islem_tipi,
-        "Havuz": pool,
-        "Tutar": float(tutar),
-        "Önce_SistemKalan": float(pre_sys),
-        "Sonra_SistemKalan": float(post_sys),
-        "Önce_BütçeDışıKalan": float(pre_dis),
-        "Sonra_BütçeDışıKalan": float(post_dis),
-    })
-
+    verb = OPS[islem_tipi][2]
     st.success(f"İşlem uygulandı: {tutar:.2f} TL {verb}. (Geçmiş: Kaydet ile)")
     if announce: speak(f"{int(round(float(tutar)))} lira {verb}. Kaydet tuşuyla geçmişe eklenecek.")
     if do_rerun: st.rerun()
 
+@traced()
+def toplu_uygula(b):
+    # pending_batch'i tek vektörel güncellemeyle uygula; sonucu bir sonraki çalıştırmada göster
+    if "items" in b: bilesik_isle(b["items"]); return  # onay bekleyen birleşik komut
+    applied, fails = apply_op(b["refs"], float(b["amount"]), b["op"], group=uuid.uuid4().hex[:8])
+    st.session_state.pending_batch=None
+    st.session_state.batch_report={"manager":b["manager"],"op":b["op"],"applied":len(applied),"fails":fails}
+    if fails: speak(f"Toplu işlem {len(applied)} kişiye uygulandı, {len(fails)} kişiye uygulanamadı. Kaydet’e basarak geçmişe işleyin.")
+    else: speak("Toplu işlem uygulandı. Kaydet’e basarak geçmişe işleyin.")
+    st.rerun()
+
+@traced()
+def bilesik_uygula(cmds, df, auto_apply: bool = True, trigger: bool = False):
+    # Birleşik komut: önce tüm cümleler çözülür; biri bile eksikse hiçbiri uygulanmaz (hepsi ya da hiçbiri).
+    # Tek komuttaki gibi: otomatik uygulama kapalıysa ya da bir cümle belirsizse plan onaya bekletilir.
+    plan=[]; errs=[]
+    for c in cmds:
+        pref=c.personref; who=None
+        if pref is None: pref, who = find_personref_by_name(df, c.text)
+        missing=[]
+        if pref is None: missing.append("kişi")
+        elif ref_pos(pref) is None: missing.append(f"PersonRef {pref} bulunamadı")
+        if c.amount is None: missing.append("tutar")
+        if c.op is None: missing.append("işlem türü")
+        if missing: errs.append(f"“{c.text}”: " + ", ".join(missing))
+        else: plan.append((int(pref), float(c.amount), c.op))
+    if errs:
+        st.warning("Birleşik komut uygulanmadı (hiçbir işlem yapılmadı):\n\n" + "\n\n".join(errs))
+        speak(f"{len(errs)} komut anlaşılamadı, hiçbir işlem yapılmadı.")
+        return
+    if not (trigger or (auto_apply and min(c.confidence for c in cmds) >= CMD_MIN_CONFIDENCE)):
+        st.session_state.pending_batch={"items":plan,"refs":[r for r,_,_ in plan]}
+        speak(f"{len(plan)} işlemlik birleşik komut için onay gerekiyor. 'Onayla' ya da 'İptal' diyebilirsiniz.")
+        st.rerun(); return
+    bilesik_isle(plan)
+
+def bilesik_isle(plan):
+    # çözülmüş birleşik planı tek işlem grubu olarak uygula (geri al tek adımda geri alır)
+    group=uuid.uuid4().hex[:8]
+    for pref, amt, op in plan:
+        apply_op([pref], amt, op, group=group)
+    st.session_state.pending_batch=None
+    st.session_state.batch_report={"group":group,"items":plan}
+    speak(f"{len(plan)} işlem uygulandı. Kaydet’e basarak geçmişe işleyin.")
+    st.rerun()
+
 # ================== CLICK İÇİN GİRDİ ÇÖZÜMLE ==================
 def resolve_click_inputs(manuel_ref, selected_ref, ui_amount, ui_islem, last_text):
     pref = None; pref_digits = None
@@ -388,7 +514,7 @@ def resolve_click_inputs(manuel_ref, selected_ref, ui_amount, ui_islem, last_tex
         if pnum is not None:
             pref = int(pnum); pref_digits = pdig
     if pref is None and last_text:
-        pbyname, _nm = find_personref_by_name(st.session_state.df, last_text)
+        pbyname, _nm = find_personref_by_name(get_shared().df, last_text)
         if pbyname is not None: pref = int(pbyname)
 
     # Tutar: UI > sticky > Son
@@ -407,191 +533,19 @@ def resolve_click_inputs(manuel_ref, selected_ref, ui_amount, ui_islem, last_tex
     op = parse_op_from_text(last_text, fallback_ui_op=ui_islem)
     return pref, amt, op
 
-# ================== BUTONLAR ==================
-cA,cB,cC=st.columns([1,1,1])
-with cA:
-    if st.button("İşlem Yap", use_container_width=True):
-        last_text = st.session_state.get("last_final_text", "")
-        pref, chosen_amt, op = resolve_click_inputs(manuel_ref, selected_ref, tutar, islem, last_text)
-        if pref is None:
-            st.warning("Kişi bulunamadı. Tabloda seçin, PersonRef girin veya 'Son' komutta isim/PersonRef geçsin.")
-            speak("Kişi bulunamadı. Lütfen kişi seçin ya da PersonRef söyleyin.")
-        elif not chosen_amt or float(chosen_amt) <= 0:
-            st.warning("Tutar yok. Soldan girin ya da 'Son' cümlede tutarı söyleyin (örn. 80 TL).")
-            speak("Tutar algılanmadı. Lütfen tutarı söyleyin veya girin.")
-        elif not op:
-            st.warning("İşlem türü anlaşılmadı. 'düş' veya 'ekle' deyin; 'bütçe dışı' derseniz oraya uygulanır.")
-            speak("İşlem türü anlaşılmadı. Lütfen düş mü ekle mi olduğunu söyleyin.")
-        else:
-            try:
-                islem_yap(int(pref), float(chosen_amt), op, do_rerun=True)
-            except:
-                st.warning("İşlem uygulanamadı. Girdileri kontrol edin.")
-
-with cB:
-    if st.session_state.unsaved_ops: st.info(f"Kaydedilmemiş işlem: {len(st.session_state.unsaved_ops)}")
-    if st.button("Kaydet", type="primary", use_container_width=True):
-        out=DEFAULT_EXCEL_PATH
-        st.session_state.df.to_excel(out, index=False)
-        st.cache_data.clear()  # Excel'i güncel oku
-        # Geçmişe yaz:
-        st.session_state.history.extend(st.session_state.unsaved_ops)
-        st.session_state.unsaved_ops=[]
-        st.success("Veriler kaydedildi — diğer kullanıcılar da aynı şekilde görecek.")
-        speak("Veriler kaydedildi ve geçmişe işlendi.")
-        st.rerun()
-
-with cC:
-    if st.button("Komut Örnekleri", use_container_width=True):
-        st.info("Örnek: 'Bu kişinin sistemden seksen beş düş' | 'Ayşegül Ünal’ın bütçesine 5 TL ekle' | '… işlem yap'")
-        speak("Örnek komutlar ekranınızda.")
-
-# ================== CANLI YAZIM (Başlat/Durdur kontrollü) ==================
-st.markdown("### 🎧 Canlı Yazım")
-st.components.v1.html(f"""
-<div style="border:1px dashed #bbb;padding:8px;border-radius:8px;background:#fbfbfb">
-  <div><b>Canlı:</b> <span id="stt_live">{'Dinleniyor…' if st.session_state.listening else 'Kapalı'}</span></div>
-  <div style="margin-top:6px"><b>Son:</b> <span id="stt_final">{st.session_state.get('last_final_text') or ''}</span></div>
-  <div id="stt_dbg" style="margin-top:6px;font-size:12px;color:#888;"></div>
-</div>
-<script>
-(function(){{
-  const PY_SHOULD = {str(st.session_state.listening).lower()};
-  const SR   = window.SpeechRecognition || window.webkitSpeechRecognition;
-  const live = document.getElementById('stt_live');
-  const fin  = document.getElementById('stt_final');
-  const dbg  = document.getElementById('stt_dbg');
-  const setLive = (t)=>{{ if(live) live.textContent = t; localStorage.setItem('stt_live_last', t||''); }};
-  const setFinal= (t)=>{{ if(fin)  fin.textContent  = t; localStorage.setItem('stt_final_last', t||''); }};
-  const log     = (x)=>{{ if(dbg)  dbg.textContent  = x; }};
-
-  try {{
-    const lastL = localStorage.getItem('stt_live_last'); if(lastL && live) live.textContent=lastL;
-    const lastF = localStorage.getItem('stt_final_last'); if(lastF && fin) fin.textContent=lastF;
-  }} catch(_ ){{}}
-
-  if (!SR) {{ setLive('Tarayıcıda Ses Tanıma yok'); return; }}
-
-  function ensureHandlers(rec){{
-    if (rec.__handlersAttached) return;
-    rec.__handlersAttached = true;
-    rec.onresult = (e) => {{
-      let interim = '', finalTxt = '';
-      for (let i=e.resultIndex; i<e.results.length; i++) {{
-        const t = e.results[i][0].transcript;
-        if (e.results[i].isFinal) finalTxt += t; else interim += t;
-      }}
-      if (interim && interim.trim()) {{
-        setLive(interim.trim());
-        const it = interim.toLowerCase();
-        if (/(i\\s*ş\\s*lem\\s*yap|islem\\s*yap|hemen\\s*uygula|uygula|tamam|onayla)/.test(it)) {{
-          finalizeNow((localStorage.getItem('stt_live_last')||'').trim());
-          return;
-        }}
-      }}
-      if (finalTxt && finalTxt.trim()) {{
-        setFinal(finalTxt.trim());
-        finalizeNow(finalTxt.trim());
-      }}
-    }};
-    rec.onerror = (ev) => {{
-      if (!window.__stt_should_listen) return;
-      const err = (ev && ev.error) || '';
-      if (['aborted','no-speech','network','audio-capture'].includes(err)) {{
-        setTimeout(()=>{{ try{{ rec.start(); }}catch(_ ){{}} }}, 150);
-        return;
-      }}
-      log('Hata: ' + err);
-      setTimeout(()=>{{ try{{ rec.start(); }}catch(_ ){{}} }}, 350);
-    }};
-    rec.onstart = ()=>{{ window.__stt_running=true; setLive('Dinleniyor…'); }};
-    rec.onend   = ()=>{{ window.__stt_running=false; if (window.__stt_should_listen) setTimeout(()=>{{ try{{ rec.start(); }}catch(_ ){{}} }}, 200); else setLive('Kapalı'); }};
-  }}
-
-  function finalizeNow(text){{
-    const finTxt = (text||'').trim();
-    if (!finTxt) return;
-    try {{
-      if (window.__stt_rec) window.__stt_rec.stop();
-    }} catch(_ ){{}}
-    const u = new URL(location.href);
-    u.searchParams.set('voice', finTxt);
-    setTimeout(()=>{{ location.assign(u.toString()); }}, 20);
-  }}
-
-  async function askMic(){{
-    if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) return true;
-    try {{
-      const s = await navigator.mediaDevices.getUserMedia({{audio:true}});
-      try{{ s.getTracks().forEach(t=>t.stop()); }}catch(_ ){{}}
-      return true;
-    }} catch(e) {{
-      setLive('Mikrofon engellendi — tarayıcı izinlerini kontrol edin');
-      log('getUserMedia error: '+e);
-      return false;
-    }}
-  }}
-
-  window.sttStart = async function(){{
-    window.__stt_should_listen = true;
-    if (!window.__stt_rec) {{
-      window.__stt_rec = new SR();
-      window.__stt_rec.lang='tr-TR';
-      window.__stt_rec.continuous=true;
-      window.__stt_rec.interimResults=true;
-      window.__stt_rec.maxAlternatives=1;
-      ensureHandlers(window.__stt_rec);
-    }} else {{
-      ensureHandlers(window.__stt_rec);
-    }}
-    const ok = await askMic();
-    if (!ok) return;
-    try {{ window.__stt_rec.start(); setLive('Dinleniyor…'); }} catch(_ ){{}}
-  }}
-
-  window.sttStop = function(){{
-    window.__stt_should_listen = false;
-    try {{ window.__stt_rec && window.__stt_rec.stop(); }} catch(_ ){{}}
-    setLive('Kapalı');
-  }}
-
-  if (PY_SHOULD) window.sttStart(); else window.sttStop();
-}})();
-</script>
-""", height=170)
-
-# ================== BAŞLAT / DURDUR (BUTONLAR JS TETİKLER) ==================
-with st.sidebar:
-    st.markdown("---"); st.subheader("🎧 Dinleme")
-    colS, colT = st.columns(2)
-    with colS:
-        if st.button("🎤 Başlat", use_container_width=True, disabled=st.session_state.listening):
-            st.session_state.force_listen = True
-            st.session_state.listening = True
-            st.components.v1.html("<script>try{window.sttStart && window.sttStart();}catch(e){}</script>", height=0)
-            st.rerun()
-    with colT:
-        if st.button("⏹️ Durdur", use_container_width=True, disabled=not st.session_state.listening):
-            st.session_state.force_listen = False
-            st.session_state.listening = False
-            st.components.v1.html("<script>try{window.sttStop && window.sttStop();}catch(e){}</script>", height=0)
-            st.rerun()
-
 # ================== SES KOMUTU -> PARSE/UYGULA ==================
-def handle_command(text: str, ui_amount: float, ui_islem: str, ui_selected_ref: int|None, auto_apply: bool = True):
-    df = st.session_state.df
-    t = text.lower()
-
-    trigger = any(k in t for k in ["işlem yap","islem yap","hemen uygula","uygula","onayla","tamam"])
-    act=None
-    if any(k in t for k in ["düş","dus","düşür","çıkar","cikar","eksilt","azalt"]): act="düş"
-    elif any(k in t for k in ["ekle","arttır","artır","yükselt","yukselt"]): act="ekle"
-    pool = "sistem"
-    if any(k in t for k in ["bütçe dış","butce dis","dış","dis"]): pool="dis"
-    op = ("Bütçeden Düş (Sistem Kalan)" if act=="düş" else "Bütçeye Ekle (Sistem Kalan)") if act and pool=="sistem" else \
-         ("Bütçeden Düş (Bütçe Dışı Kalan)" if act=="düş" else "Bütçeye Ekle (Bütçe Dışı Kalan)") if act and pool=="dis" else None
-
-    pref, pref_digits = extract_personref(t)
+@traced()
+def handle_command(text: str, ui_amount: float, ui_islem: str, ui_selected_ref: int|None, auto_apply: bool = True, do_rerun: bool = True):
+    S = get_shared(); df = S.df; mi = S.mgr_index
+    cmds = parse_commands(text, mi)
+    if len(cmds) > 1:
+        bilesik_uygula(cmds, df, auto_apply, any(c.trigger for c in cmds)); return
+    cmd = cmds[0]
+    t = cmd.text
+    trigger = cmd.trigger
+    op = cmd.op
+
+    pref = cmd.personref
     if pref is None and ui_selected_ref is not None:
         pref = ui_selected_ref
     if pref is None:
@@ -600,22 +554,17 @@ def handle_command(text: str, ui_amount: float, ui_islem: str, ui_selected_ref:
             pref = pref_by_name
             speak(f"{name_found} bulundu.")
 
-    amt_voice = extract_amount(t, pref_digits)
+    amt_voice = cmd.amount
     if amt_voice: set_sticky_amount(amt_voice)
     amt = float(amt_voice) if (amt_voice and amt_voice>0) else (float(ui_amount) if ui_amount and float(ui_amount)>0 else (get_sticky_amount() or None))
 
     # Toplu (tüm bağlılar) için kısayol
-    managers = pd.concat([df["1.YÖNETİCİSİ"],df["2.YÖNETİCİSİ"],df["3.YÖNETİCİSİ"],df["4.YÖNETİCİSİ"]], ignore_index=True)
-    opts = sorted([m for m in managers.dropna().unique() if str(m).strip()!=""])
-    lowmap={m.lower():m for m in opts}
-    hit=None
-    for low,orig in lowmap.items():
-        if low and low in t: hit=low; break
+    lowmap = mi.lower
+    hit = cmd.manager
     scope=df
     if hit:
-        msk=(df["1.YÖNETİCİSİ"].str.lower()==hit)|(df["2.YÖNETİCİSİ"].str.lower()==hit)|(df["3.YÖNETİCİSİ"].str.lower()==hit)|(df["4.YÖNETİCİSİ"].str.lower()==hit)
-        scope=df[msk]
-    allreq = any(kw in t for kw in ["tüm bağlı","tum bagli","hepsi","tamamı","tüm çalışan","tum calisan"])
+        scope=df.iloc[mi.rows_lower[hit]]
+    allreq = cmd.batch
     if not allreq and hit and pref is None: allreq=True
 
     if allreq and hit and op and amt is not None:
@@ -627,21 +576,32 @@ def handle_command(text: str, ui_amount: float, ui_islem: str, ui_selected_ref:
         st.rerun(); return
 
     if op and amt is not None and pref is not None:
-        if auto_apply or trigger:
-            islem_yap(int(pref), float(amt), op)
+        if trigger or (auto_apply and cmd.confidence >= CMD_MIN_CONFIDENCE):
+            islem_yap(int(pref), float(amt), op, do_rerun=do_rerun)
+            return
+        elif auto_apply:
+            st.info(f"Komut belirsiz (güven {cmd.confidence:.0%}): {op}, {tl(amt)}, PersonRef {int(pref)}. "
+                    "Doğruysa 'İşlem Yap'a basın ya da 'işlem yap' deyin.")
+            speak("Komuttan emin değilim. Doğruysa işlem yap deyin.")
             return
         else:
             st.info("Komut çözüldü. 'İşlem Yap' butonuyla uygulayabilirsiniz.")
             speak("Komut hazır. İşlem Yap'a basın.")
             return
 
+    if pref is None and not hit:
+        cands = name_candidates(df, t)
+        if cands:
+            st.info("Bunu mu demek istediniz: " + ", ".join(f"{nm} ({ref})" for ref,nm,_ in cands))
+            speak(f"{cands[0][1]} mi demek istediniz?")
+
     if trigger:
         missing=[]
         if pref is None: missing.append("kişi (seçin ya da adını söyleyin)")
         if amt is None:  missing.append("tutar (söyleyin ya da girin)")
         if op is None:   missing.append("işlem türü (düş/ekle)")
         if not missing:
-            islem_yap(int(pref), float(amt), op)
+            islem_yap(int(pref), float(amt), op, do_rerun=do_rerun)
             return
         msg=" , ".join(missing) + "."
         st.warning(msg); speak(msg)
@@ -653,72 +613,407 @@ def handle_command(text: str, ui_amount: float, ui_islem: str, ui_selected_ref:
             msg="Komut eksik. 'Bu kişinin sistemden 85 TL düş' (tabloda Seç) ya da 'PersonRef 12345 …'."
             st.warning(msg); speak(msg)
 
-voice_param = get_query_param("voice")
-if voice_param:
+@traced()
+def sesli_komut(vtxt: str):
+    # ses kanalından ya da ?voice= ile gelen tek bir cümle. Tablo/KPI çizilmeden çağrılır; ek rerun gerekmez.
+    if not vtxt: return
     if st.session_state.force_listen:
         st.session_state.listening = True
+    st.session_state.last_final_text=vtxt
+    st.info(f"🎤 Algılanan komut: **{vtxt}**")
+    speak("Komut alındı.")
+    ui_amount = st.session_state.get("ui_tutar", 0.0)
+    ui_islem = st.session_state.get("ui_islem", next(iter(OPS)))
+    auto = st.session_state.get("auto_apply", True)
+    vcmd=parse_command(vtxt)
+    if vcmd.history and not vcmd.action:
+        lab = undo_step() if vcmd.history=="geri" else redo_step()
+        ne = "geri alındı" if vcmd.history=="geri" else "yinelendi"
+        if lab: st.success(f"{'↶' if vcmd.history=='geri' else '↷'} {lab} — {ne}."); speak(f"Son işlem {ne}.")
+        else: st.info("Geri alınacak işlem yok." if vcmd.history=="geri" else "Yinelenecek işlem yok."); speak("İşlem yok.")
+        return
+    if st.session_state.pending_batch:
+        if vcmd.confirm=="onay":
+            toplu_uygula(st.session_state.pending_batch); return
+        elif vcmd.confirm=="iptal":
+            st.session_state.pending_batch=None; speak("Toplu işlem iptal edildi."); st.rerun()
+    handle_command(vtxt, ui_amount, ui_islem, st.session_state.selected_ref, auto, do_rerun=False)
+
+# ================== SİDEBAR - AYARLAR ==================
+trace_stage("SİDEBAR - AYARLAR")
+with st.sidebar:
+    st.header("⚙️ Ayarlar")
+    st.session_state.auto_apply = st.toggle("🎤 Sesle otomatik uygula", value=st.session_state.get("auto_apply", True))
+
+# ================== VERİ YÜKLEME ==================
+trace_stage("VERİ YÜKLEME")
+with st.sidebar:
+    st.header("📄 Veri Kaynağı")
+    if SOURCE_PATH:  # BUTCE_KAYNAK: bölge dosyaları tek veri kümesinde birleştirilir
+        use_default = st.toggle(f"Birleşik kaynak ({os.path.basename(SOURCE_PATH)})", value=True,
+                                help=f"{SOURCE_PATH} altındaki çalışma kitapları / sayfalar; dışa aktarım: {DEFAULT_EXCEL_PATH}")
+    else:
+        use_default = st.toggle("Varsayılan dosya (BÜTÇE ÇALIŞMAA.xlsx)", value=True)
+    st.caption(f"Çalışma deposu: {'SQLite (' + WORKSTORE_PATH + ')' if STORE_BACKEND!='xlsx' else 'Excel'}")
+
+if not use_default: st.stop()
+
+# --- ÖNEMLİ: Excel'i HER SEFERİNDE ezme! ---
+# Süreçteki ilk oturum depodan yükler (şema eşleme burada bir kez); diğer oturumlar aynı kopyayı paylaşır.
+shared = get_shared()
+try:
+    shared.ensure_loaded()
+except FileNotFoundError:
+    st.error(f"'{SOURCE_PATH or DEFAULT_EXCEL_PATH}' bulunamadı."); st.stop()
+except Exception as e:
+    st.error(f"Excel okunamadı: {e}"); st.stop()
+if shared.load_stats:
+    ls = shared.load_stats
+    st.sidebar.caption(f"Yükleme: {ls['saniye']:.2f} sn · {ls['satir']} satır · {ls['kolon']} kolon · {ls['okuyucu']} · veri {ls['kare_mb']:.1f} MB"
+                       + (f" · tepe bellek {ls['tepe_mb']:.0f} MB" if ls.get("tepe_mb") else ""))
+    if ls.get("yeniden_uygulanan"):
+        st.sidebar.warning(f"Kaynak dosya değişmiş ve yeniden içe aktarıldı: dosyaya aktarılmamış {ls['yeniden_uygulanan']} kayıtlı işlem "
+                           "yeniden uygulandı (aynı hücrelerde dosyadaki değerin üzerine yazıldı)"
+                           + (f"; {ls['uygulanamayan']} işlemin kişisi artık dosyada yok" if ls.get("uygulanamayan") else "") + ".")
+if shared.sources:
+    rp = shared.sources; ks = pd.DataFrame(rp["kaynaklar"]); muk = pd.DataFrame(rp["mukerrer"], columns=["PersonRef","kaynak","durum"])
+    with st.sidebar:
+        st.caption(f"Kaynak: {len(ks)} dosya/sayfa · son birleştirme {rp['zaman']} ({rp['okunan']} yeniden okundu, "
+                   f"{rp['sure']:.1f} sn, {rp['surec']} süreç) · mükerrer PersonRef: {muk['PersonRef'].nunique()}")
+        for _, k in ks[~ks["durum"].isin(["okundu", "önbellek"])].iterrows(): st.warning(f"{k['kaynak']}: {k['durum']}")
+        with st.expander("📚 Kaynaklar"):
+            st.dataframe(ks[["kaynak","satir","satir_kalan","durum"]].rename(columns={"satir": "satır", "satir_kalan": "yüklenen"}),
+                         hide_index=True, use_container_width=True)
+            if len(muk):
+                kural = {"yeni": "en son değişen dosya kalır", "ilk": "sıradaki ilk dosya kalır", "hepsi": "hepsi kalır"}
+                st.caption(f"Birden çok kaynakta geçen PersonRef'ler ({kural.get(rp['politika'], rp['politika'])}):")
+                st.dataframe(muk, hide_index=True, use_container_width=True)
+                st.download_button("⬇️ Mükerrerler (CSV)", data=to_bytes(muk, "csv", "Mukerrer"), file_name="mukerrer_personref.csv",
+                                   mime="text/csv", use_container_width=True)
+with st.sidebar:
+    kaynak = os.path.basename(RULES_PATH) + ("" if RULES_PATH.lower().endswith(".csv") else f" / {RULES_SHEET}")
+    st.caption(f"Bütçe kuralları: {len(shared.rules)} kural ({kaynak})"
+               if shared.rules else f"Bütçe kuralı yok: tavan = mevcut maaş × {DEFAULT_MULTIPLIER}")
+    if shared.rules or shared.rule_errors:
+        with st.expander("📐 Kurallar"):
+            if shared.rules: st.dataframe(pd.DataFrame(shared.rules, columns=["Kapsam","Değer","Çarpan","Tavan"]), hide_index=True, use_container_width=True)
+            for e in shared.rule_errors: st.warning(e)
+    if st.button("🔁 Kuralları yeniden yükle", use_container_width=True):
+        # kurallar yüklemede satırlara çözülür: tam yeniden yükleme (kaydedilmemiş farklar çakışma olarak görünür)
+        shared.load(); st.rerun()
+shared.refresh()  # sadece kirli satırların türetilen kolonlarını tazele (tam normalize yok)
+shared.poll()     # başka süreçlerin kayıtları: sadece yeni günlük kayıtları (tam okuma yok)
+rebind_workspaces()  # yeniden yüklemeden sonra oturum farkları PersonRef ile yeni konumlarına
+pull_changes()    # bu oturumun son gördüğü sürümden beri değişen satırlar
+
+if hasattr(st, "fragment"):
+    @st.fragment(run_every=CHANGE_POLL_SECONDS)
+    def _degisiklik_takibi():
+        # etkileşim olmasa da başkalarının kayıtları birkaç saniyede ekrana gelsin
+        S = get_shared(); S.poll()
+        if S.version != st.session_state.seen_version: st.rerun()
+    _degisiklik_takibi()
+
+df = shared.df  # kaydedilmiş ortak veri (salt okunur); oturum görünümü için view_rows
+mgr_index = shared.mgr_index
+
+# ================== SES KOMUTU (kanal / ?voice=) ==================
+trace_stage("SES KOMUTU")
+ses = st.session_state.get("ses_kanali")
+if isinstance(ses, dict) and ses.get("id") != st.session_state._last_voice_id:
+    st.session_state._last_voice_id = ses.get("id")
+    sesli_komut(str(ses.get("text", "")).strip())
+voice_param = get_query_param("voice")  # bağlantı/otomasyon için yedek giriş
+if voice_param:
     vtxt=unquote(voice_param).strip()
     if vtxt!=st.session_state._last_voice:
         st.session_state._last_voice=vtxt
-        st.session_state.last_final_text=vtxt
-        st.info(f"🎤 Algılanan komut: **{vtxt}**")
-        speak("Komut alındı.")
-        st.components.v1.html("<script>const u=new URL(location.href);u.searchParams.delete('voice');history.replaceState({},'',u);</script>", height=0)
-        if st.session_state.pending_batch:
-            vlow=vtxt.lower()
-            if any(w in vlow for w in ["onayla","evet","uygula","tamam"]):
-                b=st.session_state.pending_batch
-                for ref in b["refs"]:
-                    try: islem_yap(int(ref), float(b["amount"]), b["op"], announce=False, do_rerun=False)
-                    except: pass
-                st.session_state.pending_batch=None
-                speak("Toplu işlem uygulandı. Kaydet’e basarak geçmişe işleyin."); st.rerun()
-            elif any(w in vlow for w in ["iptal","hayır","hayir","vazgeç","vazgec"]):
-                st.session_state.pending_batch=None; speak("Toplu işlem iptal edildi."); st.rerun()
-            else:
-                handle_command(vtxt, tutar, islem, selected_ref, st.session_state.get("auto_apply", True))
+        sesli_komut(vtxt)
+
+# ================== FİLTRE ==================
+trace_stage("FİLTRE")
+with st.sidebar:
+    st.header("🎛️ Filtreler & İşlemler")
+    opts = mgr_index.opts
+    selected_manager = st.selectbox("Bütçe işlemi yapılacak yönetici", opts if opts else ["(yok)"])
+
+# ================== SENARYOLAR ==================
+trace_stage("SENARYOLAR")
+with st.sidebar:
+    st.subheader("🧪 Senaryolar")
+    names = ["(gerçek)"] + list(st.session_state.scenarios)
+    cur_sc = st.session_state.scenario
+    secim = st.selectbox("Çalışma alanı", names, index=names.index(cur_sc) if cur_sc in names else 0)
+    if (None if secim == "(gerçek)" else secim) != cur_sc:
+        activate_scenario(None if secim == "(gerçek)" else secim); st.rerun()
+    sn1, sn2 = st.columns([2,1])
+    with sn1: yeni_ad = st.text_input("Yeni senaryo adı", key="yeni_senaryo", label_visibility="collapsed", placeholder="Yeni senaryo adı")
+    with sn2:
+        if st.button("Dal aç", use_container_width=True):
+            ad = (yeni_ad or "").strip() or f"Senaryo {len(st.session_state.scenarios)+1}"
+            if ad in st.session_state.scenarios or ad == "(gerçek)": st.warning(f"'{ad}' zaten var.")
+            else: new_scenario(ad); st.rerun()
+    if cur_sc is not None:
+        sa1, sa2 = st.columns(2)
+        with sa1:
+            if st.button("✅ Gerçeğe aktar", use_container_width=True, help="Senaryonun işlemleri kaydedilmemiş işlemlere eklenir"):
+                n_ops = len(st.session_state.scenarios[cur_sc]["ops"]); promote_scenario(cur_sc)
+                speak(f"{cur_sc} senaryosu aktarıldı: {n_ops} işlem. Kaydet ile geçmişe işleyin."); st.rerun()
+        with sa2:
+            if st.button("🗑️ Senaryoyu sil", use_container_width=True):
+                drop_scenario(cur_sc); st.rerun()
+
+filt_pos = mgr_index.rows[selected_manager] if (opts and selected_manager!="(yok)") else None  # None = tüm şirket
+
+# ================== KPI ==================
+trace_stage("KPI")
+kullanilan, sistem_kalan, butce_disi_kalan = session_kpi(selected_manager if (opts and selected_manager!="(yok)") else None)
+c1,c2,c3=st.columns(3)
+c1.metric("KULLANILAN BÜTÇE DIŞI DAHİL", tl(kullanilan))
+c2.metric("SİSTEM KALAN", tl(sistem_kalan))
+c3.metric("BÜTÇE DIŞI KALAN", tl(butce_disi_kalan))
+with st.expander("📊 Tüm Yöneticiler — Kalan Bütçe Özeti"):
+    st.dataframe(kpi_rollup({m: session_kpi(m) for m in mgr_index.opts}, mgr_index), use_container_width=True, hide_index=True, height=320)
+if st.session_state.scenario is not None:
+    st.info(f"🧪 Senaryo: **{st.session_state.scenario}** — işlemler sadece bu dala uygulanır; kaydetmek için 'Gerçeğe aktar'.")
+if st.session_state.scenarios:
+    with st.expander("🧪 Senaryo Karşılaştırması", expanded=st.session_state.scenario is not None):
+        st.dataframe(scenario_compare(selected_manager if (opts and selected_manager!="(yok)") else None),
+                     use_container_width=True, hide_index=True)
+
+# ================== TABLO ==================
+trace_stage("TABLO")
+# Tablo sunucu tarafında aranır/sıralanır/sayfalanır; data_editor'a sadece görünen sayfa gider.
+cols = ["PersonRef","FULLNAME","DEPARTMAN","1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ",
+        "CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE","KULLANILAN BÜTÇE DIŞI DAHİL","SİSTEM KALAN","BÜTÇE DIŞI KALAN"]
+if SOURCE_COL in df.columns: cols.append(SOURCE_COL)  # birleşik kaynakta satırın geldiği dosya
+st.write("**Bağlı kişiler (satır seç → PersonRef atanır)**")
+tq, ts, td, tz = st.columns([3,2,1,1])
+with tq: ara = st.text_input("🔎 Ara (ad, PersonRef, departman, yönetici)", key="tbl_q")
+with ts: sirala = st.selectbox("Sırala", ["(yok)"] + [c for c in cols if c in df.columns or c in DERIVED_COLS], key="tbl_sort")
+with td: azalan = st.toggle("Azalan", key="tbl_desc")
+with tz: boyut = st.selectbox("Satır", [25, 50, 100, 250], index=1, key="tbl_size")
+sayfa = st.session_state.setdefault("tbl_page", 1)
+df_page, n_match, n_pages = page_view(filt_pos, ara, None if sirala=="(yok)" else sirala, azalan, sayfa, boyut)
+if sayfa > n_pages: sayfa = st.session_state.tbl_page = n_pages  # filtre daralınca son sayfaya
+for c in cols:
+    if c not in df_page.columns: df_page[c]=np.nan
+df_show=df_page[cols].reset_index(drop=True); df_show.insert(0,"Seç",False)
+# görünüm değişince seçim kutuları sıfırlansın: editör anahtarı görünüme bağlı
+view_key = f"tbl_{selected_manager}_{ara}_{sirala}_{azalan}_{boyut}_{sayfa}"
+with trace_span("data_editor"):
+    edited = st.data_editor(df_show, use_container_width=True, hide_index=True, height=420,
+                            disabled=[c for c in df_show.columns if c!="Seç"], key=view_key)
+pc1, pc2 = st.columns([1,3])
+with pc1: st.number_input("Sayfa", min_value=1, max_value=n_pages, step=1, key="tbl_page")
+with pc2: st.caption(f"{n_match} kişi • sayfa {sayfa}/{n_pages}")
+sel=None
+chosen=edited.index[edited.get("Seç",False)==True].tolist() if "Seç" in edited.columns else []
+if chosen:
+    try:
+        v=edited.loc[chosen[0],"PersonRef"]
+        if pd.notna(v): sel=int(float(v))
+    except: sel=None
+if sel is not None: st.session_state.selected_ref=sel
+selected_ref = st.session_state.selected_ref
+
+# ================== SİDEBAR İŞLEM ALANLARI ==================
+trace_stage("SİDEBAR İŞLEM ALANLARI")
+with st.sidebar:
+    st.markdown("---"); st.subheader("🛠️ İşlem")
+    if selected_ref is not None: st.success(f"Seçili PersonRef: {selected_ref}")
+    manuel_ref = st.text_input("Veya Manuel PersonRef", value="" if selected_ref is None else str(selected_ref))
+    tutar = st.number_input("Tutar (TL) — (istersen boş bırak)", step=100.0, min_value=0.0, value=0.0, key="ui_tutar")
+    islem = st.radio("İşlem Türü",
+        ["Bütçeden Düş (Sistem Kalan)","Bütçeye Ekle (Sistem Kalan)","Bütçeden Düş (Bütçe Dışı Kalan)","Bütçeye Ekle (Bütçe Dışı Kalan)"], index=0, key="ui_islem")
+
+# ================== BUTONLAR ==================
+trace_stage("BUTONLAR")
+cA,cB,cC=st.columns([1,1,1])
+with cA:
+    if st.button("İşlem Yap", use_container_width=True):
+        last_text = st.session_state.get("last_final_text", "")
+        pref, chosen_amt, op = resolve_click_inputs(manuel_ref, selected_ref, tutar, islem, last_text)
+        if pref is None:
+            st.warning("Kişi bulunamadı. Tabloda seçin, PersonRef girin veya 'Son' komutta isim/PersonRef geçsin.")
+            speak("Kişi bulunamadı. Lütfen kişi seçin ya da PersonRef söyleyin.")
+        elif not chosen_amt or float(chosen_amt) <= 0:
+            st.warning("Tutar yok. Soldan girin ya da 'Son' cümlede tutarı söyleyin (örn. 80 TL).")
+            speak("Tutar algılanmadı. Lütfen tutarı söyleyin veya girin.")
+        elif not op:
+            st.warning("İşlem türü anlaşılmadı. 'düş' veya 'ekle' deyin; 'bütçe dışı' derseniz oraya uygulanır.")
+            speak("İşlem türü anlaşılmadı. Lütfen düş mü ekle mi olduğunu söyleyin.")
+        else:
+            try:
+                islem_yap(int(pref), float(chosen_amt), op, do_rerun=True)
+            except:
+                st.warning("İşlem uygulanamadı. Girdileri kontrol edin.")
+
+with cB:
+    if st.session_state.unsaved_ops: st.info(f"Kaydedilmemiş işlem: {len(st.session_state.unsaved_ops)}")
+    if st.button("Kaydet", type="primary", use_container_width=True, disabled=st.session_state.scenario is not None,
+                 help="Senaryo modunda kaydedilmez; önce senaryoyu gerçeğe aktarın" if st.session_state.scenario else None):
+        # sadece işlemler günlüğe eklenir (O(delta)); depo, günlük büyüyünce sıkıştırmada güncellenir
+        ok, bad = kaydet()
+        if bad:
+            st.warning(f"{len(ok)} kişi kaydedildi; {len(bad)} kişiyi başka bir kullanıcı sizden önce değiştirdi (aşağıda).")
+            speak("Bazı kişiler başka kullanıcı tarafından değiştirilmiş. Lütfen çakışmaları çözün.")
         else:
-            handle_command(vtxt, tutar, islem, selected_ref, st.session_state.get("auto_apply", True))
+            st.success("Veriler kaydedildi — diğer kullanıcılar da aynı şekilde görecek.")
+            speak("Veriler kaydedildi ve geçmişe işlendi.")
+            st.rerun()
+
+if STORE_BACKEND!="xlsx":
+    with st.sidebar:
+        if st.button("📤 Excel'e Aktar", use_container_width=True, help=f"Kaydedilmiş veriyi '{DEFAULT_EXCEL_PATH}' dosyasına yazar"):
+            shared.export_xlsx()
+            st.success(f"'{DEFAULT_EXCEL_PATH}' güncellendi.")
+
+if st.session_state.conflicts and st.session_state.scenario is None:
+    # ================== ÇAKIŞMALAR ==================
+    cf = [p for p in st.session_state.conflicts if p in st.session_state.overlay]
+    rows = []
+    for p in cf:
+        e = st.session_state.overlay[p]
+        for col,v in e["val"].items():
+            rows.append({"PersonRef": df["PersonRef"].iat[p], "AdSoyad": df["FULLNAME"].iat[p], "Kolon": col,
+                         "Benim Başlangıç": e["base"][col], "Benim Değer": v, "Güncel (kaydedilmiş)": num_at(df,col,[p])[0]})
+    st.warning(f"⚠️ {len(cf)} kişi için çakışma: siz düzenlerken başka bir kullanıcı bu kişileri kaydetti.")
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    k1,k2 = st.columns(2)
+    with k1:
+        if st.button("🔁 Farkımı güncel değere uygula", use_container_width=True):
+            resolve_conflicts(rebase=True); st.rerun()
+    with k2:
+        if st.button("↩️ Değişikliklerimi bırak", use_container_width=True):
+            resolve_conflicts(rebase=False); st.rerun()
+
+u1, u2 = st.columns(2)
+with u1:
+    h = _hist()
+    if st.button("↶ Geri al", use_container_width=True, disabled=not h["undo"], help=h["undo"][-1]["label"] if h["undo"] else None):
+        undo_step(); st.rerun()
+with u2:
+    if st.button("↷ Yinele", use_container_width=True, disabled=not h["redo"], help=h["redo"][-1]["label"] if h["redo"] else None):
+        redo_step(); st.rerun()
+
+with cC:
+    if st.button("Komut Örnekleri", use_container_width=True):
+        st.info("Örnek: 'Bu kişinin sistemden seksen beş düş' | 'Ayşegül Ünal’ın bütçesine 5 TL ekle' | '… işlem yap' | 'Ahmet'e 500 ekle, sicil 12345 bütçe dışı 200 düş' (birleşik) | 'geri al' / 'yinele'")
+        speak("Örnek komutlar ekranınızda.")
+
+# ================== CANLI YAZIM (Başlat/Durdur kontrollü) ==================
+trace_stage("CANLI YAZIM")
+st.markdown("### 🎧 Canlı Yazım")
+ses_yeri = st.empty()  # ses kanalı sayfanın sonunda buraya çizilir (bu turun tüm sesli yanıtlarıyla)
+
+# ================== BAŞLAT / DURDUR ==================
+trace_stage("BAŞLAT / DURDUR")
+with st.sidebar:
+    st.markdown("---"); st.subheader("🎧 Dinleme")
+    colS, colT = st.columns(2)
+    with colS:
+        if st.button("🎤 Başlat", use_container_width=True, disabled=st.session_state.listening):
+            st.session_state.force_listen = True
+            st.session_state.listening = True
+            st.rerun()
+    with colT:
+        if st.button("⏹️ Durdur", use_container_width=True, disabled=not st.session_state.listening):
+            st.session_state.force_listen = False
+            st.session_state.listening = False
+            st.rerun()
 
 # ================== TOPLU ONAY KARTI ==================
+trace_stage("TOPLU ONAY KARTI")
+rep = st.session_state.pop("batch_report", None)
+if rep and rep.get("items"):
+    st.success(f"Birleşik komut (grup {rep['group']}): {len(rep['items'])} işlem tek seferde uygulandı.\n\n"
+               + "\n\n".join(f"• PersonRef {r}: {tl(a)} → {op}" for r,a,op in rep["items"]))
+elif rep:
+    st.success(f"Toplu işlem: **{rep['manager']}** → **{rep['op']}** — {rep['applied']} kişiye uygulandı.")
+    if rep["fails"]:
+        st.warning(f"{len(rep['fails'])} kişiye uygulanamadı: " + ", ".join(f"{r} ({why})" for r,why in rep["fails"]))
 if st.session_state.pending_batch:
     b = st.session_state.pending_batch
-    st.warning(f"🧾 Toplu İşlem Bekliyor: **{b['manager']}** yöneticisinin **{len(b['refs'])}** bağlısına **{int(b['amount'])} TL** → **{b['op']}**")
-    preview = st.session_state.df[st.session_state.df["PersonRef"].isin(b["refs"])][["PersonRef","FULLNAME","DEPARTMAN","1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ","CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE"]].copy()
-    st.dataframe(preview, use_container_width=True, height=260)
+    if "items" in b:
+        st.warning(f"🧾 Birleşik Komut Onay Bekliyor: **{len(b['items'])}** işlem\n\n"
+                   + "\n\n".join(f"• PersonRef {r}: {tl(a)} → {op}" for r,a,op in b["items"]))
+    else:
+        st.warning(f"🧾 Toplu İşlem Bekliyor: **{b['manager']}** yöneticisinin **{len(b['refs'])}** bağlısına **{int(b['amount'])} TL** → **{b['op']}**")
+    bpos = [p for p in map(ref_pos, b["refs"]) if p is not None]
+    bsayfa = st.session_state.setdefault("batch_page", 1)
+    preview, _n, bpages = page_view(bpos, page=bsayfa, size=100)
+    if bsayfa > bpages: st.session_state.batch_page = bpages
+    st.dataframe(preview[["PersonRef","FULLNAME","DEPARTMAN","1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ","CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE"]],
+                 use_container_width=True, height=260, hide_index=True)
+    if bpages > 1:
+        st.number_input(f"Önizleme sayfası (100'er kişi, {bpages} sayfa)", min_value=1, max_value=bpages, step=1, key="batch_page")
     c_ok, c_cancel = st.columns(2)
     with c_ok:
         if st.button("✅ Onayla (Toplu Uygula)", type="primary", use_container_width=True):
-            for ref in b["refs"]:
-                try: islem_yap(int(ref), float(b["amount"]), b["op"], announce=False, do_rerun=False)
-                except: pass
-            st.session_state.pending_batch=None
-            speak("Toplu işlem uygulandı. Kaydet’e basarak geçmişe işleyin."); st.rerun()
+            toplu_uygula(b)
     with c_cancel:
         if st.button("❌ İptal", use_container_width=True):
             st.session_state.pending_batch=None; speak("Toplu işlem iptal edildi."); st.rerun()
 
 # ================== GEÇMİŞ & İNDİR ==================
+trace_stage("GEÇMİŞ & İNDİR")
+stamp = dt.datetime.now().strftime('%Y%m%d_%H%M%S')
+fmt_label = st.selectbox("İndirme biçimi", list(EXPORT_FORMATS), key="export_fmt")
+fmt = EXPORT_FORMATS[fmt_label]
+
 st.markdown("## 🧾 İşlem Geçmişi")
-if not st.session_state.history:
+jver = get_journal().version()
+hd = history_frame(jver)
+if hd.empty:
     st.info("Henüz geçmiş kaydı yok. İşlem yap → Kaydet’e bas.")
 else:
-    hd=pd.DataFrame(st.session_state.history)
-    try:
-        hd["Zaman_dt"]=pd.to_datetime(hd["Zaman"]); hd=hd.sort_values("Zaman_dt",ascending=False).drop(columns=["Zaman_dt"])
-    except: pass
     st.dataframe(hd, use_container_width=True, height=280)
-    buf=io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as w: hd.to_excel(w,index=False,sheet_name="Islem_Gecmisi")
-    st.download_button("⬇️ İşlem Geçmişini İndir (Excel)", data=buf.getvalue(),
-        file_name=f"Islem_Gecmisi_{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+    lazy_download("⬇️ İşlem Geçmişini İndir", lambda fmt=fmt, jver=jver: history_export(fmt, jver),
+                  f"Islem_Gecmisi_{stamp}.{fmt}", fmt, key="dl_hist")
 
-st.markdown("## ⬇️ Güncel Veriyi İndir (Excel)")
+st.markdown("## ⬇️ Güncel Veriyi İndir")
 only = st.checkbox("Sadece seçili yönetici filtresi", value=False)
-export = df_filtered.copy() if only else st.session_state.df.copy()
-buf2=io.BytesIO()
-with pd.ExcelWriter(buf2, engine="openpyxl") as w: export.to_excel(w,index=False,sheet_name="Veri")
-st.download_button("⬇️ Veriyi İndir", data=buf2.getvalue(),
-    file_name=f"Veri_{'filtreli_' if only else ''}{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+exp_mgr = selected_manager if (only and filt_pos is not None) else None
+lazy_download("⬇️ Veriyi İndir",
+              lambda fmt=fmt, m=exp_mgr, ov=st.session_state.overlay: data_export(fmt, get_shared().version, m, overlay_signature(ov), ov),
+              f"Veri_{'filtreli_' if exp_mgr else ''}{stamp}.{fmt}", fmt, key="dl_veri")
+
+# ================== İZLEME PANELİ ==================
+trace_stage("İZLEME PANELİ")
+with st.sidebar:
+    with st.expander("🔬 İzleme", expanded=bool(st.session_state.get("izleme"))):
+        st.toggle("Aşama sürelerini ölç", value=TRACE_DEFAULT, key="izleme",
+                  help="Her çalıştırmada aşama/adım süreleri, önbellek isabetleri ve DataFrame kopyaları kaydedilir")
+        izler = st.session_state.get("iz_gecmis", [])
+        if izler:
+            etiket = {f"{t.label} · {t.zaman[11:]} · {t.ms:,.0f} ms · {t.sonuc}": t for t in reversed(izler)}
+            tr = etiket[st.selectbox("Çalıştırma", list(etiket), key="iz_sec")]
+            kayit = pd.DataFrame(tr.records())
+            ad = kayit.apply(lambda r: "\u2003" * int(r["derinlik"]) + r["ad"] if r["tur"] in ("aşama", "adım") else r["ad"], axis=1)
+            adim = kayit[kayit["tur"].isin(["aşama", "adım"])].assign(ad=ad)
+            st.dataframe(adim[["ad", "sure_ms", "baslangic_ms"]].rename(columns={"ad": "Aşama / adım", "sure_ms": "ms", "baslangic_ms": "başlangıç"}),
+                         hide_index=True, use_container_width=True, height=260)
+            if tr.counters:
+                st.dataframe(pd.DataFrame(sorted(tr.counters.items()), columns=["Sayaç", "Değer"]), hide_index=True, use_container_width=True)
+            if tr.copies:
+                st.caption("Kopyalar: " + " · ".join(f"{w} {r} satır {mb:.2f} MB" for w, r, mb in tr.copies))
+            with st.popover("Tüm çalıştırmalar (özet)") if hasattr(st, "popover") else st.container():
+                hepsi = pd.DataFrame([r for t in izler for r in t.records() if r["tur"] in ("aşama", "adım")])
+                st.dataframe(hepsi.groupby("ad")["sure_ms"].agg(adet="count", medyan="median", en_cok="max").sort_values("en_cok", ascending=False)
+                             .round(1).reset_index(), hide_index=True, use_container_width=True)
+            d1, d2 = st.columns(2)
+            d1.download_button("⬇️ JSON", trace_export(izler, "json"), f"izleme_{stamp}.json", "application/json", use_container_width=True)
+            d2.download_button("⬇️ CSV", trace_export(izler, "csv"), f"izleme_{stamp}.csv", "text/csv", use_container_width=True)
+        elif st.session_state.get("izleme"):
+            st.caption("İlk iz bu çalıştırma bitince görünür.")
+
+# ================== SES KANALI ==================
+trace_stage("SES KANALI")
+# En sonda çizilir: bu çalıştırmada kuyruğa giren tüm sesli yanıtlar aynı turda tarayıcıya iletilir.
+with ses_yeri:
+    _ses_kanali(listening=st.session_state.listening, say=st.session_state.get("say_queue", []),
+                last=st.session_state.get("last_final_text", ""), key="ses_kanali", default=None)
+st.session_state.say_queue = []
+if st.session_state.get("iz_aktif") is not None:
+    iz_sakla(trace_stop()); st.session_state.iz_aktif = None
@@ -0,0 +1,238 @@
+"""Bütçe çekirdeği ölçüm betiği (Streamlit'siz).
+
+Sentetik çalışma dosyaları (gerçekçi 4 seviyeli yönetici ağacı) üretir; yükleme, tek işlem, yönetici toplu
+işlem, isimden kişi bulma, komut ve sayı ifadesi ayrıştırma, kaydetme, dışa aktarım ve bölge dosyalarının birleştirilmesi
+için gecikme, iş hacmi ve tepe bellek raporlar.
+
+    python butce_bench.py                       # 1k / 10k / 100k çalışan
+    python butce_bench.py -n 1000 -n 10000 --tekrar 50 --json sonuc.json
+    python butce_bench.py --depo xlsx --bellek
+"""
+import argparse, os, sys, time, json, random, shutil, tempfile, tracemalloc
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Bütçe çekirdeği ölçümü (sentetik veri)")
+    ap.add_argument("-n", "--calisan", type=int, action="append", help="çalışan sayısı (tekrarlanabilir; varsayılan 1000, 10000, 100000)")
+    ap.add_argument("--tekrar", type=int, default=30, help="tekrarlı ölçümlerde tekrar sayısı")
+    ap.add_argument("--depo", choices=["sqlite", "xlsx"], default="sqlite", help="depo türü (BUTCE_STORE)")
+    ap.add_argument("--bellek", action="store_true", help="her aşamayı bir kez de tracemalloc altında çalıştırıp tepe ayırımı ölç")
+    ap.add_argument("--json", help="sonuçları bu dosyaya yaz")
+    ap.add_argument("--dizin", help="sentetik dosyaların yazılacağı dizin (verilirse silinmez)")
+    ap.add_argument("--bolge", type=int, default=8, help="birleştirme ölçümü için bölge dosyası sayısı (0: ölçme)")
+    ap.add_argument("--tohum", type=int, default=7)
+    return ap.parse_args(argv)
+
+ARGS = parse_args() if __name__ == "__main__" else None
+if ARGS: os.environ["BUTCE_STORE"] = ARGS.depo  # get_store varsayılanı içe aktarımda okunur
+
+import numpy as np
+import butce_core as bc
+
+# ================== SENTETİK VERİ ==================
+ADLAR = ["AHMET", "MEHMET", "AYŞE", "FATMA", "MUSTAFA", "EMİNE", "ALİ", "HATİCE", "HÜSEYİN", "ZEYNEP", "İBRAHİM", "ELİF",
+         "MURAT", "DEMET", "GÜLPERİ", "İLKER", "ÇAĞATAY", "BAHATTİN", "ŞULE", "ÖZGÜR", "ÜMİT", "SELİN", "BURAK", "DERYA",
+         "KEMAL", "SEDA", "TOLGA", "NUR", "CEM", "IŞIL", "ONUR", "PINAR", "EMRE", "GÖKHAN", "BERNA", "SİNAN"]
+SOYADLAR = ["YILMAZ", "KAYA", "DEMİR", "ÇELİK", "ŞAHİN", "YILDIZ", "YILDIRIM", "ÖZTÜRK", "AYDIN", "ÖZDEMİR", "ARSLAN",
+            "DOĞAN", "KILIÇ", "ASLAN", "ÇETİN", "KARA", "KOÇ", "KURT", "ÖZKAN", "ŞİMŞEK", "EKİNCİ", "GÜNEŞ", "KÜÇÜK",
+            "TANDAR", "GÜLERMAN", "ERDOĞAN", "POLAT", "AKSOY", "TEKİN", "UÇAR", "BULUT", "KORKMAZ", "ÇAKIR", "ERDEM"]
+KADEMELER = ["Gelişime Açık", "Başarılı", "Çok Başarılı", "Üstün Başarılı"]
+DEPARTMANLAR = ["FİNANS", "SATINALMA", "İNSAN KAYNAKLARI", "BİLGİ TEKNOLOJİLERİ", "LOJİSTİK", "MAĞAZACILIK", "PAZARLAMA", "HUKUK"]
+# seviye başına ortalama dal sayısı (alttan üste): 1. yönetici ~10 çalışan, 2. ~6 birinci seviye, ...
+DAL = (10, 6, 6, 5)
+HEADER = ["Yıl", "PersonRef", "AD SOYAD", "PerformanceLevelName", "DEPARTMAN", "PARA BİRİMİ", "CurrentSalary", "NewSalary",
+          "BÜTÇE DIŞI TALEPLER İLE", "1.YÖNETİCİSİ", "2.YÖNETİCİSİ", "3.YÖNETİCİSİ", "4.YÖNETİCİSİ", "OrganizationUnitName"]
+
+def _names(rng, k):
+    # benzersiz ad soyad; iki kelimelik adlar tükendikçe ikinci/üçüncü ad eklenir
+    out, seen = [], set()
+    while len(out) < k:
+        for tries in range(100):
+            mid = 0 if tries < 3 else 1 if tries < 10 else 2
+            name = " ".join(dict.fromkeys([rng.choice(ADLAR) for _ in range(1 + mid)] + [rng.choice(SOYADLAR)]))
+            if name not in seen: break
+        seen.add(name); out.append(name)
+    return out
+
+def synth_rows(n: int, seed: int = 7):
+    # (başlık, satırlar, yönetici adları seviye sırasıyla); ağaç: çalışan -> 1. -> 2. -> 3. -> 4. yönetici
+    rng = random.Random(seed)
+    counts = []; k = n
+    for d in DAL: k = max(1, -(-k // d)); counts.append(k)
+    names = _names(rng, n + sum(counts)); mgr_names = []; at = n
+    for c in counts: mgr_names.append(names[at:at + c]); at += c
+    # düzensiz dallanma: her seviyede sıralı sınırlar rastgele kaydırılır
+    parent = []
+    for lvl, c in enumerate(counts):
+        below = n if lvl == 0 else counts[lvl - 1]
+        cuts = sorted(rng.randrange(below) for _ in range(c - 1))
+        parent.append(np.searchsorted(np.asarray(cuts), np.arange(below), side="right"))
+    refs = rng.sample(range(10000, 10000 + n * 20), n)
+    rows = []
+    for i in range(n):
+        chain = []; j = i
+        for lvl in range(4):
+            j = int(parent[lvl][j]); chain.append(mgr_names[lvl][j])
+        dept = DEPARTMANLAR[j % len(DEPARTMANLAR)]  # departman en üst yöneticiye bağlı
+        if i % 11 == 0: chain[3] = None  # bazı zincirler 3 seviyede biter
+        cur = rng.randrange(40000, 250000)
+        new = round(cur * rng.uniform(1.25, 1.45))
+        rows.append((2025, refs[i], names[i], rng.choice(KADEMELER), dept, "TRY", cur, new, new,
+                     *chain, f"{dept} BİRİMİ {int(parent[0][i]) % 50 + 1}"))
+    return HEADER, rows, mgr_names
+
+def write_synth(path: str, n: int, seed: int = 7):
+    import openpyxl
+    header, rows, mgr_names = synth_rows(n, seed)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1"); ws.append(header)
+    for r in rows: ws.append(r)
+    kr = wb.create_sheet(bc.RULES_SHEET)
+    for r in [("Kapsam", "Değer", "Çarpan", "Tavan"), ("*", None, 1.4, None), ("kademe", "Üstün Başarılı", 1.5, None),
+              ("departman", "HUKUK", 1.35, None), ("yönetici", mgr_names[2][0], 1.3, 300000)]:
+        kr.append(r)
+    wb.save(path)
+    return rows, mgr_names
+
+# bölge dosyalarında farklı başlıklar (takma adlar, ayrı ad/soyad) — birleştirme şemaya çevirmeli
+ALT_HEADER = {"PersonRef": "Sicil No", "CurrentSalary": "Mevcut Maaş", "NewSalary": "Yeni Maaş", "DEPARTMAN": "Bölüm"}
+
+def write_regions(dirpath: str, rows: list, k: int, dup: float = 0.005):
+    # satırları k bölge dosyasına böler; tek numaralı dosyalar farklı başlık kullanır, her dosyanın ilk %0.5'i
+    # bir sonraki dosyada da bulunur (bölgeler arası geçiş: mükerrer PersonRef)
+    import openpyxl
+    os.makedirs(dirpath, exist_ok=True)
+    parts = np.array_split(np.arange(len(rows)), k)
+    ad = HEADER.index("AD SOYAD")
+    for f, idx in enumerate(parts):
+        extra = parts[f - 1][:max(1, int(len(parts[f - 1]) * dup))] if f else []
+        wb = openpyxl.Workbook(write_only=True); ws = wb.create_sheet(f"Bölge {f + 1}")
+        if f % 2:
+            hdr = [ALT_HEADER.get(c, c) for c in HEADER]; hdr[ad:ad + 1] = ["Ad", "Soyad"]; ws.append(hdr)
+            for i in [*idx, *extra]:
+                r = list(rows[i]); a, _, b = r[ad].rpartition(" "); r[ad:ad + 1] = [a, b]; ws.append(r)
+        else:
+            ws.append(HEADER)
+            for i in [*idx, *extra]: ws.append(rows[i])
+        wb.save(os.path.join(dirpath, f"bolge_{f + 1:02d}.xlsx"))
+
+# ================== ÖLÇÜM ==================
+def bench(name, fn, items=1, repeat=1, setup=None, memory=False):
+    # fn(setup()) `repeat` kez süre ölçülerek çalıştırılır; items: çağrı başına iş (satır/işlem) sayısı
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t0 = time.perf_counter(); fn(arg); times.append(time.perf_counter() - t0)
+    t = np.asarray(times)
+    out = {"aşama": name, "tekrar": repeat, "medyan_ms": float(np.median(t) * 1000), "p95_ms": float(np.percentile(t, 95) * 1000),
+           "adet/s": float(items / np.median(t)) if np.median(t) > 0 else float("inf"), "adet": items}
+    if memory:
+        arg = setup() if setup else None
+        tracemalloc.start(); fn(arg); out["tepe_ayırım_mb"] = tracemalloc.get_traced_memory()[1] / 2**20; tracemalloc.stop()
+    out["rss_mb"] = bc.peak_rss_mb()
+    return out
+
+def _clear_store():
+    for p in (bc.WORKSTORE_PATH, bc.JOURNAL_PATH, bc.HISTORY_PATH, bc.SNAPSHOT_STATE_PATH):
+        if os.path.exists(p): os.remove(p)
+
+def run_size(n: int, workdir: str, args) -> list:
+    path = os.path.join(workdir, f"butce_{n}.xlsx")
+    t0 = time.perf_counter(); rows, mgr_names = write_synth(path, n, args.tohum)
+    print(f"\n# {n:,} çalışan — sentetik dosya {time.perf_counter() - t0:.1f} sn, {os.path.getsize(path) / 2**20:.1f} MB", flush=True)
+    bc.use_workbook(path); _clear_store()
+    rng = random.Random(args.tohum)
+    res, mem, R = [], args.bellek, args.tekrar
+    S = bc.SharedState()
+
+    # yükleme: ilk içe aktarım (depo yok) ve depodan tekrar yükleme
+    loads = max(1, min(3, R))
+    res.append(bench("yükle (içe aktarım)", lambda _: S.load(), n, loads, setup=_clear_store, memory=mem))
+    if args.depo == "sqlite":
+        res.append(bench("yükle (depodan)", lambda _: S.load(), n, loads, memory=mem))
+
+    refs = S.df["PersonRef"].to_numpy(dtype="int64", na_value=0)  # satır konumu -> PersonRef
+    ops = list(bc.OPS)
+    ws = bc.Workspace(S)
+    res.append(bench("tek işlem", lambda a: ws.apply([a[0]], a[1], a[2]), 1, R * 10,
+                     setup=lambda: (int(rng.choice(refs)), rng.randrange(1, 5000), rng.choice(ops)), memory=mem))
+
+    # yönetici toplu: her seviyeden rastgele yönetici, bağlı tüm çalışanlara tek işlem
+    for lvl in range(4):
+        ms = [m for m in mgr_names[lvl] if m in S.mgr_index.rows]
+        sizes = [len(np.atleast_1d(S.mgr_index.rows[m])) for m in ms]
+        pick = lambda lvl=lvl, ms=ms: refs[np.atleast_1d(S.mgr_index.rows[rng.choice(ms)])].tolist()
+        res.append(bench(f"yönetici toplu ({lvl + 1}. seviye, ~{int(np.mean(sizes))} kişi)",
+                         lambda a: ws.apply(a, 100, ops[0]), int(np.mean(sizes)), R, setup=pick, memory=mem))
+
+    names = [r[2] for r in rows]
+    res.append(bench("isimden kişi bulma", lambda t: bc.find_personref_by_name(S.df, t), 1, R * 10,
+                     setup=lambda: f"{rng.choice(names).lower()} için {rng.randrange(100, 9000)} tl sistemden düş", memory=mem))
+    words = ["beş yüz", "bin iki yüz", "iki bin beş yüz elli", "yedi yüz yirmi beş", "üç bin"]
+    res.append(bench("komut ayrıştırma", lambda t: bc.parse_command(t, S.mgr_index), 1, R * 10,
+                     setup=lambda: f"sicil {int(rng.choice(refs))} bütçe dışından {rng.choice(words)} {rng.randrange(1, 99)} lira düş",
+                     memory=mem))
+
+    # sayı ifadesi çözme: her çağrıda yeni üretilmiş ifade (parse_command önbelleğinden geçmez); bitişik yazımda
+    # kelime bölme önbelleği de boşaltılır (en kötü durum)
+    phrase = lambda: bc.tr_words(rng.randrange(1, 10**9))
+    res.append(bench("sayı ifadesi çözme", bc.parse_tr_words, 1, R * 10, setup=phrase, memory=mem))
+    def joined():
+        bc._tr_split.cache_clear()
+        return ["".join(bc.tr_words(rng.randrange(1, 10**6)))]
+    res.append(bench("sayı ifadesi çözme (bitişik, önbelleksiz)", bc.parse_tr_words, 1, R * 10, setup=joined, memory=mem))
+
+    # kaydet: 100 işlemlik çalışma alanı (yeni) ortak veriye + günlüğe yazılır
+    def filled():
+        w = bc.Workspace(S)
+        for _ in range(100): w.apply([int(rng.choice(refs))], rng.randrange(1, 5000), rng.choice(ops))
+        return w
+    res.append(bench("kaydet (100 işlem)", lambda w: w.commit(), 100, max(1, R // 3), setup=filled, memory=mem))
+    def batched():
+        w = bc.Workspace(S); m = rng.choice([m for m in mgr_names[1] if m in S.mgr_index.rows])
+        w.apply(refs[np.atleast_1d(S.mgr_index.rows[m])].tolist(), 50, ops[1])
+        return w
+    res.append(bench("kaydet (2. seviye toplu)", lambda w: w.commit(), 1, max(1, R // 3), setup=batched, memory=mem))
+
+    frame = lambda: bc.tl_frame(S.df)
+    res.append(bench("dışa aktar (csv)", lambda df: bc.to_bytes(df, "csv", "Sayfa1"), n, 3, setup=frame, memory=mem))
+    res.append(bench("dışa aktar (xlsx)", lambda df: bc.to_bytes(df, "xlsx", "Sayfa1"), n, 1, setup=frame, memory=mem))
+    res.append(bench("Excel'e kaydet (depo)", lambda df: bc.get_store().export_xlsx(df), n, 1, setup=frame, memory=mem))
+
+    if args.bolge:
+        # çoklu kaynak: soğuk (önbellek yok, paralel okuma), önbellekli ve tek dosya değiştiğinde birleştirme
+        src = os.path.join(workdir, f"bolgeler_{n}")
+        write_regions(src, rows, args.bolge); bc.use_sources(src)
+        cold = lambda: shutil.rmtree(bc._source_cache_dir(), ignore_errors=True)
+        def touch():
+            f = os.path.join(src, "bolge_01.xlsx"); t = os.path.getmtime(f) + 1; os.utime(f, (t, t))
+        k = args.bolge
+        res.append(bench(f"birleştir ({k} dosya, soğuk)", lambda _: bc.consolidate(src), n, 1, setup=cold, memory=mem))
+        res.append(bench(f"birleştir ({k} dosya, önbellekli)", lambda _: bc.consolidate(src), n, 3, memory=mem))
+        res.append(bench(f"birleştir (1/{k} dosya değişti)", lambda _: bc.consolidate(src), n, 1, setup=touch, memory=mem))
+    for r in res: r["çalışan"] = n
+    return res
+
+def report(res: list):
+    cols = ["aşama", "medyan_ms", "p95_ms", "adet/s", "rss_mb"] + (["tepe_ayırım_mb"] if any("tepe_ayırım_mb" in r for r in res) else [])
+    w = max(len(r["aşama"]) for r in res)
+    print(f"{cols[0]:<{w}}  " + "  ".join(f"{c:>14}" for c in cols[1:]))
+    for r in res:
+        print(f"{r['aşama']:<{w}}  " + "  ".join(f"{r.get(c, float('nan')):>14,.2f}" for c in cols[1:]), flush=True)
+
+def main(args):
+    sizes = args.calisan or [1000, 10000, 100000]
+    workdir = args.dizin or tempfile.mkdtemp(prefix="butce_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"depo={args.depo}  okuyucu={bc.XLSX_READER}  yazıcı={bc.XLSX_ENGINE}  python={sys.version.split()[0]}  dizin={workdir}")
+    out = []
+    try:
+        for n in sizes:
+            res = run_size(n, workdir, args); report(res); out += res
+    finally:
+        if not args.dizin: shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(out, f, ensure_ascii=False, indent=1)
+        print(f"\nsonuçlar: {args.json}")
+
+if __name__ == "__main__":
+    main(ARGS)
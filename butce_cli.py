@@ -0,0 +1,108 @@
+"""Dosyadan toplu bütçe işlemi (arayüzsüz).
+
+Girdi: PersonRef ya da isim, tutar ve işlem (ya da havuz + düş/ekle) kolonlu .csv/.xlsx tablo; veya her satırı
+bir Türkçe komut olan .txt ("sicil 12345 sistemden 500 tl düş", "Ahmet Yılmaz'a bütçe dışı bin lira ekle, ...").
+Komutlar uygulamadaki ayrıştırıcıyla çözülür, kişi başı tutarlarla vektörel uygulanır, işlem günlüğüne
+(İşlem Geçmişi) yazılır ve veri dosyası güncellenir — uygulamadaki İşlem Yap + Kaydet + Excel'e Aktar.
+
+    python butce_cli.py degisiklikler.xlsx
+    python butce_cli.py komutlar.txt --kuru --rapor plan.csv
+    python butce_cli.py liste.csv --veri "BÜTÇE ÇALIŞMAA.xlsx" --hepsi-ya-hic --gecmis bu_islem.xlsx
+    python butce_cli.py zamlar.csv --kaynak bolgeler/    # bölge dosyaları birleştirilerek (çıktı bolgeler_birlesik.xlsx)
+"""
+import argparse, os, sys, time, uuid
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Dosyadan toplu bütçe işlemi")
+    ap.add_argument("girdi", help=".csv/.xlsx değişiklik tablosu ya da .txt komut listesi")
+    ap.add_argument("--sayfa", help="girdi .xlsx ise sayfa adı (varsayılan ilk sayfa)")
+    ap.add_argument("--veri", help="bütçe çalışma dosyası (varsayılan uygulamanınki)")
+    ap.add_argument("--kaynak", help="bölge dosyaları klasörü ya da çok sayfalı çalışma kitabı (birleştirilir; BUTCE_KAYNAK)")
+    ap.add_argument("--depo", choices=["sqlite", "xlsx"], help="depo türü (varsayılan BUTCE_STORE ya da sqlite)")
+    ap.add_argument("--toplu", action="store_true", help="komut dosyasında yönetici toplu işlemlerine izin ver (uygulamada onay ister)")
+    ap.add_argument("--hepsi-ya-hic", action="store_true", help="çözülemeyen tek satır bile varsa hiçbir şey uygulama")
+    ap.add_argument("--kuru", action="store_true", help="sadece planla; uygulama, kaydetme ve dosya yazma yok")
+    ap.add_argument("--cikti", help="güncel veriyi bu .xlsx dosyasına yaz (varsayılan: veri dosyasının kendisi)")
+    ap.add_argument("--excel-yazma", action="store_true", help="veri dosyasını yazma (sadece depo + işlem günlüğü)")
+    ap.add_argument("--rapor", help="satır bazlı plan/sonuç raporu (.csv ya da .xlsx)")
+    ap.add_argument("--gecmis", help="bu çalıştırmanın işlem kayıtları (.csv ya da .xlsx)")
+    return ap.parse_args(argv)
+
+ARGS = parse_args() if __name__ == "__main__" else None
+if ARGS and ARGS.depo: os.environ["BUTCE_STORE"] = ARGS.depo  # get_store varsayılanı içe aktarımda okunur
+
+import numpy as np
+import pandas as pd
+import butce_core as bc
+
+def write_table(df: pd.DataFrame, path: str, sheet: str):
+    fmt = "xlsx" if path.lower().endswith((".xlsx", ".xlsm")) else "csv"
+    with open(path, "wb") as f: f.write(bc.to_bytes(df, fmt, sheet))
+
+def main(args) -> int:
+    t0 = time.perf_counter()
+    if args.veri: bc.use_workbook(args.veri)
+    if args.kaynak: bc.use_sources(args.kaynak)
+    S = bc.SharedState()
+    try: S.load()
+    except FileNotFoundError:
+        print(f"'{bc.SOURCE_PATH or bc.DEFAULT_EXCEL_PATH}' bulunamadı.", file=sys.stderr); return 2
+    t_load = time.perf_counter()
+
+    src = bc.read_batch_file(args.girdi, args.sayfa)
+    plan = bc.plan_sentences(S, src, args.toplu) if isinstance(src, list) else bc.plan_table(S, src, args.toplu)
+    ok = plan["sebep"] == ""
+    t_plan = time.perf_counter()
+    print(f"{bc.DEFAULT_EXCEL_PATH}: {len(S.df):,} kişi, yükleme {t_load - t0:.2f} sn")
+    if S.load_stats.get("yeniden_uygulanan"):
+        print(f"uyarı: kaynak değişmiş, yeniden içe aktarıldı; dosyaya aktarılmamış {S.load_stats['yeniden_uygulanan']} işlem yeniden uygulandı"
+              + (f" ({S.load_stats['uygulanamayan']} işlemin kişisi dosyada yok)" if S.load_stats.get("uygulanamayan") else ""))
+    if S.sources:
+        muk = {r["PersonRef"] for r in S.sources["mukerrer"]}
+        print(f"{bc.SOURCE_PATH}: {len(S.sources['kaynaklar'])} kaynak (son birleştirmede {S.sources['okunan']} yeniden okundu) · "
+              f"{len(muk)} mükerrer PersonRef ({S.sources['politika']})")
+        for k in S.sources["kaynaklar"]:
+            if k["durum"] not in ("okundu", "önbellek"): print(f"  {k['kaynak']}: {k['durum']}")
+    print(f"{args.girdi}: {len(plan):,} işlem satırı · {int(ok.sum()):,} çözüldü · {int((~ok).sum()):,} hata · plan {t_plan - t_load:.2f} sn")
+    for _, r in plan[~ok].head(20).iterrows(): print(f"  satır {r['satir']}: {r['sebep']}")
+    if (~ok).sum() > 20: print(f"  ... {int((~ok).sum()) - 20} hata daha (--rapor ile tamamı)")
+
+    plan["durum"] = np.where(ok, "planlandı", "hata")
+    code = 0 if ok.all() else 1
+    if args.kuru or not ok.any() or (args.hepsi_ya_hic and not ok.all()):
+        if args.hepsi_ya_hic and not ok.all(): print("--hepsi-ya-hic: hata olduğu için hiçbir işlem uygulanmadı.")
+        if args.rapor: write_table(plan, args.rapor, "Plan")
+        return code
+
+    # ---- uygula + kaydet (tek grup: geçmişte bu dosyanın işlemleri birlikte görünür) ----
+    group = uuid.uuid4().hex[:8]
+    ws = bc.Workspace(S); todo = plan[ok]
+    n_ok, fails, recs = ws.apply_rows(todo["PersonRef"].astype("int64"), todo["tutar"], todo["islem"], group)
+    t_apply = time.perf_counter()
+    saved, conflicts = ws.commit(origin="cli")
+    t_commit = time.perf_counter()
+    plan.loc[ok, "durum"] = "uygulandı"
+    if fails:  # planda çözülüp uygulamada reddedilenler (ör. kişi bu arada veriden çıktı): uygulandı sayılmaz
+        why = {int(float(r)): sebep for r, sebep in fails}
+        m = ok & plan["PersonRef"].isin(list(why))
+        plan.loc[m, "durum"] = "hata"; plan.loc[m, "sebep"] = plan.loc[m, "PersonRef"].map(why); code = 1
+    if conflicts:  # bu arada başkası aynı satırları kaydetti: o kişilerin işlemleri kaydedilmedi
+        bad = set(S.df["PersonRef"].iloc[conflicts].astype("int64").tolist())
+        plan.loc[ok & plan["PersonRef"].isin(bad), "durum"] = "çakışma (kaydedilmedi)"; code = 1
+    print(f"uygulandı: {n_ok:,} işlem, {len(saved):,} kişi kaydedildi · grup {group} · uygulama {t_apply - t_plan:.2f} sn, "
+          f"kaydet {t_commit - t_apply:.2f} sn" + (f" · {len(fails)} hata" if fails else "")
+          + (f" · {len(conflicts)} çakışma" if conflicts else ""))
+    for r, sebep in fails[:20]: print(f"  PersonRef {r}: {sebep}")
+
+    if not args.excel_yazma:
+        if args.cikti: bc.write_workbook(args.cikti, bc.get_store().full(bc.tl_frame(S.df)))
+        else: S.export_xlsx()
+        print(f"yazıldı: {args.cikti or bc.DEFAULT_EXCEL_PATH} ({time.perf_counter() - t_commit:.2f} sn)")
+    if args.rapor: write_table(plan, args.rapor, "Plan")
+    if args.gecmis:
+        write_table(pd.DataFrame(recs).drop(columns=["_kolon", "_deger"], errors="ignore"), args.gecmis, "Islem_Gecmisi")
+    print(f"toplam {time.perf_counter() - t0:.2f} sn · plan+uygulama+kaydet {len(plan) / max(t_commit - t_load, 1e-9):,.0f} satır/sn")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main(ARGS))
@@ -0,0 +1,1963 @@
+import pandas as pd
+import numpy as np
+import re, io, os, sys, time, json, hashlib, importlib.util, datetime as dt, unicodedata, difflib, sqlite3, threading, weakref
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from collections import deque
+from functools import lru_cache, wraps
+from typing import NamedTuple
+from collections.abc import MutableMapping
+
+# Bütçe uygulamasının Streamlit'ten bağımsız çekirdeği: ayrıştırıcı, içe aktarım, depo, günlük, indeksler,
+# ortak durum ve çalışma alanı işlemleri. butce_app.py (arayüz) ve butce_bench.py (ölçüm) bunu kullanır.
+
+# ================== AYAR ==================
+DEFAULT_EXCEL_PATH = "BÜTÇE ÇALIŞMAA.xlsx"
+# Çalışma deposu: "sqlite" (varsayılan; .xlsx sadece içe/dışa aktarım) ya da "xlsx" (her Kaydet'te tam yazım)
+STORE_BACKEND = os.environ.get("BUTCE_STORE", "sqlite").strip().lower()
+WORKSTORE_PATH = os.path.splitext(DEFAULT_EXCEL_PATH)[0] + ".sqlite"
+# İşlem günlüğü (append-only) + sıkıştırılmış kayıt arşivi + anlık görüntü durumu
+JOURNAL_PATH = os.path.splitext(DEFAULT_EXCEL_PATH)[0] + ".journal.jsonl"
+HISTORY_PATH = os.path.splitext(DEFAULT_EXCEL_PATH)[0] + ".history.jsonl"
+SNAPSHOT_STATE_PATH = os.path.splitext(DEFAULT_EXCEL_PATH)[0] + ".snapshot.json"
+JOURNAL_COMPACT_AT = 5000  # günlükte bu kadar kayıt birikince anlık görüntüye sıkıştır
+LOCK_PATH = os.path.splitext(DEFAULT_EXCEL_PATH)[0] + ".lock"  # süreçler arası yazma kilidi
+CHANGE_LOG_MAX = 1000      # oturumların çekebileceği son değişiklik kaydı sayısı
+# Bütçe kuralları (departman/kademe/yönetici bazlı çarpan ve tavan): varsayılan olarak veri dosyasının KURALLAR sayfası
+RULES_PATH = os.environ.get("BUTCE_RULES", "").strip() or DEFAULT_EXCEL_PATH
+RULES_SHEET = "KURALLAR"
+DEFAULT_MULTIPLIER = 1.4   # kural yoksa tavan = CurrentSalary * 1.4
+
+# Çoklu kaynak (bölge dosyaları): BUTCE_KAYNAK bir klasör (içindeki tüm çalışma kitapları) ya da çok sayfalı bir
+# çalışma kitabı; kaynaklar paralel okunup tek veri kümesinde birleştirilir (bkz. ÇOKLU KAYNAK). None: tek dosya.
+SOURCE_PATH = None
+SOURCE_DUP_POLICY = os.environ.get("BUTCE_MUKERRER", "yeni").strip().lower()  # aynı PersonRef birden çok kaynakta: "yeni" | "ilk" | "hepsi"
+SOURCE_WORKERS = int(os.environ.get("BUTCE_ISCI", "0") or 0)  # okuma süreç sayısı; 0: değişen kaynak ve çekirdek sayısına göre
+
+def use_workbook(path: str):
+    # veri dosyasını ve ona bağlı yolları değiştir (CLI / ölçüm); fonksiyonlar yolları çağrı anında okur
+    global DEFAULT_EXCEL_PATH, WORKSTORE_PATH, JOURNAL_PATH, HISTORY_PATH, SNAPSHOT_STATE_PATH, LOCK_PATH, RULES_PATH, SOURCE_PATH
+    stem = os.path.splitext(path)[0]
+    if RULES_PATH == DEFAULT_EXCEL_PATH: RULES_PATH = path
+    DEFAULT_EXCEL_PATH = path; SOURCE_PATH = None
+    WORKSTORE_PATH, JOURNAL_PATH, HISTORY_PATH = stem + ".sqlite", stem + ".journal.jsonl", stem + ".history.jsonl"
+    SNAPSHOT_STATE_PATH, LOCK_PATH = stem + ".snapshot.json", stem + ".lock"
+
+def use_sources(path: str):
+    # birleştirme modu: depo, günlük ve dışa aktarım "<ad>_birlesik.*" dosyalarında; kaynak dosyalara hiç yazılmaz.
+    # Kurallar klasördeki kurallar.csv / kurallar.xlsx'ten (yoksa birleşik dosyanın KURALLAR sayfasından)
+    global SOURCE_PATH, RULES_PATH
+    path = os.path.normpath(path)
+    use_workbook((os.path.splitext(path)[0] if os.path.isfile(path) else path) + "_birlesik.xlsx")
+    SOURCE_PATH = path
+    if os.path.isdir(path) and RULES_PATH == DEFAULT_EXCEL_PATH:
+        for name in ("kurallar.csv", "kurallar.xlsx"):
+            if os.path.exists(os.path.join(path, name)): RULES_PATH = os.path.join(path, name); break
+
+if os.environ.get("BUTCE_KAYNAK", "").strip(): use_sources(os.environ["BUTCE_KAYNAK"].strip())
+
+# İzleme (aşama süreleri, önbellek sayaçları, kopyalar) varsayılan kapalı; BUTCE_IZLEME=1 ile açık başlar
+TRACE_DEFAULT = os.environ.get("BUTCE_IZLEME", "").strip().lower() in {"1", "true", "evet", "on"}
+
+# ================== YARDIMCI ==================
+def _strip_accents(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+def _canon(s: str) -> str:
+    s = (s or "").strip().lower()
+    s = _strip_accents(s)
+    s = re.sub(r"[^a-z0-9çğıöşü]+", "", s)
+    return s
+
+def tl(x):
+    try: return f"{x:,.2f} TL".replace(",", "X").replace(".", ",").replace("X", ".")
+    except Exception: return f"{x} TL"
+
+def get_numeric(val, default=0.0):
+    try:
+        if pd.isna(val): return float(default)
+        return float(val)
+    except Exception: return float(default)
+
+# ==== İzleme (isteğe bağlı) ====
+# Kapalıyken traced/trace_span/trace_count sadece bir iş parçacığı yerel okuması. Açıkken o iş parçacığının
+# izine (Trace) yazılır: Streamlit bir çalıştırmayı tek iş parçacığında yürütür, yani bir iz = bir çalıştırma.
+_TRACE = threading.local()
+TRACE_LRU = ("_tr_split", "_parse_cached", "_split_cached")  # isabet/ıska sayılan lru_cache'ler (süreç geneli sayaç: eşzamanlı oturumlar da sayılır)
+
+def _lru_snapshot() -> dict:
+    return {n: tuple(globals()[n].cache_info()[:2]) for n in TRACE_LRU if n in globals()}
+
+class Trace:
+    def __init__(self, label: str = ""):
+        self.label = label; self.zaman = dt.datetime.now().isoformat(timespec="seconds")
+        self.t0 = time.perf_counter(); self.last = 0.0
+        self.ms = None; self.sonuc = None  # bitince toplam süre ve nasıl bittiği
+        self.spans = []     # [ad, başlangıç ms, süre ms, derinlik]; derinlik 0 = betik aşaması
+        self.counters = {}  # ad -> sayı
+        self.copies = []    # (yer, satır, MB)
+        self.depth = 0; self.stage = None  # açık aşama: [ad, başlangıç ms]
+        self._lru = _lru_snapshot()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def add(self, name, start, depth):
+        end = self.now(); self.last = max(self.last, end)
+        self.spans.append([name, start, end - start, depth])
+
+    def mark(self, name):
+        # sıralı betik aşamaları: açık aşamayı kapat, yenisini aç (None: sadece kapat)
+        if self.stage: self.add(self.stage[0], self.stage[1], 0)
+        self.stage = [name, self.now()] if name else None
+
+    def finish(self, sonuc: str = "tamam", cut: bool = False):
+        # cut: çalıştırma yarıda kesildi (st.rerun/st.stop) — süre son kaydedilen ana kadar sayılır
+        if self.ms is not None: return self
+        if self.stage and cut: self.spans.append([self.stage[0], self.stage[1], self.last - self.stage[1], 0]); self.stage = None
+        self.mark(None)
+        self.ms = self.last if cut else self.now(); self.sonuc = sonuc
+        for n, (h, m) in _lru_snapshot().items():
+            h0, m0 = self._lru.get(n, (0, 0))
+            if h > h0: self.counters[f"önbellek:{n}:isabet"] = h - h0
+            if m > m0: self.counters[f"önbellek:{n}:ıska"] = m - m0
+        return self
+
+    def records(self) -> list:
+        # düz kayıtlar (JSON/CSV dışa aktarımı)
+        base = {"iz": self.label, "zaman": self.zaman}
+        out = [dict(base, tur="aşama" if d == 0 else "adım", ad=n, baslangic_ms=round(t, 3), sure_ms=round(ms, 3), derinlik=d)
+               for n, t, ms, d in sorted(self.spans, key=lambda r: (r[1], r[3]))]
+        out += [dict(base, tur="sayaç", ad=k, deger=v) for k, v in sorted(self.counters.items())]
+        out += [dict(base, tur="kopya", ad=w, satir=r, mb=round(mb, 3)) for w, r, mb in self.copies]
+        out.append(dict(base, tur="toplam", ad=self.sonuc or "açık", sure_ms=round(self.ms if self.ms is not None else self.now(), 3)))
+        return out
+
+def current_trace():
+    tr = getattr(_TRACE, "trace", None)
+    return tr if tr is not None and tr.ms is None else None
+
+def trace_start(label: str = "") -> Trace:
+    _TRACE.trace = Trace(label)
+    return _TRACE.trace
+
+def trace_stop(sonuc: str = "tamam"):
+    tr = current_trace(); _TRACE.trace = None
+    return tr.finish(sonuc) if tr else None
+
+def trace_stage(name: str):
+    tr = current_trace()
+    if tr is not None: tr.mark(name)
+
+@contextmanager
+def trace_span(name: str):
+    tr = current_trace()
+    if tr is None: yield; return
+    tr.depth += 1; d = tr.depth; t = tr.now()
+    try: yield
+    finally:
+        tr.add(name, t, d); tr.depth -= 1
+
+def traced(name: str | None = None):
+    # fonksiyonu izde adım olarak ölç (ad verilmezse fonksiyonun nitelikli adı)
+    def deco(fn):
+        label = name or fn.__qualname__
+        @wraps(fn)
+        def wrap(*a, **k):
+            if current_trace() is None: return fn(*a, **k)
+            with trace_span(label): return fn(*a, **k)
+        return wrap
+    return deco
+
+def trace_count(name: str, n=1):
+    tr = current_trace()
+    if tr is not None: tr.counters[name] = tr.counters.get(name, 0) + n
+
+def trace_copy(where: str, df: pd.DataFrame) -> pd.DataFrame:
+    # yeni DataFrame kopyasını (yer, satır, MB) kaydet; df aynen döner
+    tr = current_trace()
+    if tr is not None:
+        mb = float(df.memory_usage(index=False).sum()) / 2**20
+        tr.copies.append((where, len(df), mb)); tr.counters["kopya:adet"] = tr.counters.get("kopya:adet", 0) + 1
+        tr.counters["kopya:mb"] = round(tr.counters.get("kopya:mb", 0) + mb, 3)
+    return df
+
+def trace_export(traces, fmt: str) -> bytes:
+    recs = [r for tr in traces for r in tr.records()]
+    if fmt == "json": return json.dumps(recs, ensure_ascii=False, indent=1).encode("utf-8")
+    return pd.DataFrame(recs).to_csv(index=False).encode("utf-8-sig")
+
+# ==== TR sayı kelimeleri ====
+# Tablo güdümlü Türkçe sayı çözümleyici: birler/onlar/yüz + bin/milyon/milyar grupları, "buçuk"/"yarım",
+# "virgül" ile ondalık, "lira ... kuruş", sıra sayısı karışması ("ikinci" -> 2) ve ASR'nin bitişik
+# yazdığı biçimler ("ikiyüzelli"). Aksansız yazımlar tablolarda ayrıca yer alır.
+TR1={"sıfır":0,"sifir":0,"bir":1,"bi":1,"iki":2,"üç":3,"uc":3,"dört":4,"dort":4,"beş":5,"bes":5,"altı":6,"alti":6,"yedi":7,"sekiz":8,"dokuz":9}
+TR10={"on":10,"yirmi":20,"otuz":30,"kırk":40,"kirk":40,"elli":50,"altmış":60,"altmis":60,"yetmiş":70,"yetmis":70,"seksen":80,"doksan":90}
+TRM={"yüz":100,"yuz":100,"bin":1000,"milyon":10**6,"milyar":10**9,"trilyon":10**12}
+TR_HALF={"buçuk":0.5,"bucuk":0.5,"yarım":0.5,"yarim":0.5}
+TR_DEC={"virgül","virgul","nokta"}
+TR_LIRA={"lira","tl","liralık","liralik"}
+TR_KURUS={"kuruş","kurus","krş","krs"}
+TR_CARD={**TR1, **TR10, **TRM}
+TR_DIGIT={v: w for w, v in reversed(TR1.items())}    # değer -> yazım (ilk, aksanlı biçim)
+TR_TENS={v // 10: w for w, v in reversed(TR10.items())}
+TR_SCALE={v: w for w, v in reversed(TRM.items())}
+
+def _tr_ordinal(w: str) -> str:
+    # sıra sayısı eki, ünlü uyumuyla: iki->ikinci, dört->dördüncü, altı->altıncı, alti->altinci
+    last = next((c for c in reversed(w) if c in "aeıioöuü"), "e")
+    h = {"a":"ı","ı":"ı","e":"i","i":"i","o":"u","u":"u","ö":"ü","ü":"ü"}[last]
+    if w.isascii(): h = {"ı":"i","ü":"u"}.get(h, h)
+    stem = w[:-1] + "d" if w.endswith("t") else w
+    return stem + "nc" + h if stem[-1] in "aeıioöuü" else stem + h + "nc" + h
+
+TR_ORD={_tr_ordinal(w): v for w, v in TR_CARD.items() if v}
+
+@lru_cache(maxsize=4096)
+def _tr_split(w: str) -> tuple:
+    # bitişik yazılmış sayı kelimelerini ayır ("binbeşyüz" -> bin, beş, yüz); ayrılamıyorsa ()
+    if w in TR_CARD or w in TR_ORD or w in TR_HALF: return (w,)
+    for k in range(len(w) - 1, 1, -1):
+        head = w[:k]
+        if head in TR_CARD:
+            tail = _tr_split(w[k:])
+            if tail: return (head,) + tail
+    return ()
+
+def tr_number_word(w: str) -> bool:
+    return bool(_tr_split(w) or _tr_split(tr_fold(w)))
+
+def tr_words(n: int) -> list:
+    # tam sayı -> Türkçe sayı kelimeleri ("yüz", "bin" önünde "bir" söylenmez); ters yön: test ve ölçüm
+    def grp(k):
+        h, r = divmod(k, 100); t, u = divmod(r, 10)
+        return ([] if not h else ["yüz"] if h == 1 else [TR_DIGIT[h], "yüz"]) + ([TR_TENS[t]] if t else []) + ([TR_DIGIT[u]] if u else [])
+    if n == 0: return ["sıfır"]
+    out = []
+    for v in (10**12, 10**9, 10**6, 1000):
+        q, n = divmod(n, v)
+        if q: out += ([] if q == 1 and v == 1000 else grp(q)) + [TR_SCALE[v]]
+    return out + grp(n)
+
+def parse_tr_words(words):
+    main=None              # "lira"dan önceki kısım
+    total=0; cur=0; last_mul=1; used=False
+    frac=None; zeros=0     # "virgül"den sonraki hane(ler)
+    for w in words:
+        w=tr_lower(str(w)).strip(".,'’")
+        if not w: continue
+        if not w[0].isdigit() and not _tr_split(w): w=tr_fold(w)  # "IKI"/"Iki" -> "ıkı": aksansız tablolardan
+        if w[0].isdigit():
+            v=_num_value(w)
+            if v is None or (used and cur and last_mul<1000): break
+            if frac is not None: frac+=v
+            else: cur+=v
+            used=True; continue
+        parts=_tr_split(w)
+        if parts:
+            for p in parts:
+                if p in TR_HALF:
+                    if cur or not total: cur+=TR_HALF[p]
+                    else: total+=last_mul*TR_HALF[p]
+                    continue
+                v=TR_CARD.get(p, TR_ORD.get(p))
+                if frac is not None:
+                    if v==0 and not frac: zeros+=1
+                    else: frac+=v
+                elif v>=1000:
+                    total+=(cur or 1)*v; cur=0; last_mul=v
+                elif v==100:
+                    cur=(cur or 1)*100; last_mul=100
+                else:
+                    cur+=v
+            used=True
+            if parts[-1] in TR_ORD: break   # sıra sayısı sayıyı bitirir
+        elif w in TR_DEC and used and frac is None:
+            frac=0
+        elif w in TR_LIRA and used and main is None:
+            main=total+cur+_tr_frac(frac, zeros); total=0; cur=0; frac=None; zeros=0; used=False
+        elif w in TR_KURUS and used:
+            return (main or 0)+(total+cur)/100
+        elif used or main is not None:
+            break
+    if main is not None: return main if main>0 else None
+    val=total+cur+_tr_frac(frac, zeros)
+    return val if used and val>0 else None
+
+def _tr_frac(frac, zeros):
+    return float("0." + "0"*zeros + str(int(frac))) if frac else 0.0
+
+# ==== Komut ayrıştırıcı (tek geçişli, önbellekli) ====
+# Cümle bir kez token'lara bölünür; her token sabit tablolardan sınıflandırılır. Sonuç metne göre
+# önbelleklenir (aynı cümle tekrar geldiğinde yeniden ayrıştırılmaz). Yönetici eşleşmesi veriye
+# bağlı olduğu için önbellek dışında, ManagerIndex üzerinden eklenir.
+_TR_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_TR_FOLD = str.maketrans("çğıöşü", "cgiosu")
+TOKEN_RE = re.compile(r"(?P<num>\d+(?:[.,]\d+)*)|(?P<word>[^\W\d_]+)")
+
+def tr_lower(s: str) -> str:
+    return unicodedata.normalize("NFC", (s or "").translate(_TR_LOWER).lower())
+
+def tr_fold(s: str) -> str:
+    return _strip_accents(tr_lower(s).translate(_TR_FOLD))
+
+# Katlanmış (aksansız) kök -> anlam; ekli biçimler ön ek ile yakalanır (düşür, çıkart, ekleyin...)
+CMD_ACTION = (("dus", "düş"), ("cikar", "düş"), ("eksilt", "düş"), ("azalt", "düş"),
+              ("ekle", "ekle"), ("arttir", "ekle"), ("artir", "ekle"), ("yukselt", "ekle"))
+CMD_DIS_RE = re.compile(r"^dis(i|in|ina|inda|indan|indaki)?$")   # dış / dışı / dışından ...
+CMD_REF_MARK = {"person", "personref", "ref", "sicil", "kisi", "kisinin", "no", "numara", "numarali"}
+CMD_REF_POST = {"numarali", "nolu", "sicilli"}   # "12345 numaralı kişi"
+CMD_UNIT = {"tl", "lira", "liralik"}
+CMD_TRIGGER = {"uygula", "onayla", "tamam"}
+CMD_TRIGGER2 = {("islem", "yap"), ("hemen", "uygula")}
+CMD_CONFIRM = {"onayla": "onay", "evet": "onay", "uygula": "onay", "tamam": "onay",
+               "iptal": "iptal", "hayir": "iptal", "vazgec": "iptal"}
+CMD_HISTORY = {"yinele": "ileri"}
+CMD_HISTORY2 = {("geri", "al"): "geri", ("ileri", "al"): "ileri", ("tekrar", "yap"): "ileri"}
+CMD_BATCH = {"hepsi", "hepsine", "hepsinin", "tamami", "tamamina"}
+CMD_BATCH2 = ("tum", "bagli", "calisan")   # "tüm bağlı(lar)", "tüm çalışan(lar)"
+CMD_NEG = {"degil"}   # "bütçe dışı değil": önceki havuz kelimesini olumsuzlar
+CMD_PERCENT = {"yuzde", "yuzdelik"}  # "yüzde on" / "%10": tutar TL değil, oran (desteklenmez)
+CMD_MIN_CONFIDENCE = 0.6   # altındaki komutlar otomatik uygulanmaz, onay istenir
+
+def _num_value(raw: str) -> float | None:
+    try: return float(raw.replace(".", "").replace(",", "."))
+    except ValueError: return None
+
+def _ref_like(toks, j) -> bool:
+    # PersonRef adayı rakam: en az 4 hane, sicil/ref işaretinin ardında (ASR'nin böldüğü "sicil 12 345"in ikinci
+    # parçası dahil) ya da "numaralı"nın önünde; sayı ifadesine girmez
+    kind, raw = toks[j]
+    if kind != "num" or not raw.isdigit(): return False
+    marked = lambda k: k >= 0 and tr_fold(toks[k][1]) in CMD_REF_MARK
+    return (len(raw) >= 4 or marked(j - 1) or (j + 1 < len(toks) and tr_fold(toks[j+1][1]) in CMD_REF_POST)
+            or (j > 0 and toks[j-1][0] == "num" and toks[j-1][1].isdigit() and len(toks[j-1][1]) < 4 and marked(j - 2)))
+
+def _tr_run_end(toks, i, money=True):
+    # i'den başlayan sayı ifadesinin bitişi: "iki milyon üç yüz bin", "3 bin 500", "yüz elli lira yirmi kuruş"
+    n = len(toks); j = i
+    while j < n:
+        kind, raw = toks[j]
+        after_num = j > i and toks[j-1][0] == "num"
+        if kind == "word" and tr_number_word(raw) and (not after_num or raw in TRM): j += 1
+        elif kind == "word" and raw in TR_DEC and j > i and j + 1 < n: j += 1
+        elif kind == "num" and not _ref_like(toks, j) and (j == i or TRM.get(toks[j-1][1], 0) >= 1000): j += 1
+        else: break
+    if not money: return j
+    if j < n and toks[j][1] in TR_KURUS: return j + 1
+    if j + 1 < n and toks[j][1] in TR_LIRA and (toks[j+1][0] == "num" or tr_number_word(toks[j+1][1])):
+        e = _tr_run_end(toks, j + 1, money=False)
+        if e < n and toks[e][1] in TR_KURUS: return e + 1
+    return j
+
+class Komut(NamedTuple):
+    text: str                  # küçük harfe çevrilmiş cümle
+    action: str | None         # "düş" | "ekle"
+    pool: str                  # "sistem" | "dis"
+    op: str | None             # OPS anahtarı
+    amount: float | None
+    personref: int | None
+    personref_digits: str | None
+    trigger: bool              # "işlem yap", "uygula" ...
+    batch: bool                # "tüm bağlılar", "hepsi" ...
+    confirm: str | None        # bekleyen toplu işlem için "onay" | "iptal"
+    history: str | None        # "geri" (geri al) | "ileri" (yinele)
+    manager: str | None        # küçük harfli yönetici adı (ManagerIndex.lower anahtarı)
+    conf: dict                 # alan -> güven (0..1)
+
+    @property
+    def confidence(self) -> float:
+        vals = [self.conf[k] for k in ("action", "amount", "personref", "pool") if k in self.conf]
+        return min(vals) if vals else 0.0
+
+def op_name(act: str | None, pool: str) -> str | None:
+    if not act: return None
+    if pool == "sistem":
+        return "Bütçeden Düş (Sistem Kalan)" if act == "düş" else "Bütçeye Ekle (Sistem Kalan)"
+    return "Bütçeden Düş (Bütçe Dışı Kalan)" if act == "düş" else "Bütçeye Ekle (Bütçe Dışı Kalan)"
+
+@lru_cache(maxsize=1024)
+def _parse_cached(text: str) -> Komut:
+    t = tr_lower(text)
+    toks = [(m.lastgroup, m.group()) for m in TOKEN_RE.finditer(t)]
+    folded = [tr_fold(v) if k == "word" else v for k, v in toks]
+    n = len(toks)
+    acts = []; pool = "sistem"; trigger = False; batch = False; confirm = None; history = None
+    neg = set()  # olumsuzlanan havuzlar ("sistemden değil", "bütçe dışı değil")
+    percent = "%" in t
+    nums = []    # (token indeksi, ham, değer, birimli mi, işaretli mi)
+    runs = []    # sayı ifadeleri: (başlangıç, bitiş, birimli mi)
+    i = 0
+    while i < n:
+        kind, raw = toks[i]; f = folded[i]
+        prev = folded[i-1] if i else ""
+        nxt = folded[i+1] if i + 1 < n else ""
+        if kind == "num" or tr_number_word(raw):
+            j = _tr_run_end(toks, i)
+            if kind == "word" or j > i + 1:
+                unit = any(v in TR_LIRA or v in TR_KURUS for _, v in toks[i:j]) or (j < n and folded[j] in CMD_UNIT)
+                runs.append((i, j, unit)); i = j; continue
+            nums.append((i, raw, _num_value(raw), nxt in CMD_UNIT, prev in CMD_REF_MARK or nxt in CMD_REF_POST))
+            i += 1; continue
+        for root, act in CMD_ACTION:
+            if f.startswith(root):
+                if act not in acts: acts.append(act)
+                break
+        if CMD_DIS_RE.match(f):
+            if nxt in CMD_NEG: neg.add("dis")
+            else: pool = "dis"
+        elif f.startswith("sistem") and nxt in CMD_NEG: neg.add("sistem")
+        if f in CMD_PERCENT: percent = True
+        if f in CMD_TRIGGER or (prev, f) in CMD_TRIGGER2: trigger = True
+        if f in CMD_BATCH or (prev == CMD_BATCH2[0] and f.startswith(CMD_BATCH2[1:])): batch = True
+        if confirm is None and f in CMD_CONFIRM: confirm = CMD_CONFIRM[f]
+        if history is None: history = CMD_HISTORY.get(f) or CMD_HISTORY2.get((prev, f))
+        i += 1
+
+    conf = {}
+    act = acts[0] if acts else None
+    if act: conf["action"] = 0.9 if len(acts) == 1 else 0.5
+    if neg:
+        # olumsuzlanan havuzun tersi seçilir; yine de otomatik uygulanmaz
+        if "dis" in neg: pool = "sistem"
+        elif "sistem" in neg: pool = "dis"
+        conf["pool"] = 0.4
+
+    # PersonRef: işaret kelimesinden sonraki sayı; ASR'nin böldüğü "12 345" birleştirilir.
+    pref = None; pdig = None; ref_idx = set()
+    for k, (idx, raw, val, unit, marked) in enumerate(nums):
+        if not marked or not raw.isdigit(): continue
+        d = raw; used = {idx}
+        if idx and folded[idx-1] in CMD_REF_MARK:
+            for idx2, raw2, _, _, _ in nums[k+1:]:
+                if len(d) >= 4 or idx2 != max(used) + 1 or not raw2.isdigit(): break
+                d += raw2; used.add(idx2)
+        else:
+            for idx2, raw2, _, _, _ in reversed(nums[:k]):
+                if len(d) >= 4 or idx2 != min(used) - 1 or not raw2.isdigit(): break
+                d = raw2 + d; used.add(idx2)
+        if len(d) >= 4:
+            pref, pdig, ref_idx = int(d), d, used; conf["personref"] = 0.95
+        break
+    if pref is None and len(nums) >= 2:
+        # işaretsiz: birimsiz, en az 4 haneli tam sayı (tutar ayrıca söylenmişse)
+        for idx, raw, val, unit, marked in nums:
+            if raw.isdigit() and len(raw) >= 4 and not unit:
+                pref, pdig, ref_idx = int(raw), raw, {idx}; conf["personref"] = 0.6
+                break
+
+    # Tutar: birimli rakam > birimli sayı ifadesi > kalan son rakam > son sayı ifadesi
+    amt = None
+    rest = [x for x in nums if x[0] not in ref_idx and x[2]]
+    unit_nums = [x for x in rest if x[3]]
+    unit_runs = [r for r in runs if r[2]]
+    if unit_nums:
+        amt = unit_nums[0][2]; conf["amount"] = 0.95
+    elif unit_runs:
+        a, b, _ = unit_runs[0]
+        amt = parse_tr_words([v for _, v in toks[a:b]]); conf["amount"] = 0.9
+    elif rest:
+        amt = rest[-1][2]; conf["amount"] = 0.7
+    elif runs:
+        a, b, _ = runs[-1]
+        amt = parse_tr_words([v for _, v in toks[a:b]]); conf["amount"] = 0.6
+    if not amt or amt <= 0:
+        amt = None; conf.pop("amount", None)
+    else:
+        amt = float(amt)
+    if percent:
+        # oran TL tutarı olarak uygulanmaz: tutar yok, komut belirsiz (kayıtlı tutara da düşülmez)
+        amt = None; conf["amount"] = 0.3
+
+    return Komut(t, act, pool, op_name(act, pool), amt, pref, pdig, trigger, batch, confirm, history, None, conf)
+
+def parse_command(text: str, mgr_index=None) -> Komut:
+    cmd = _parse_cached((text or "").strip())
+    if mgr_index is not None:
+        hit = mgr_index.find_in_text(cmd.text)
+        if hit: cmd = cmd._replace(manager=hit)
+    return cmd
+
+# Birleşik komut: "Ahmet'e 500 ekle, Ayşe'den 300 düş ve sicil 12345 bütçe dışı 200 düş"
+# Virgül (ondalık virgül hariç), noktalı virgül ve bağlaçlar cümleleri ayırır.
+CLAUSE_RE = re.compile(r"(?<!\d),|,(?!\d)|;|\b(?:ve|sonra|ardından|ardindan|ayrıca|ayrica)\b", re.I)
+
+@lru_cache(maxsize=256)
+def _split_cached(text: str) -> tuple:
+    parts = [p.strip() for p in CLAUSE_RE.split(text) if p and p.strip()]
+    cmds = tuple(_parse_cached(p) for p in parts)
+    # yalnız birden çok cümle kendi işlemini taşıyorsa birleşik sayılır; aksi halde tek komut
+    return cmds if sum(c.action is not None for c in cmds) >= 2 else (_parse_cached(text),)
+
+def parse_commands(text: str, mgr_index=None) -> list:
+    cmds = list(_split_cached((text or "").strip()))
+    if mgr_index is not None:
+        cmds = [c._replace(manager=mgr_index.find_in_text(c.text)) for c in cmds]
+    return cmds
+
+# ==== PersonRef / tutar çıkarımı (ayrıştırıcı üzerinden) ====
+def extract_personref(txt):
+    cmd = parse_command(txt)
+    return cmd.personref, cmd.personref_digits
+
+def extract_amount(txt, pref_digits=None):
+    # PersonRef rakamları ayrıştırıcıda tutar adaylarından zaten ayrılır
+    return parse_command(txt).amount
+
+# ==== Kolon şeması (içe aktarım + normalize ortak) ====
+# hedef kolon -> (eşanlamlılar, tip, varsayılan). Başlıkta önce tam ad, sonra kanonik ad, sonra eşanlamlılar aranır.
+IMPORT_SCHEMA = {
+    "PersonRef":               (["sicil","sicil no","person","employee id","id","ref","personref"], "num", pd.NA),
+    "CurrentSalary":           (["mevcut maaş","mevcut ucret","salary","maas"], "num", 0.0),
+    "NewSalary":               (["yeni maaş","yeni ucret","new salary"], "num", 0.0),
+    "BÜTÇE DIŞI TALEPLER İLE": (["butce disi","budget extra","ekstra"], "num", 0.0),
+    "DEPARTMAN":               (["departman","bölüm","bolum","department","birim"], "text", ""),
+    "KADEME":                  (["kademe","grade","derece","band","performancelevelname"], "text", ""),
+    "1.YÖNETİCİSİ": ([], "text", ""), "2.YÖNETİCİSİ": ([], "text", ""),
+    "3.YÖNETİCİSİ": ([], "text", ""), "4.YÖNETİCİSİ": ([], "text", ""),
+}
+SOURCE_COL = "_KAYNAK"  # birleştirilmiş kaynaklarda satırın geldiği dosya / sayfa
+NAME_FULL = {"adsoyad","adsoyadi","ad soyad","ad soyadi"}
+NAME_AD = {"ad","adi","isim"}
+NAME_SOYAD = {"soyad","soyadi"}
+
+def resolve_columns(header) -> dict:
+    # hedef -> kaynak kolon adı (bulunamayanlar yok)
+    header = list(header)
+    c2orig = {_canon(c): c for c in header}
+    out = {}
+    for name, (alts, _t, _d) in IMPORT_SCHEMA.items():
+        if name in header: out[name] = name; continue
+        for a in [name] + alts:
+            if _canon(a) in c2orig: out[name] = c2orig[_canon(a)]; break
+    return out
+
+def name_columns(header) -> list:
+    # ad-soyad kaynağı: tek "ad soyad" kolonu, yoksa ("ad", "soyad") çifti
+    for c in header:
+        if _canon(c) in NAME_FULL: return [c]
+    ad = [c for c in header if _canon(c) in NAME_AD]; soyad = [c for c in header if _canon(c) in NAME_SOYAD]
+    return [ad[-1], soyad[-1]] if ad and soyad else []
+
+def needed_columns(header) -> list:
+    # uygulamanın kullandığı kaynak kolonlar, başlık sırasıyla (gerisi yüklenmez)
+    want = set(resolve_columns(header).values()) | set(name_columns(header)) | {SOURCE_COL}
+    return [c for c in header if c in want]
+
+def import_dtypes(header) -> dict:
+    # kaynak kolon -> "num" | "text" (açık tip dönüşümü)
+    return {src: IMPORT_SCHEMA[name][1] for name, src in resolve_columns(header).items()}
+
+# ==== İsimden kişi bulma ====
+def build_fullname_columns(df: pd.DataFrame) -> pd.DataFrame:
+    out=df  # yerinde: normalize_all taze okunmuş kareyi verir
+    full = None
+    src = name_columns(out.columns)
+    if len(src) == 1:
+        full = out[src[0]].astype(str).fillna("").str.strip()
+    elif len(src) == 2:
+        full = (out[src[0]].astype(str).fillna("") + " " + out[src[1]].astype(str).fillna("")).str.strip()
+    out["FULLNAME"] = full if full is not None else ""
+    out["FULLNAME_NORM"]=out["FULLNAME"].astype(str).map(_canon)
+    return out
+
+@traced()
+def normalize_all(df_in: pd.DataFrame, rules=()) -> pd.DataFrame:
+    # yerinde çalışır (kopya yok): girdi depodan yeni okunmuş karedir
+    df = df_in
+    src = resolve_columns(df.columns)
+    df.rename(columns={s: n for n, s in src.items() if s != n}, inplace=True)
+    for name, (_alts, _t, default) in IMPORT_SCHEMA.items():
+        if name not in src: df[name] = default
+
+    for y in CATEGORY_COLS + ([SOURCE_COL] if SOURCE_COL in df.columns else []):
+        df[y] = df[y].fillna("").astype(str).astype("category")
+    df["PersonRef"] = pd.to_numeric(df["PersonRef"], errors="coerce").round().astype("Int64")
+    for c in BASE_MONEY_COLS:
+        df[c] = to_kurus(pd.to_numeric(df[c], errors="coerce"))
+    df = build_fullname_columns(df)
+    for c in ["FULLNAME","FULLNAME_NORM"]:
+        df[c] = df[c].astype(STR_DTYPE)
+
+    assign_rules(df, rules)
+    d = derive(*(num_at(df, c, slice(None)) for c in BASE_MONEY_COLS), rule=rule_at(df, slice(None)))
+    for k,c in enumerate(DERIVED_COLS):
+        df[c] = to_kurus(d[:,k])
+    return df
+
+# ==== Kompakt kolon düzeni ====
+# Ortak karede para kolonları kuruş cinsinden tamsayıdır (Int64, boş = <NA>): 1.4 çarpanı kuruşa tam yuvarlanır,
+# toplamlarda kayan nokta artığı birikmez. num_at/set_at TL ile konuşur; tablo, depo ve indirmeler tl_frame ile TL görür.
+# Yönetici/departman kolonları kategorik (birkaç yüz tekil ad, satır başına kod), isimler metin dtype'ında.
+BASE_MONEY_COLS = ["CurrentSalary","NewSalary","BÜTÇE DIŞI TALEPLER İLE"]
+DERIVED_COLS = ["KULLANILAN BÜTÇE DIŞI DAHİL","SİSTEM KALAN","BÜTÇE DIŞI KALAN"]
+MONEY_COLS = BASE_MONEY_COLS + DERIVED_COLS
+CATEGORY_COLS = ["1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ","DEPARTMAN","KADEME"]
+KURUS = 100
+STR_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else "str"
+
+def to_kurus(values):
+    # TL -> kuruş (en yakına yuvarlanır); NaN -> <NA>
+    return pd.array(np.round(np.asarray(values, dtype=float) * KURUS), dtype="Int64")
+
+def tl_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # dışa bakan görünüm: para kolonları TL (float), satır kuralı kolonları düşülür
+    out = df.assign(**{c: df[c].to_numpy(dtype=float, na_value=np.nan) / KURUS for c in MONEY_COLS if c in df.columns})
+    return trace_copy("tl_frame", out.drop(columns=[c for c in RULE_COLS if c in out.columns]))
+
+def set_at(df: pd.DataFrame, col: str, pos, values):
+    # konumlara TL değer yaz (para kolonları kuruşa çevrilir)
+    df.iloc[pos, df.columns.get_loc(col)] = to_kurus(values) if col in MONEY_COLS else values
+
+def frame_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 2**20
+
+# ==== Bütçe kuralları ====
+# Kural satırı: kapsam (departman / kademe / yönetici / *), değer, çarpan, tavan (TL). Çarpan ve tavan ayrı ayrı
+# çözülür; özelden genele: yönetici (1. seviye en yakın) > kademe > departman > * > DEFAULT_MULTIPLIER.
+# Her satırın sonucu gizli kolonlarda tutulur (_ÇARPAN: on binde, _TAVAN: kuruş, -1 = yok); derive bunları kullanır.
+class Kural(NamedTuple):
+    kapsam: str
+    deger: str
+    carpan: float | None
+    tavan: float | None
+
+RULE_COLS = ["_ÇARPAN", "_TAVAN"]
+RULE_SCOPES = {"departman": "DEPARTMAN", "bolum": "DEPARTMAN", "department": "DEPARTMAN",
+               "kademe": "KADEME", "grade": "KADEME", "derece": "KADEME",
+               "yonetici": "YÖNETİCİ", "manager": "YÖNETİCİ",
+               "*": "*", "tum": "*", "hepsi": "*", "varsayilan": "*", "default": "*"}
+RULE_HEADER = {"kapsam": "kapsam", "alan": "kapsam", "scope": "kapsam", "deger": "deger", "value": "deger", "ad": "deger",
+               "carpan": "carpan", "katsayi": "carpan", "multiplier": "carpan",
+               "tavan": "tavan", "ust sinir": "tavan", "cap": "tavan", "limit": "tavan"}
+
+def _rule_num(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)) or str(v).strip() == "": return None
+    return float(str(v).strip().replace(",", ".")) if isinstance(v, str) else float(v)
+
+@traced()
+def read_rules(path: str | None = None, sheet: str = RULES_SHEET):
+    # dönüş: (kurallar, hatalar); dosya/sayfa yoksa boş (varsayılan çarpan geçerli)
+    path = path or RULES_PATH
+    if not os.path.exists(path): return [], []
+    if path.lower().endswith(".csv"):
+        raw = pd.read_csv(path, dtype=object, keep_default_na=False)
+        rows = [list(raw.columns)] + raw.to_numpy().tolist()
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            if sheet not in wb.sheetnames: return [], []
+            rows = [list(r) for r in wb[sheet].iter_rows(values_only=True)]
+        finally:
+            wb.close()
+    if not rows: return [], []
+    idx = {RULE_HEADER[_canon(h)]: i for i, h in enumerate(rows[0]) if h is not None and _canon(h) in RULE_HEADER}
+    if "kapsam" not in idx or not ({"carpan", "tavan"} & set(idx)):
+        return [], [f"{sheet}: başlıkta 'Kapsam' ve 'Çarpan'/'Tavan' kolonları yok"]
+    rules, errs = [], []
+    for n, r in enumerate(rows[1:], 2):
+        get = lambda k: r[idx[k]] if k in idx and idx[k] < len(r) else None
+        if all(v is None or str(v).strip() == "" for v in r): continue
+        k = "" if get("kapsam") is None else str(get("kapsam")).strip()
+        kapsam = RULE_SCOPES.get(_canon(k) or k)
+        deger = "" if get("deger") is None else str(get("deger")).strip()
+        try: carpan, tavan = _rule_num(get("carpan")), _rule_num(get("tavan"))
+        except ValueError: errs.append(f"satır {n}: çarpan/tavan sayı değil"); continue
+        if kapsam is None: errs.append(f"satır {n}: bilinmeyen kapsam '{k}'"); continue
+        if kapsam != "*" and not deger: errs.append(f"satır {n}: değer boş"); continue
+        if carpan is None and tavan is None: errs.append(f"satır {n}: çarpan da tavan da yok"); continue
+        if (carpan is not None and carpan <= 0) or (tavan is not None and tavan < 0):
+            errs.append(f"satır {n}: çarpan > 0, tavan >= 0 olmalı"); continue
+        rules.append(Kural(kapsam, deger, carpan, tavan))
+    return rules, errs
+
+def _rule_lookup(ser: pd.Series, table: dict) -> np.ndarray:
+    # kolon değeri -> kural değeri (yoksa NaN); kategori başına bir kez çözülür, satırlara kodlarla yayılır
+    cat = ser if isinstance(ser.dtype, pd.CategoricalDtype) else ser.fillna("").astype(str).astype("category")
+    vals = np.array([table.get(tr_lower(str(c)).strip(), np.nan) for c in cat.cat.categories] + [np.nan], dtype=float)
+    return vals[cat.cat.codes.to_numpy()]  # kod -1 (boş) -> son eleman (NaN)
+
+@traced()
+def assign_rules(df: pd.DataFrame, rules):
+    # satır başına çarpan/tavanı vektörel çöz ve gizli kolonlara yaz (yerinde)
+    n = len(df); out = {}
+    for field, start in (("carpan", DEFAULT_MULTIPLIER), ("tavan", np.nan)):
+        arr = np.full(n, start, dtype=float)
+        tables = {}
+        for r in rules:
+            v = getattr(r, field)
+            if v is not None: tables.setdefault(r.kapsam, {})[tr_lower(r.deger).strip()] = v
+        if "*" in tables: arr[:] = list(tables["*"].values())[-1]
+        for scope, cols in (("DEPARTMAN", ["DEPARTMAN"]), ("KADEME", ["KADEME"]), ("YÖNETİCİ", MGR_COLS[::-1])):
+            for c in cols:
+                if scope in tables and c in df.columns:
+                    v = _rule_lookup(df[c], tables[scope]); arr = np.where(np.isnan(v), arr, v)
+        out[field] = arr
+    df["_ÇARPAN"] = np.round(out["carpan"] * 10000).astype(np.int64)
+    df["_TAVAN"] = np.where(np.isnan(out["tavan"]), -1, np.round(out["tavan"] * KURUS)).astype(np.int64)
+
+def rule_at(df: pd.DataFrame, pos):
+    # derive için (çarpan, tavan) dizileri; kural kolonu yoksa None (varsayılan çarpan)
+    if "_ÇARPAN" not in df.columns: return None
+    return df["_ÇARPAN"].to_numpy()[pos], df["_TAVAN"].to_numpy()[pos]
+
+# ==== PersonRef indeksi (PersonRef -> satır konumu) ====
+
+@traced()
+def build_ref_index(df: pd.DataFrame) -> dict:
+    ser = pd.to_numeric(df["PersonRef"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    pos = np.flatnonzero(~np.isnan(ser))
+    # ters sırayla doldur: aynı PersonRef birden çok satırdaysa ilk satır kazanır
+    return dict(zip(ser[pos][::-1].astype(np.int64).tolist(), pos[::-1].tolist()))
+
+@traced()
+def build_search_text(df: pd.DataFrame) -> np.ndarray:
+    # tablo araması için satır başına tek küçük harfli metin (PersonRef, ad, departman, yöneticiler, kaynak)
+    ref = pd.to_numeric(df["PersonRef"], errors="coerce")
+    parts = [ref.map(lambda v: "" if pd.isna(v) else str(int(v)))]
+    parts += [df[c].fillna("").astype(str) for c in ["FULLNAME","DEPARTMAN","1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ",SOURCE_COL] if c in df.columns]
+    return np.array([tr_lower(" ".join(t)) for t in zip(*(p.tolist() for p in parts))], dtype=object)
+
+def recompute_derived(df: pd.DataFrame, positions):
+    # sadece verilen satırların türetilen kolonlarını yeniden hesapla (yerinde)
+    # dönüş: satır başına (yeni - eski) fark matrisi, DERIVED_COLS sırasıyla (KPI toplamları için)
+    pos = np.asarray(positions, dtype=np.int64)
+    if pos.size == 0: return np.zeros((0, len(DERIVED_COLS)))
+    before = np.column_stack([num_at(df,c,pos) for c in DERIVED_COLS])
+    after = derive(num_at(df,"CurrentSalary",pos), num_at(df,"NewSalary",pos), num_at(df,"BÜTÇE DIŞI TALEPLER İLE",pos), rule_at(df,pos))
+    for k,c in enumerate(DERIVED_COLS):
+        set_at(df, c, pos, after[:,k])
+    return after - before
+
+def derive(cur, new, bd, rule=None) -> np.ndarray:
+    # türetilen kolonlar (DERIVED_COLS sırasıyla, TL), temel değerlerden; hesap kuruş tamsayısında:
+    # çarpan on binde (1.4 = 14000), yarım kuruş yukarı yuvarlanır; rule = rule_at(...) satır kuralları
+    c, n, b = (np.round(np.nan_to_num(np.asarray(x, dtype=float)) * KURUS).astype(np.int64) for x in (cur, new, bd))
+    if rule is None:
+        used = (c * round(DEFAULT_MULTIPLIER * 10000) + 5000) // 10000
+    else:
+        mult, cap = rule
+        used = (c * mult + 5000) // 10000
+        used = np.where(cap >= 0, np.minimum(used, cap), used)
+    return np.column_stack([used, used - n, used - b]) / KURUS
+
+def num_at(df: pd.DataFrame, col: str, pos) -> np.ndarray:
+    # NaN -> 0 (get_numeric'in vektörel karşılığı); para kolonları TL döner
+    vals = np.nan_to_num(pd.to_numeric(df[col].iloc[pos], errors="coerce").to_numpy(dtype=float, na_value=np.nan))
+    return vals / KURUS if col in MONEY_COLS else vals
+
+# ================== İÇE AKTARIM ==================
+# Çalışma kitabı akışla okunur: önce sadece başlık, sonra istenen kolonlar satır parçaları halinde (tüm sayfa
+# hiçbir zaman hücre nesneleriyle bellekte tutulmaz). python-calamine kuruluysa daha hızlı motor olarak kullanılır.
+try: import resource
+except ImportError: resource = None  # (Windows) tepe bellek raporlanmaz
+
+IMPORT_CHUNK_ROWS = 5000
+XLSX_READER = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+def _mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+def peak_rss_mb() -> float | None:
+    if resource is None: return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 / (1024 if sys.platform == "darwin" else 1)  # macOS bayt, Linux KB döner
+
+def sheet_names(path: str) -> list:
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try: return list(wb.sheetnames)
+    finally: wb.close()
+
+@traced()
+def write_workbook(path: str, df: pd.DataFrame):
+    # veri ilk sayfaya yazılır; dosyadaki diğer sayfalar (ör. KURALLAR) korunur
+    sheets = sheet_names(path) if os.path.exists(path) else []
+    if len(sheets) > 1:
+        with pd.ExcelWriter(path, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
+            df.to_excel(w, index=False, sheet_name=sheets[0])
+    else:
+        df.to_excel(path, index=False)
+
+def _dedupe_header(raw) -> list:
+    # pandas ile aynı adlar: boş başlık "Unnamed: i", tekrar eden "ad.1", "ad.2"
+    out = []; seen = {}
+    for i, c in enumerate(raw):
+        c = f"Unnamed: {i}" if c is None or str(c).strip() == "" else str(c)
+        n = seen.get(c, 0); seen[c] = n + 1
+        out.append(c if n == 0 else f"{c}.{n}")
+    return out
+
+def _sheet(wb, sheet=None):
+    return wb[sheet] if sheet else wb.worksheets[0]
+
+def sniff_header(path: str, sheet=None) -> list:
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return _dedupe_header(next(_sheet(wb, sheet).iter_rows(max_row=1, values_only=True), ()))
+    finally:
+        wb.close()
+
+# pd.read_excel'in varsayılan olarak boş saydığı metinler (eski yükleme ile aynı sonuç için)
+NA_TEXT = frozenset(["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                     "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"])
+
+def _cell(v):
+    return None if isinstance(v, str) and v in NA_TEXT else v
+
+def _chunk_frame(cols, buf, dtypes) -> pd.DataFrame:
+    part = pd.DataFrame({c: [_cell(v) for v in vals] for c, vals in zip(cols, buf)}, columns=cols)
+    for c in cols:
+        t = dtypes.get(c)
+        if t == "num": part[c] = pd.to_numeric(part[c], errors="coerce")
+        elif t == "text": part[c] = part[c].map(lambda v: v if isinstance(v, str) else str(v), na_action="ignore").astype(object)
+        else: part[c] = part[c].infer_objects()
+    return part
+
+def iter_workbook(path: str, columns=None, chunk_rows: int = IMPORT_CHUNK_ROWS, sheet=None):
+    # (columns=None: tüm kolonlar; sheet=None: ilk sayfa) -> DataFrame parçaları; sondaki tamamen boş satırlar atılır
+    header = sniff_header(path, sheet)
+    cols = header if columns is None else [c for c in header if c in set(columns)]
+    dtypes = import_dtypes(header)
+    if XLSX_READER == "calamine":
+        df = pd.read_excel(path, engine="calamine", usecols=cols, sheet_name=sheet or 0)
+        yield _chunk_frame(cols, [df[c].tolist() for c in cols], dtypes); return
+    import openpyxl
+    idx = [header.index(c) for c in cols]
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        buf = [[] for _ in idx]; blank = []  # blank: henüz bir dolu satırla kapanmamış boş satırlar
+        for r in _sheet(wb, sheet).iter_rows(min_row=2, values_only=True):
+            vals = [r[i] if i < len(r) else None for i in idx]
+            if not any(v is not None for v in r):
+                blank.append(vals); continue
+            for row in blank + [vals]:
+                for k, v in enumerate(row): buf[k].append(v)
+            blank = []
+            if buf and len(buf[0]) >= chunk_rows:
+                yield _chunk_frame(cols, buf, dtypes); buf = [[] for _ in idx]
+        if not buf or buf[0]: yield _chunk_frame(cols, buf, dtypes)
+    finally:
+        wb.close()
+
+@traced()
+def read_workbook(path: str, columns=None, sheet=None) -> pd.DataFrame:
+    parts = list(iter_workbook(path, columns, sheet=sheet))
+    if not parts: return pd.DataFrame(columns=list(columns or []))
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+def source_names(header, columns) -> list:
+    # çalışma kolonu -> kaynaktaki adı (PerformanceLevelName, Sicil No ...): kayıt ve dışa aktarım kaynağın başlığını korur
+    src = resolve_columns(header)
+    return [src.get(c, c) for c in map(str, columns)]
+
+def merge_columns(full: pd.DataFrame, df: pd.DataFrame, header=None) -> pd.DataFrame:
+    # tüm kolonlu kayıt + çalışma kolonları (aynı satır sırası); çalışma kolonları kaynak adlarıyla yazılır.
+    # header: kaynağın başlığı (full sadece ek kolonları taşıyorsa)
+    out = full.copy(deep=False)
+    for c, name in zip(df.columns, source_names(full.columns if header is None else header, df.columns)):
+        out[name] = df[c].to_numpy()
+    return trace_copy("merge_columns", out)
+
+# ================== ÇOKLU KAYNAK ==================
+# Bölge dosyaları tek veri kümesinde birleştirilir. Her kaynak (dosya ya da sayfa) ayrı süreçte okunur ve kendi
+# başlığına göre şemaya çevrilir (kolon takma adları, ad + soyad -> "AD SOYAD"), satırlar _KAYNAK ile işaretlenir.
+# Okunan kaynak mtime/boyutuyla önbelleğe (pickle) alınır: sonraki birleştirmede sadece değişen dosyalar okunur.
+# Birleşik küme SQLite deposuna içe aktarılır; normalize_all (takma adlar, tipler, kurallar) yüklemede bir kez çalışır.
+SOURCE_EXT = (".xlsx", ".xlsm", ".csv")
+
+def _source_files(path: str) -> list:
+    # klasörde (alt klasörler dahil) kaynak dosyalar; Excel kilit dosyaları (~$) ve kurallar dosyası hariç
+    if os.path.isfile(path): return [path]
+    return sorted(os.path.join(d, f) for d, _, fs in os.walk(path) for f in fs
+                  if f.lower().endswith(SOURCE_EXT) and not f.startswith(("~$", ".")) and os.path.join(d, f) != RULES_PATH)
+
+def _file_sig(path: str) -> list:
+    stt = os.stat(path)
+    return [stt.st_mtime, stt.st_size]
+
+def source_signature(path: str) -> str:
+    # kaynak kümesinin imzası (depo içe aktarım anahtarı): dosya listesi + mtime/boyut + mükerrer politikası
+    sig = [[os.path.relpath(f, path), *_file_sig(f)] for f in _source_files(path)] if os.path.exists(path) else []
+    return hashlib.md5(json.dumps([sig, SOURCE_DUP_POLICY]).encode()).hexdigest()
+
+def source_mtime(path: str) -> float:
+    return max([_file_sig(f)[0] for f in _source_files(path)] if os.path.exists(path) else [], default=0.0)
+
+def _source_cache_dir() -> str:
+    return os.path.splitext(WORKSTORE_PATH)[0] + ".kaynaklar"
+
+def _tr_num(s: pd.Series) -> pd.Series:
+    # metin sayılar: "1500.50", "1.500,50", "2.500 TL"
+    t = s.astype(str).str.strip().str.replace(r"\s*(TL|₺)$", "", regex=True)
+    tr = t.str.fullmatch(r"-?\d{1,3}(\.\d{3})+(,\d+)?|-?\d+,\d+")
+    t = t.where(~tr, t.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(t, errors="coerce")
+
+def read_source(path: str, sheet=None) -> pd.DataFrame:
+    if not path.lower().endswith(".csv"): return read_workbook(path, sheet=sheet)
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False, sep=None, engine="python", encoding="utf-8-sig")
+    df = _chunk_frame(list(raw.columns), [raw[c].tolist() for c in raw.columns], {})
+    for c, t in import_dtypes(df.columns).items():
+        if t == "num": df[c] = _tr_num(df[c].astype(object).where(df[c].notna(), ""))
+    return df
+
+def conform_source(df: pd.DataFrame, label: str) -> pd.DataFrame:
+    # kaynağın takma adlarını hedef adlara, ad kolonlarını tek "AD SOYAD"a çevir (kaynaklar farklı başlık kullanabilir)
+    src = resolve_columns(df.columns)
+    df = df.rename(columns={s: n for n, s in src.items() if s != n and n not in df.columns})
+    nm = name_columns(df.columns)
+    if len(nm) == 2:
+        df["AD SOYAD"] = (df[nm[0]].fillna("").astype(str) + " " + df[nm[1]].fillna("").astype(str)).str.strip()
+    elif nm and nm[0] != "AD SOYAD" and "AD SOYAD" not in df.columns:
+        df = df.rename(columns={nm[0]: "AD SOYAD"})
+    df[SOURCE_COL] = label
+    return df
+
+def _parse_source(job) -> dict:
+    # alt süreçte: kaynağı oku, şemaya çevir, önbelleğe yaz (büyük kare süreçler arasında taşınmaz)
+    path, sheet, label, out = job
+    try:
+        df = read_source(path, sheet)
+        if "PersonRef" not in resolve_columns(df.columns): return {"satir": 0, "durum": "atlandı (PersonRef kolonu yok)"}
+        conform_source(df, label).to_pickle(out + ".tmp", compression=None); os.replace(out + ".tmp", out)
+        return {"satir": len(df), "durum": "okundu"}
+    except Exception as e:
+        return {"satir": 0, "durum": f"hata: {e}"}
+
+def resolve_duplicates(df: pd.DataFrame, rank: dict, policy: str = SOURCE_DUP_POLICY):
+    # aynı PersonRef birden çok kaynakta: politikaya göre tek kaynak kalır ("yeni": en son değişen dosya, "ilk": sıradaki
+    # ilk kaynak; "hepsi": hiçbiri atılmaz, sadece raporlanır). Aynı kaynak içindeki tekrarlar olduğu gibi kalır.
+    ref = pd.to_numeric(df["PersonRef"], errors="coerce").to_numpy(dtype=float)
+    src = df[SOURCE_COL].astype(str)
+    g = pd.DataFrame({"ref": ref, "src": src.to_numpy(), "rank": src.map(rank).to_numpy()})
+    cross = (g.groupby("ref")["src"].transform("nunique").fillna(0) > 1).to_numpy()
+    best = g.groupby("ref")["rank"].transform("min").to_numpy()
+    drop = cross & (g["rank"].to_numpy() != best) if policy != "hepsi" else np.zeros(len(df), dtype=bool)
+    report = pd.DataFrame({"PersonRef": ref[cross].astype(np.int64), "kaynak": src.to_numpy()[cross],
+                           "durum": np.where(drop[cross], "atıldı", "kaldı")}).sort_values(["PersonRef", "durum"], kind="stable")
+    return df[~drop].reset_index(drop=True), report
+
+@traced()
+def consolidate(path: str) -> pd.DataFrame:
+    # kaynakları (değişenleri paralel) oku + birleştir + mükerrerleri çöz; rapor önbellek klasörüne yazılır
+    if not os.path.exists(path): raise FileNotFoundError(path)
+    t0 = time.perf_counter()
+    cdir = _source_cache_dir(); os.makedirs(cdir, exist_ok=True)
+    idx_path = os.path.join(cdir, "index.json")
+    try:
+        with open(idx_path, encoding="utf-8") as f: idx = json.load(f)
+    except (OSError, ValueError): idx = {}
+    root = path if os.path.isdir(path) else os.path.dirname(path)
+    files, parts, jobs = {}, {}, []
+    for f in _source_files(path):
+        sig = _file_sig(f); ent = idx.get("dosyalar", {}).get(f)
+        if not ent or ent["sig"] != sig:  # sayfa listesi de sadece değişen dosyada yeniden okunur
+            ent = {"sig": sig, "sayfalar": [None] if f.lower().endswith(".csv") else [s for s in sheet_names(f) if s != RULES_SHEET]}
+        files[f] = ent
+        for sh in ent["sayfalar"]:
+            key = hashlib.md5(json.dumps([f, sh]).encode()).hexdigest()
+            label = (sh if f == path else os.path.relpath(f, root) + (f" / {sh}" if sh and len(ent["sayfalar"]) > 1 else ""))
+            out = os.path.join(cdir, key + ".pkl"); old = idx.get("kaynaklar", {}).get(key)
+            parts[key] = dict(kaynak=label, dosya=f, sayfa=sh, degisim=sig[0], _out=out)
+            if old and old["sig"] == sig and (old["satir"] == 0 or os.path.exists(out)):
+                parts[key].update(satir=old["satir"], durum="önbellek" if old["satir"] else old["durum"])
+            else: jobs.append((key, (f, sh, label, out)))
+    n = min(len(jobs), SOURCE_WORKERS or os.cpu_count() or 1)
+    if n > 1:
+        # spawn: Streamlit sunucusu çok iş parçacıklı, fork güvenli değil; alt süreç sadece butce_core'u yükler
+        with trace_span(f"kaynak oku ×{n} süreç"), ProcessPoolExecutor(n, mp_context=mp.get_context("spawn")) as ex:
+            for (key, _), res in zip(jobs, ex.map(_parse_source, [j for _, j in jobs])): parts[key].update(res)
+    else:
+        for key, job in jobs: parts[key].update(_parse_source(job))
+    ok = [p for p in parts.values() if p["satir"]]
+    frames = [pd.read_pickle(p["_out"], compression=None) for p in ok]
+    merged = pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame(columns=["PersonRef", SOURCE_COL])
+    order = sorted(ok, key=lambda p: -p["degisim"]) if SOURCE_DUP_POLICY == "yeni" else ok
+    merged, dups = resolve_duplicates(merged, {p["kaynak"]: k for k, p in enumerate(order)})
+    kalan = merged[SOURCE_COL].value_counts()
+    for p in parts.values(): p["satir_kalan"] = int(kalan.get(p["kaynak"], 0))
+    _write_atomic(idx_path, json.dumps({
+        "dosyalar": files,
+        "kaynaklar": {k: {"sig": files[p["dosya"]]["sig"], "satir": p["satir"], "durum": p["durum"]} for k, p in parts.items()},
+        "rapor": {"zaman": dt.datetime.now().isoformat(timespec="seconds"), "kaynak": path, "politika": SOURCE_DUP_POLICY,
+                  "okunan": len(jobs), "sure": round(time.perf_counter() - t0, 3), "surec": max(n, 1),
+                  "kaynaklar": [{k: v for k, v in p.items() if k != "_out"} for p in parts.values()],
+                  "mukerrer": dups.to_dict("records")},
+    }, ensure_ascii=False, default=int))
+    for key in set(idx.get("kaynaklar", {})) - set(parts):  # kaldırılan kaynakların önbelleği
+        try: os.remove(os.path.join(cdir, key + ".pkl"))
+        except OSError: pass
+    return merged
+
+def source_report() -> dict | None:
+    # son birleştirmenin raporu (kaynak başına satır/durum, mükerrer PersonRef'ler); tek dosya modunda None
+    if not SOURCE_PATH: return None
+    try:
+        with open(os.path.join(_source_cache_dir(), "index.json"), encoding="utf-8") as f: return json.load(f).get("rapor")
+    except (OSError, ValueError): return None
+
+# ================== DEPOLAMA ==================
+# Depolar: header() kolon adları, load(columns) sadece istenen kolonlar, save(df, rows) df'in kolonlarını yazar
+# (depodaki diğer kolonlar korunur), full(df) tüm kolonlu görünüm (dışa aktarım).
+
+class ExcelStore:
+    # eski davranış: .xlsx hem kaynak hem hedef; her kayıtta dosya baştan yazılır
+    name = "xlsx"
+    def __init__(self, xlsx_path: str):
+        self.xlsx_path = xlsx_path
+    def version(self) -> float:
+        return _mtime(self.xlsx_path)
+    def header(self) -> list:
+        return sniff_header(self.xlsx_path)
+    @traced()
+    def load(self, columns=None) -> pd.DataFrame:
+        return read_workbook(self.xlsx_path, columns)
+    def full(self, df: pd.DataFrame) -> pd.DataFrame:
+        return merge_columns(self.load(), df)
+    @traced()
+    def save(self, df: pd.DataFrame, rows=None):
+        write_workbook(self.xlsx_path, self.full(df))
+    def export_xlsx(self, df: pd.DataFrame):
+        self.save(df)
+
+def _sql_val(v):
+    if v is None or v is pd.NA or v is pd.NaT: return None
+    if isinstance(v, float) and np.isnan(v): return None
+    if isinstance(v, np.generic): return None if pd.isna(v) else v.item()
+    if isinstance(v, (pd.Timestamp, dt.datetime, dt.date)): return str(v)
+    return v
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+class SQLiteStore:
+    # çalışma deposu: satır konumu (_row) anahtarlı tek tablo; Kaydet sadece değişen satırları günceller.
+    # .xlsx sadece içe aktarım (dosya değişince yeniden alınır) ve "Excel'e Aktar" ile dışa aktarım içindir.
+    name = "sqlite"
+    TABLE = "veri"
+    def __init__(self, db_path: str, xlsx_path: str, source: str | None = None):
+        # source: birleştirilen klasör / çok sayfalı dosya (ÇOKLU KAYNAK); xlsx_path o zaman sadece dışa aktarım hedefi
+        self.db_path = db_path; self.xlsx_path = xlsx_path; self.source = source
+
+    def _source_sig(self) -> str:
+        return source_signature(self.source) if self.source else repr(_mtime(self.xlsx_path))
+
+    def _con(self):
+        return sqlite3.connect(self.db_path)
+
+    def _meta(self, con, key, default=None):
+        con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        r = con.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return r[0] if r else default
+
+    def _set_meta(self, con, key, value):
+        con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def needs_import(self) -> bool:
+        if not os.path.exists(self.db_path): return True
+        with self._con() as con:
+            has = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (self.TABLE,)).fetchone()
+            return not has or self._meta(con, "xlsx_mtime") != self._source_sig()
+
+    def version(self) -> float:
+        # içe aktarım gerekiyorsa kaynağın, değilse deponun zamanı (önbellek anahtarı)
+        if not self.needs_import(): return _mtime(self.db_path)
+        return source_mtime(self.source) if self.source else _mtime(self.xlsx_path)
+
+    def _write_full(self, df: pd.DataFrame, first: bool = True):
+        out = df.reset_index(drop=True)
+        # karışık tipli kolonlar tipsiz (NONE affinity) tutulur: sayı sayı, metin metin kalır
+        loose = {c: "" for c in out.columns if out[c].dtype == object}
+        with self._con() as con:
+            if first:
+                out.to_sql(self.TABLE, con, if_exists="replace", index=True, index_label="_row", dtype=loose)
+                con.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{self.TABLE}_row ON {self.TABLE}(_row)")
+            else:
+                start = con.execute(f"SELECT COALESCE(MAX(_row)+1, 0) FROM {self.TABLE}").fetchone()[0]
+                out.index = range(start, start + len(out))
+                out.to_sql(self.TABLE, con, if_exists="append", index=True, index_label="_row")
+            self._set_meta(con, "xlsx_mtime", self._source_sig())
+
+    def _ensure_import(self):
+        # .xlsx değiştiyse parça parça (akışla) yeniden içe aktar: tüm sayfa bir kerede belleğe alınmaz.
+        # Çoklu kaynakta birleşik küme tek parça (kaynaklar zaten ayrı ayrı okunup önbelleğe alınır)
+        if not self.needs_import(): return
+        for k, part in enumerate([consolidate(self.source)] if self.source else iter_workbook(self.xlsx_path)):
+            self._write_full(part, first=(k == 0))
+
+    def _columns(self) -> list:
+        with self._con() as con:
+            return [r[1] for r in con.execute(f"PRAGMA table_info({self.TABLE})").fetchall()]
+
+    def header(self) -> list:
+        self._ensure_import()
+        return [c for c in self._columns() if c != "_row"]
+
+    @traced()
+    def load(self, columns=None) -> pd.DataFrame:
+        self._ensure_import()
+        sel = "*" if columns is None else ", ".join(["_row"] + [_q(c) for c in columns])
+        with self._con() as con:
+            df = pd.read_sql(f"SELECT {sel} FROM {self.TABLE} ORDER BY _row", con)
+        return df.drop(columns=["_row"])
+
+    def full(self, df: pd.DataFrame) -> pd.DataFrame:
+        return merge_columns(self.load(), df)
+
+    @traced()
+    def save(self, df: pd.DataFrame, rows=None):
+        cols = self._columns()
+        if not cols:
+            self._write_full(df); return
+        names = source_names([c for c in cols if c != "_row"], df.columns)
+        missing = [c for c in names if c not in cols]
+        if missing:  # çalışma kolonlarından depoda olmayanlar eklenir ve tüm satırlar yazılır
+            with self._con() as con:
+                for c in missing: con.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN {_q(c)}")
+            rows = None
+        rows = list(range(len(df))) if rows is None else sorted(set(int(r) for r in rows))
+        if not rows: return
+        sub = df.iloc[rows]
+        data = [[_sql_val(v) for v in vals] + [r] for vals, r in zip(sub.to_numpy(dtype=object).tolist(), rows)]
+        sets = ", ".join(f"{_q(c)}=?" for c in names)
+        with self._con() as con:
+            con.executemany(f"UPDATE {self.TABLE} SET {sets} WHERE _row=?", data)
+
+    def export_xlsx(self, df: pd.DataFrame):
+        write_workbook(self.xlsx_path, self.full(df))
+        with self._con() as con:  # kendi dışa aktarımımız yeniden içe aktarımı tetiklemesin
+            self._set_meta(con, "xlsx_mtime", self._source_sig())
+
+def get_store(backend: str = STORE_BACKEND):
+    # çoklu kaynak her zaman SQLite deposunda (kaynak dosyalar geri yazılmaz)
+    if backend == "xlsx" and not SOURCE_PATH: return ExcelStore(DEFAULT_EXCEL_PATH)
+    return SQLiteStore(WORKSTORE_PATH, DEFAULT_EXCEL_PATH, SOURCE_PATH)
+
+# ==== İşlem günlüğü ====
+# Her kayıt bugünkü denetim kaydının alanları + "seq" + yeniden oynatma için "_kolon"/"_deger" (mutlak yeni değer).
+# Mutlak değer yazıldığı için yeniden oynatma idempotenttir: yarıda kalan sıkıştırma tekrar oynatılabilir.
+def _write_atomic(path: str, text: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _read_jsonl(path: str) -> list:
+    out = []
+    if not os.path.exists(path): return out
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try: out.append(json.loads(line))
+            except ValueError: pass  # çökme sonrası yarım kalmış son satır
+    return out
+
+# Günlük sonu (son seq, kayıt sayısı) süreç içinde tutulur: dosya sadece sona eklendiği için son okunan boyuttan
+# sonrası okunur (Kaydet günlük boyutundan bağımsız). Sıkıştırma dosyayı değiştirir (yeni inode, yeni snapshot_seq):
+# baştan okunur.
+_JOURNAL_TAIL = {}  # yol -> {"key": (inode, snapshot_seq), "size", "seq", "n"}
+
+class Journal:
+    def __init__(self, path: str, archive_path: str, state_path: str):
+        self.path = path; self.archive_path = archive_path; self.state_path = state_path
+
+    def version(self):
+        if not os.path.exists(self.path): return (0, 0.0)
+        stt = os.stat(self.path)
+        return (stt.st_size, stt.st_mtime)
+
+    def _state(self) -> dict:
+        # {"snapshot_seq": depoya işlenen son kayıt, "exported_seq": .xlsx'e yazılan son kayıt}
+        try:
+            with open(self.state_path, encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError): return {}
+
+    def _set_state(self, **kw):
+        _write_atomic(self.state_path, json.dumps({**self._state(), **kw}))
+
+    def snapshot_seq(self) -> int:
+        return int(self._state().get("snapshot_seq", 0))
+
+    def exported_seq(self) -> int:
+        return int(self._state().get("exported_seq", 0))
+
+    def mark_exported(self, seq: int):
+        self._set_state(exported_seq=int(seq))
+
+    def records(self, after_seq: int = 0) -> list:
+        return [r for r in _read_jsonl(self.path) if int(r.get("seq", 0)) > after_seq]
+
+    def records_since(self, seq: int) -> list:
+        # arada başka bir süreç sıkıştırma yaptıysa kayıtlar arşive taşınmıştır
+        if seq < self.snapshot_seq():
+            return [r for r in self.history() if int(r.get("seq", 0)) > seq]
+        return self.records(after_seq=seq)
+
+    def _tail(self) -> dict:
+        try: stt = os.stat(self.path)
+        except OSError: return {"seq": 0, "n": 0}
+        key = (stt.st_ino, self.snapshot_seq()); c = dict(_JOURNAL_TAIL.get(self.path) or {})
+        if c.get("key") != key or stt.st_size < c["size"]:
+            c = {"key": key, "size": 0, "seq": 0, "n": 0}
+        if stt.st_size > c["size"]:
+            with open(self.path, "rb") as f:
+                f.seek(c["size"]); chunk = f.read(stt.st_size - c["size"])
+            end = chunk.rfind(b"\n") + 1  # yarım son satır (çökme artığı) tamamlanınca okunur
+            for line in chunk[:end].decode("utf-8", errors="replace").splitlines():
+                try: r = json.loads(line)
+                except ValueError: continue
+                c["seq"] = max(c["seq"], int(r.get("seq", 0))); c["n"] += 1
+            c["size"] += end
+        _JOURNAL_TAIL[self.path] = c
+        return c
+
+    def last_seq(self) -> int:
+        return max(self._tail()["seq"], self.snapshot_seq())
+
+    def pending(self) -> int:
+        # günlükte (henüz sıkıştırılmamış) kayıt sayısı
+        return self._tail()["n"]
+
+    @traced()
+    def append(self, recs: list) -> int:
+        # tek yazım + tek fsync (grup kaydı)
+        if not recs: return self.last_seq()
+        seq = self.last_seq()
+        lines = []
+        for r in recs:
+            seq += 1
+            lines.append(json.dumps({"seq": seq, **r}, ensure_ascii=False))
+        needs_nl = os.path.exists(self.path) and os.path.getsize(self.path) > 0 and not self._ends_with_newline()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(("\n" if needs_nl else "") + "\n".join(lines) + "\n")
+            f.flush(); os.fsync(f.fileno())
+        return seq
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END); return f.read(1) == b"\n"
+
+    def history(self) -> list:
+        # yarıda kalan sıkıştırma bir kaydı hem arşivde hem günlükte (ya da arşivde iki kez) bırakabilir: seq başına ilki
+        seen = set(); out = []
+        for r in _read_jsonl(self.archive_path) + _read_jsonl(self.path):
+            s = int(r.get("seq", 0))
+            if s not in seen: seen.add(s); out.append(r)
+        return out
+
+    @traced()
+    def compact(self, store, df: pd.DataFrame):
+        # günlüğü anlık görüntüye (depoya) işle; kayıtlar arşive taşınır, günlük boşaltılır
+        recs = self.records(after_seq=self.snapshot_seq())
+        if not recs: return
+        idx = build_ref_index(df)
+        rows = {idx[int(r["PersonRef"])] for r in recs if int(r["PersonRef"]) in idx}
+        store.save(df, rows=rows)
+        last = max(int(r["seq"]) for r in recs)
+        # sıra: arşiv -> durum -> günlük. Arada çökme kaydı kaybettirmez, en fazla tekrarlar (history tekilleştirir)
+        with open(self.archive_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs))
+            f.flush(); os.fsync(f.fileno())
+        self._set_state(snapshot_seq=last)
+        _write_atomic(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.records(after_seq=last)))
+
+def get_journal() -> Journal:
+    return Journal(JOURNAL_PATH, HISTORY_PATH, SNAPSHOT_STATE_PATH)
+
+def journal_writes(ref_index: dict, columns, recs: list) -> dict:
+    # kayıtları PersonRef bazında (son değer kazanır) kolon -> (konumlar, değerler) yazımlarına çevir
+    last = {}
+    for r in recs:
+        p = ref_index.get(int(r.get("PersonRef", -1)))
+        if p is not None and r.get("_kolon") in columns: last[(r["_kolon"], p)] = r.get("_deger")
+    out = {}
+    for (c, p), v in last.items():
+        ps, vs = out.setdefault(c, ([], []))
+        ps.append(p); vs.append(np.nan if v is None else float(v))
+    return out
+
+def replay_journal(df: pd.DataFrame, recs: list):
+    # kayıtları anlık görüntünün üzerine uygula
+    if not recs: return
+    touched = set()
+    for col, (ps, vs) in journal_writes(build_ref_index(df), df.columns, recs).items():
+        set_at(df, col, ps, vs); touched.update(ps)
+    recompute_derived(df, sorted(touched))
+
+@traced()
+def load_normalized(backend: str, stats: dict | None = None, rules=()) -> pd.DataFrame:
+    # şema eşleme + tip dönüşümü yüklemede bir kez (ortak durum tek kopya tutar; ayrıca önbellek yok)
+    # sadece uygulamanın kullandığı kolonlar okunur; diğerleri depoda kalır, dışa aktarımda geri birleştirilir
+    store = get_store(backend)
+    reimport = store.name == "sqlite" and store.needs_import()
+    if stats is not None:
+        stats["okuyucu"] = (("birleştirme" if store.source else XLSX_READER) if store.name == "sqlite" and store.needs_import()
+                            else XLSX_READER if store.name == "xlsx" else store.name)
+    hdr = store.header(); cols = needed_columns(hdr)
+    df = normalize_all(store.load(cols), rules)
+    if stats is not None: stats["kolon"] = f"{len(cols)}/{len(hdr)}"
+    j = get_journal(); snap = j.snapshot_seq()
+    if reimport:
+        # kaynak değişti (ya da depo yeni): depoya işlenmiş ama .xlsx'e yazılmamış işlemler yeni içe aktarımda yok.
+        # Arşivden yeniden uygulanır ve depoya yazılır (mutlak değer: dosyada zaten olanlar için etkisiz).
+        # Çoklu kaynakta kaynak dosyalara hiç yazılmadığı için tüm geçmiş uygulanır.
+        old = [r for r in j.records_since(0 if store.source else j.exported_seq()) if int(r.get("seq", 0)) <= snap]
+        if old:
+            idx = build_ref_index(df)
+            rows = {idx[int(r["PersonRef"])] for r in old if int(r["PersonRef"]) in idx}
+            replay_journal(df, old)
+            store.save(tl_frame(df), rows=rows)
+            if stats is not None:
+                stats["yeniden_uygulanan"] = len(old)
+                stats["uygulanamayan"] = sum(int(r["PersonRef"]) not in idx for r in old)
+    replay_journal(df, j.records(after_seq=snap))
+    return df
+
+def load_history(version) -> list:
+    # version sadece önbellek anahtarı (history_frame önbelleğe alır)
+    return get_journal().history()
+
+# ==== İsim indeksi (Aho–Corasick + yaklaşık eşleşme) ====
+class AhoCorasick:
+    # desen -> değer; longest(metin) metinde geçen en uzun deseni metin uzunluğuyla orantılı sürede bulur
+    def __init__(self, items):
+        self.goto=[{}]; self.fail=[0]; self.out=[None]  # out: bu düğümde biten en uzun (uzunluk, değer)
+        for pat, val in items:
+            if not pat: continue
+            n=0
+            for ch in pat:
+                nxt=self.goto[n].get(ch)
+                if nxt is None:
+                    nxt=len(self.goto); self.goto[n][ch]=nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append(None)
+                n=nxt
+            if self.out[n] is None: self.out[n]=(len(pat), val)  # aynı desende ilk gelen kazanır
+        q=deque(self.goto[0].values())
+        while q:
+            u=q.popleft()
+            for ch,v in self.goto[u].items():
+                q.append(v)
+                f=self.fail[u]
+                while f and ch not in self.goto[f]: f=self.fail[f]
+                self.fail[v]=self.goto[f].get(ch,0) if u else 0
+                if self.out[v] is None: self.out[v]=self.out[self.fail[v]]
+
+    def longest(self, text: str):
+        n=0; best=None
+        for ch in text:
+            while n and ch not in self.goto[n]: n=self.fail[n]
+            n=self.goto[n].get(ch,0)
+            o=self.out[n]
+            if o and (best is None or o[0]>best[0]): best=o
+        return best[1] if best else None
+
+class NameIndex:
+    # veri yüklemesinde bir kez kurulur: tam ad (FULLNAME_NORM) otomatı + kelime -> satır sözlüğü
+    @traced()
+    def __init__(self, df: pd.DataFrame):
+        ser_ref=pd.to_numeric(df["PersonRef"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        names=df["FULLNAME"].fillna("").astype(str).tolist() if "FULLNAME" in df.columns else [""]*len(df)
+        norms=df["FULLNAME_NORM"].fillna("").astype(str).tolist() if "FULLNAME_NORM" in df.columns else [""]*len(df)
+        self.people=[]  # (ref, ad, [kelimeler])
+        self.by_token={}
+        items=[]
+        for r,fn,fnn in zip(ser_ref, names, norms):
+            if not fnn or np.isnan(r): continue
+            k=len(self.people)
+            toks=[t for t in (_canon(w) for w in fn.split()) if t]
+            self.people.append((int(r), fn, toks))
+            for t in set(toks): self.by_token.setdefault(t, []).append(k)
+            items.append((fnn, k))
+        self.ac=AhoCorasick(items)
+        self.vocab=list(self.by_token)
+
+    def find(self, text: str):
+        k=self.ac.longest(_canon(text))
+        if k is None: return None, None
+        ref, fn, _ = self.people[k]
+        return ref, fn
+
+    def candidates(self, text: str, n: int = 5, cutoff: float = 0.75):
+        # ASR'nin yanlış duyduğu isimler için: kelime bazında benzerlik, kişinin tüm ad kelimeleri üzerinden ortalama
+        words=[w for w in (_canon(x) for x in (text or "").split()) if len(w)>=3]
+        sim={}
+        for w in words:
+            # Türkçe ekler için ("kayadan", "yılmaza") kelimenin 1-3 harf kısaltılmışları da denenir
+            for v in {w[:len(w)-k] for k in range(4) if len(w)-k>=3}:
+                for t in difflib.get_close_matches(v, self.vocab, n=10, cutoff=cutoff):
+                    r=difflib.SequenceMatcher(None, v, t).ratio()
+                    if r>sim.get(t,0.0): sim[t]=r
+        scores={}
+        for t in sim:
+            for k in self.by_token[t]: scores[k]=0.0
+        for k in scores:
+            toks=self.people[k][2]
+            scores[k]=sum(sim.get(t,0.0) for t in toks)/max(len(toks),1)
+        best=sorted(scores.items(), key=lambda kv: -kv[1])[:n]
+        return [(self.people[k][0], self.people[k][1], round(sc,3)) for k,sc in best if sc>=cutoff/2]
+
+# ==== Yönetici hiyerarşi indeksi ====
+MGR_COLS = ["1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ"]
+
+class ManagerIndex:
+    # veri yüklemesinde bir kez kurulur: yönetici -> bağlı satırlar (1-4 tüm seviyeler), küçük harf eşlemi, ağaç
+    @traced()
+    def __init__(self, df: pd.DataFrame):
+        n=len(df); per_level=[]
+        arrs=[df[c].fillna("").astype(str).to_numpy(dtype=object) if c in df.columns else np.full(n,"",dtype=object) for c in MGR_COLS]
+        for arr in arrs:
+            per_level.append({m:p for m,p in pd.Series(np.arange(n)).groupby(arr).indices.items() if str(m).strip()!=""})
+        self.levels={}   # yönetici -> {1..4}
+        rows={}
+        for lvl,grp in enumerate(per_level,1):
+            for m,p in grp.items():
+                self.levels.setdefault(m,set()).add(lvl); rows.setdefault(m,[]).append(p)
+        self.rows={m:(ps[0] if len(ps)==1 else np.unique(np.concatenate(ps))) for m,ps in rows.items()}
+        self.opts=sorted(self.rows)
+        # ağaç: k. seviye yöneticinin üstü aynı satırdaki (k+1). seviye yöneticidir
+        self.parents={}; self.children={}
+        for lo,hi in zip(arrs, arrs[1:]):
+            for child,parent in set(zip(lo.tolist(), hi.tolist())):
+                if str(child).strip() and str(parent).strip() and child!=parent:
+                    self.parents.setdefault(child,set()).add(parent)
+                    self.children.setdefault(parent,set()).add(child)
+        # sesli komut: küçük harf -> asıl ad (sıralı; aynı küçük harfte sonuncu kalır) ve birleşik satırlar
+        self.lower={}; low_rows={}
+        for m in self.opts:
+            self.lower[tr_lower(m)]=m; low_rows.setdefault(tr_lower(m),[]).append(self.rows[m])
+        self.rows_lower={k:(v[0] if len(v)==1 else np.unique(np.concatenate(v))) for k,v in low_rows.items()}
+        self.ac=AhoCorasick((low,low) for low in self.lower)
+        # satır -> zincirdeki (tekil) yöneticiler; KPI farklarını dağıtmak için
+        self.row_mgrs=[tuple(dict.fromkeys(m for m in ms if str(m).strip())) for ms in zip(*(a.tolist() for a in arrs))]
+
+    def find_in_text(self, text: str):
+        # cümlede geçen en uzun yönetici adı (küçük harf) ya da None
+        return self.ac.longest(tr_lower(text))
+
+# ==== Yönetici bazlı KPI toplamları (artımlı) ====
+# anahtar: yönetici adı (None = tüm şirket); değer: [KULLANILAN, SİSTEM KALAN, BÜTÇE DIŞI KALAN]
+@traced()
+def build_kpi(df: pd.DataFrame, mi: ManagerIndex) -> dict:
+    # toplamlar kuruş tamsayısında alınır (kayan nokta artığı yok), TL'ye bir kez çevrilir
+    vals = np.column_stack([df[c].to_numpy(dtype=np.int64, na_value=0) for c in DERIVED_COLS])
+    kpi = {m: vals[p].sum(axis=0) / KURUS for m,p in mi.rows.items()}
+    kpi[None] = vals.sum(axis=0) / KURUS
+    return kpi
+
+def kpi_apply(kpi: dict, mi: ManagerIndex, positions, delta: np.ndarray):
+    # satır farklarını o satırın tüm yönetici zincirine (ve şirket toplamına) ekle
+    if len(delta) == 0: return
+    kpi[None] = kpi.get(None, 0.0) + delta.sum(axis=0)
+    acc = {}
+    for p,d in zip(np.asarray(positions).tolist(), delta):
+        for m in mi.row_mgrs[p]:
+            acc[m] = acc[m] + d if m in acc else d.copy()
+    for m,d in acc.items(): kpi[m] = kpi.get(m, 0.0) + d
+
+def kpi_rollup(kpi: dict, mi: ManagerIndex) -> pd.DataFrame:
+    # tüm yöneticilerin kalan bütçe özeti (sadece sözlük okuması; kolon toplamı yok)
+    recs = [{"Yönetici": m,
+             "Seviye": ",".join(str(l) for l in sorted(mi.levels[m])),
+             "Üst Yönetici": ", ".join(sorted(mi.parents.get(m, ()))),
+             "Bağlı Kişi": len(mi.rows[m]),
+             DERIVED_COLS[0]: kpi[m][0], DERIVED_COLS[1]: kpi[m][1], DERIVED_COLS[2]: kpi[m][2]} for m in mi.opts]
+    return pd.DataFrame(recs)
+
+def _name_index(df: pd.DataFrame) -> NameIndex:
+    # ortak karenin indeksi yüklemede bir kez kurulur; başka kareler için geçici indeks
+    for S in list(_LIVE_STATES):
+        if df is S.df: return S.name_index
+    return NameIndex(df)
+
+def find_personref_by_name(df: pd.DataFrame, text: str):
+    return _name_index(df).find(text)
+
+def name_candidates(df: pd.DataFrame, text: str, n: int = 5):
+    return _name_index(df).candidates(text, n=n)
+
+def parse_op_from_text(text: str, fallback_ui_op: str | None = None) -> str | None:
+    return parse_command(text).op or fallback_ui_op
+
+def manager_chain(row):
+    mans = [str(row.get(k,"")).strip() for k in ["1.YÖNETİCİSİ","2.YÖNETİCİSİ","3.YÖNETİCİSİ","4.YÖNETİCİSİ"]]
+    mans = [m for m in mans if m]
+    return " > ".join(mans) if mans else ""
+
+# İşlem tipi -> (kolon, yön, fiil, havuz)
+OPS = {
+    "Bütçeden Düş (Sistem Kalan)":     ("NewSalary", +1, "sistem kalandan düşüldü", "Sistem"),
+    "Bütçeye Ekle (Sistem Kalan)":     ("NewSalary", -1, "sistem kalana eklendi", "Sistem"),
+    "Bütçeden Düş (Bütçe Dışı Kalan)": ("BÜTÇE DIŞI TALEPLER İLE", +1, "bütçe dışı kalandan düşüldü", "Bütçe Dışı"),
+    "Bütçeye Ekle (Bütçe Dışı Kalan)": ("BÜTÇE DIŞI TALEPLER İLE", -1, "bütçe dışı kalana eklendi", "Bütçe Dışı"),
+}
+
+def pool_from_op(op: str):
+    return "Bütçe Dışı" if ("Bütçe Dışı" in (op or "")) else "Sistem"
+
+# ================== ORTAK DURUM (tüm oturumlar) ==================
+# Kaydedilmiş veri süreç genelinde TEK kopyadır; oturumlar sadece kendi kaydedilmemiş farklarını (overlay) tutar.
+# Kaydet = iyimser birleştirme: her satırın bir sürümü var; oturumun düzenlediği satırı arada başkası
+# kaydettiyse (sürüm değiştiyse) o PersonRef çakışma olarak işaretlenir, diğerleri birleştirilir.
+try: import fcntl
+except ImportError: fcntl = None  # (Windows) süreçler arası dosya kilidi yok; süreç içi kilit yine geçerli
+
+@contextmanager
+def file_lock(path: str | None = None):
+    with open(path or LOCK_PATH, "a") as f:
+        if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try: yield
+        finally:
+            if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+_LIVE_STATES = weakref.WeakSet()  # _name_index için: ortak kareyi tanıyan durum nesneleri
+
+class SharedState:
+    def __init__(self):
+        _LIVE_STATES.add(self)
+        self.lock = threading.RLock()
+        self.df = None
+        self.version = 0
+        self.generation = 0  # tam yükleme sayacı: değişince satır konumları geçersizdir (bkz. ws_rebind)
+        # değişiklik akışı: (sürüm, kaynak oturum | None=başka süreç, konumlar); her sürüm artışı bir kayıt
+        self.changes = deque(maxlen=CHANGE_LOG_MAX)
+        self._jver = None  # son okunan günlük dosyası (boyut, mtime)
+        self.load_stats = {}
+        self.rules, self.rule_errors = [], []
+        self.sources = None  # çoklu kaynakta son birleştirme raporu
+
+    @traced()
+    def load(self):
+        with self.lock:
+            t0 = time.perf_counter()
+            self.load_stats = {}
+            with file_lock():
+                self.rules, self.rule_errors = read_rules()
+                df = load_normalized(STORE_BACKEND, self.load_stats, self.rules)
+                self.journal_seq = get_journal().last_seq()
+                self._jver = get_journal().version()
+                self.sources = source_report()
+            self.load_stats.update(saniye=time.perf_counter() - t0, satir=len(df), tepe_mb=peak_rss_mb(), kare_mb=frame_mb(df))
+            self.df = df
+            self.ref_index = build_ref_index(df)
+            self.name_index = NameIndex(df)
+            self.search_text = build_search_text(df)
+            self.mgr_index = ManagerIndex(df)
+            self.kpi = build_kpi(df, self.mgr_index)
+            # yeniden yüklemede tüm satırlar yeni sürüm alır: eski farklar çakışma sayılır (güvenli taraf)
+            self.version += 1
+            self.row_ver = np.full(len(df), self.version, dtype=np.int64)
+            self.generation += 1
+            self.dirty = set()
+
+    def ensure_loaded(self):
+        if self.df is None: self.load()
+
+    def export_xlsx(self):
+        # kaydedilmiş veriyi .xlsx'e yaz; bu noktaya kadarki işlemler artık dosyada (yeniden içe aktarımda tekrar uygulanmaz)
+        with self.lock, file_lock():
+            self._catch_up()
+            get_store().export_xlsx(tl_frame(self.df))
+            get_journal().mark_exported(self.journal_seq)
+
+    def ref_pos(self, person_ref):
+        try:
+            f = float(person_ref)
+            if f != int(f): return None
+            return self.ref_index.get(int(f))
+        except Exception: return None
+
+    def write_cells(self, col: str, positions, values):
+        # temel kolon yazımı; satırlar kirli işaretlenir, türetilenler refresh ile tazelenir
+        pos = np.asarray(positions, dtype=np.int64)
+        set_at(self.df, col, pos, values)
+        self.dirty.update(pos.tolist())
+
+    @traced()
+    def refresh(self):
+        # sadece kirli satırların türetilen kolonlarını + KPI toplamlarını güncelle
+        with self.lock:
+            if not self.dirty: return
+            pos = sorted(self.dirty)
+            kpi_apply(self.kpi, self.mgr_index, pos, recompute_derived(self.df, pos))
+            self.dirty = set()
+
+    def _catch_up(self):
+        # başka süreçlerin günlüğe eklediği kayıtları uygula (dosya kilidi altında çağrılır)
+        j = get_journal()
+        if j.last_seq() <= self.journal_seq: return []  # yeni kayıt yok: günlük okunmaz
+        recs = j.records_since(self.journal_seq)
+        if not recs: return []
+        self.version += 1; touched = set()
+        for col, (ps, vs) in journal_writes(self.ref_index, self.df.columns, recs).items():
+            self.write_cells(col, ps, vs); touched.update(ps)
+        if touched: self.row_ver[sorted(touched)] = self.version
+        self.changes.append((self.version, None, tuple(sorted(touched))))
+        self.journal_seq = max(int(r["seq"]) for r in recs)
+        self.refresh()
+        return sorted(touched)
+
+    @traced()
+    def poll(self) -> bool:
+        # ucuz kontrol: günlük dosyası değişmediyse hiçbir şey okunmaz; değiştiyse sadece yeni kayıtlar uygulanır
+        if self.df is None or get_journal().version() == self._jver: return False
+        with self.lock, file_lock():
+            touched = self._catch_up()
+            self._jver = get_journal().version()
+        return bool(touched)
+
+    def changes_since(self, version: int):
+        # dönüş: (kayıtlar, eksiksiz mi) — kayıt akıştan düştüyse ya da arada yeniden yükleme olduysa eksik
+        with self.lock:
+            entries = [c for c in self.changes if c[0] > version]
+            return entries, len(entries) == self.version - version
+
+    @traced()
+    def commit(self, overlay: dict, ops: list, origin=None):
+        # overlay: konum -> {"ver": düzenleme anındaki satır sürümü, "ref": PersonRef, "base": {kolon: değer}, "val": {kolon: değer}}
+        # dönüş: (kaydedilen konumlar, çakışan konumlar)
+        with self.lock, file_lock():
+            self._catch_up()
+            ok = [p for p,e in overlay.items() if self.row_ver[p] == e["ver"]]
+            bad = [p for p,e in overlay.items() if self.row_ver[p] != e["ver"]]
+            if ok:
+                okset = set(ok)
+                j = get_journal()
+                self.journal_seq = j.append([r for r in ops if self.ref_index.get(int(r["PersonRef"])) in okset])
+                self.version += 1
+                for col in ["NewSalary","BÜTÇE DIŞI TALEPLER İLE"]:
+                    ps = [p for p in ok if col in overlay[p]["val"]]
+                    if ps: self.write_cells(col, ps, [overlay[p]["val"][col] for p in ps])
+                self.row_ver[ok] = self.version
+                self.changes.append((self.version, origin, tuple(sorted(ok))))
+                self.refresh()
+                if j.pending() >= JOURNAL_COMPACT_AT:
+                    j.compact(get_store(), tl_frame(self.df))
+                self._jver = j.version()  # kendi yazdığımızı tekrar okumayalım
+            return ok, bad
+
+# ================== ÇALIŞMA ALANI (oturumdan bağımsız) ==================
+# Çalışma alanı = overlay (konum -> kaydedilmemiş farklar) + işlem kayıtları + KPI farkı. Uygulama bunları
+# oturum durumunda tutar; CLI ve ölçüm betikleri Workspace ile aynı fonksiyonları Streamlit'siz çağırır.
+def ws_values(S: SharedState, col: str, positions, ov) -> np.ndarray:
+    # görünen değer: kaydedilmiş değer, varsa kaydedilmemiş farkla ezilmiş
+    pos = np.asarray(positions, dtype=np.int64)
+    vals = num_at(S.df, col, pos)
+    if ov:
+        for k,p in enumerate(pos.tolist()):
+            e = ov.get(p)
+            if e is not None and col in e["val"]: vals[k] = e["val"][col]
+    return vals
+
+class Branch(MutableMapping):
+    # senaryo dalı (kopyalamada-yaz): kendi farkları + üst overlay'e (gerçek çalışma alanı) okuma.
+    # Üstteki girdiye yazılmaz; düzenlenecek satır önce dala kopyalanır (edit). Tam DataFrame kopyası yok.
+    def __init__(self, parent=None):
+        self.parent = {} if parent is None else parent
+        self.own = {}
+        self.src = {}  # konum -> kopyalandığı andaki üst değerler (aktarımda kaydırma için)
+    def __getitem__(self, p): return self.own[p] if p in self.own else self.parent[p]
+    def __setitem__(self, p, e): self.own[p] = e
+    def __delitem__(self, p): del self.own[p]; self.src.pop(p, None)
+    def __contains__(self, p): return p in self.own or p in self.parent
+    def __iter__(self):
+        yield from self.own
+        yield from (p for p in self.parent if p not in self.own)
+    def __len__(self): return len(self.own) + sum(1 for p in self.parent if p not in self.own)
+    def edit(self, p):
+        if p not in self.own and p in self.parent:
+            e = self.parent[p]
+            self.own[p] = {"ver": e["ver"], "ref": e["ref"], "base": dict(e["base"]), "val": dict(e["val"])}
+            self.src[p] = dict(e["val"])
+        return self.own.get(p)
+
+def ov_edit(ov, p: int, ver: int, ref: int) -> dict:
+    # yazılacak overlay girdisi (senaryo dalında gerçek girdiye dokunulmaz); ref: yeniden yüklemede taşımak için
+    e = ov.edit(p) if hasattr(ov, "edit") else ov.get(p)
+    if e is None: e = ov[p] = {"ver": ver, "ref": ref, "base": {}, "val": {}}
+    return e
+
+def ws_rebind(S: SharedState, ov, ops: list) -> dict:
+    # tam yüklemeden sonra (S.generation değişti) overlay konumları eski kareye aittir: girdiler PersonRef ile yeni
+    # konumlarına taşınır, kişisi artık olmayan farklar ve kayıtları düşer. Sürümler eski kalır: Kaydet'te çakışma olur.
+    # Dalda sadece kendi farkları taşınır (üst overlay ayrıca taşınır). Dönüş: eski konum -> yeni konum
+    own = ov.own if hasattr(ov, "own") else ov
+    moved = {p: S.ref_index.get(e["ref"]) for p, e in own.items()}
+    moved = {p: q for p, q in moved.items() if q is not None}
+    ents = dict(own); own.clear()
+    own.update({moved[p]: ents[p] for p in moved})
+    if hasattr(ov, "src"):
+        src = dict(ov.src); ov.src.clear()
+        ov.src.update({moved[p]: v for p, v in src.items() if p in moved})
+    ops[:] = [r for r in ops if int(r["PersonRef"]) in S.ref_index]
+    return moved
+
+@traced()
+def ws_view(S: SharedState, positions, ov) -> pd.DataFrame:
+    # kaydedilmiş satırların kopyası + overlay (TL görünüm)
+    with S.lock:
+        if positions is None: pos = np.arange(len(S.df)); out = S.df.copy()
+        else:
+            pos = np.sort(np.asarray(positions, dtype=np.int64)); out = S.df.iloc[pos].copy()
+    trace_copy("ws_view", out)
+    if ov and len(pos):
+        keys = np.fromiter(ov.keys(), dtype=np.int64, count=len(ov))
+        at = np.searchsorted(pos, keys); at[at >= len(pos)] = 0
+        hit = pos[at] == keys
+        for i,p in zip(at[hit].tolist(), keys[hit].tolist()):
+            for col,v in ov[p]["val"].items(): set_at(out, col, [i], [v])
+        recompute_derived(out, at[hit])
+    return tl_frame(out)
+
+@traced()
+def ws_kpi_delta(S: SharedState, ov) -> dict:
+    # overlay'in yönetici KPI toplamlarına etkisi — O(overlay)
+    out = {}
+    if not ov: return out
+    pos = np.fromiter(ov.keys(), dtype=np.int64, count=len(ov))
+    cur = num_at(S.df, "CurrentSalary", pos); rule = rule_at(S.df, pos)
+    before = derive(cur, num_at(S.df,"NewSalary",pos), num_at(S.df,"BÜTÇE DIŞI TALEPLER İLE",pos), rule)
+    after = derive(cur, ws_values(S,"NewSalary",pos,ov), ws_values(S,"BÜTÇE DIŞI TALEPLER İLE",pos,ov), rule)
+    kpi_apply(out, S.mgr_index, pos, after - before)
+    return out
+
+@traced()
+def ws_apply(S: SharedState, ov, ops: list, kpi_delta: dict, refs, tutar, islem_tipi: str, group: str | None = None):
+    # Tek işlemi tüm refs'e tek seferde (vektörel) uygular; group verilirse kayıtlar aynı işlem grubuna bağlanır.
+    # tutar tek sayı ya da refs ile hizalı kişi başı tutarlar olabilir.
+    # Dönüş: (uygulanan PersonRef listesi, [(ref, sebep), ...] başarısızlar, hücre farkları, eklenen kayıtlar)
+    if islem_tipi not in OPS:
+        return [], [(r, "Bilinmeyen işlem tipi") for r in refs], [], []
+    col, sign, verb, pool = OPS[islem_tipi]
+    dff=S.df  # ortak veriye dokunulmaz: farklar overlay'e yazılır
+    amts = np.broadcast_to(np.asarray(tutar, dtype=float), (len(refs),))
+    applied=[]; pos=[]; amt=[]; fails=[]; seen=set()
+    for r,a in zip(refs, amts.tolist()):
+        p=S.ref_pos(r)
+        if p is None: fails.append((r, "PersonRef bulunamadı")); continue
+        if p in seen: continue  # aynı kişiye ikinci kez uygulanmaz
+        seen.add(p); pos.append(p); amt.append(a); applied.append(int(float(r)))
+    if not pos: return applied, fails, [], []
+    pos=np.asarray(pos, dtype=np.int64); amt=np.asarray(amt)
+
+    # ---- Önceki değerler (oturum görünümü) ----
+    cur = num_at(dff,"CurrentSalary",pos)
+    new = ws_values(S,"NewSalary",pos,ov)
+    bd  = ws_values(S,"BÜTÇE DIŞI TALEPLER İLE",pos,ov)
+    rule = rule_at(dff,pos)  # ortak verideki satır kuralları (tavan/çarpan) denetim değerlerinde de kullanılır
+    pre = derive(cur, new, bd, rule)
+
+    # ---- Güncelle (overlay'e tek geçiş; türetilenler vektörel) ----
+    new_vals = (new if col=="NewSalary" else bd) + sign*amt
+    post = derive(cur, new_vals, bd, rule) if col=="NewSalary" else derive(cur, new, new_vals, rule)
+    with S.lock:
+        vers = S.row_ver[pos].tolist(); bases = num_at(dff,col,pos).tolist()
+    cells = []
+    olds = new if col=="NewSalary" else bd
+    for k,p in enumerate(pos.tolist()):
+        e = ov_edit(ov, p, vers[k], applied[k])
+        cells.append((p, col, col in e["val"], float(olds[k]), float(new_vals[k]), bases[k], vers[k], applied[k]))
+        e["base"].setdefault(col, bases[k])
+        e["val"][col] = float(new_vals[k])
+    kpi_apply(kpi_delta, S.mgr_index, pos, post - pre)
+    pre_sys, pre_dis, post_sys, post_dis = pre[:,1], pre[:,2], post[:,1], post[:,2]
+
+    # Kim bilgileri
+    strs = lambda c: dff[c].iloc[pos].fillna("").astype(str).tolist() if c in dff.columns else [""]*len(pos)
+    names, deps = strs("FULLNAME"), strs("DEPARTMAN")
+    chains = [" > ".join(m.strip() for m in ms if m.strip())
+              for ms in zip(*(strs(k) for k in MGR_COLS))]
+
+    # Kaydedilmemiş işlem kayıtları (Kaydet'te geçmişe yazılır) — tek geçişte
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    recs = [{
+        "Zaman": now,
+        "PersonRef": applied[k],
+        "AdSoyad": names[k],
+        "Departman": deps[k],
+        "Yöneticiler": chains[k],
+        "Tür": islem_tipi,
+        "Havuz": pool,
+        "Tutar": float(amt[k]),
+        "Önce_SistemKalan": float(pre_sys[k]),
+        "Sonra_SistemKalan": float(post_sys[k]),
+        "Önce_BütçeDışıKalan": float(pre_dis[k]),
+        "Sonra_BütçeDışıKalan": float(post_dis[k]),
+        "Grup": group,
+        "_kolon": col,
+        "_deger": float(new_vals[k]),
+    } for k in range(len(pos))]
+    ops.extend(recs)
+    return applied, fails, cells, recs
+
+class Workspace:
+    # Streamlit'siz çalışma alanı (CLI / ölçüm): uygulamadaki oturum overlay'inin karşılığı
+    def __init__(self, S: SharedState):
+        self.S = S; self.overlay = {}; self.ops = []; self.kpi_delta = {}; self.gen = S.generation
+    def _sync(self):
+        # ortak durum yeniden yüklendiyse farkları yeni konumlara taşı
+        if self.gen == self.S.generation: return
+        ws_rebind(self.S, self.overlay, self.ops)
+        self.kpi_delta = ws_kpi_delta(self.S, self.overlay); self.gen = self.S.generation
+    def apply(self, refs, tutar: float, islem_tipi: str, group: str | None = None):
+        self._sync()
+        return ws_apply(self.S, self.overlay, self.ops, self.kpi_delta, refs, tutar, islem_tipi, group)[:2]
+    def apply_rows(self, refs, amounts, kinds, group: str | None = None):
+        self._sync()
+        return ws_apply_rows(self.S, self.overlay, self.ops, self.kpi_delta, refs, amounts, kinds, group)
+    def view(self, positions=None) -> pd.DataFrame:
+        self._sync()
+        return ws_view(self.S, positions, self.overlay)
+    def kpi(self, key=None) -> np.ndarray:
+        self._sync()
+        return self.S.kpi[key] + self.kpi_delta.get(key, 0.0)
+    def commit(self, origin=None):
+        self._sync()
+        ok, bad = self.S.commit(self.overlay, self.ops, origin=origin)
+        okset = set(ok)
+        self.ops = [r for r in self.ops if self.S.ref_index.get(int(r["PersonRef"])) not in okset]
+        for p in ok: self.overlay.pop(p, None)
+        self.kpi_delta = ws_kpi_delta(self.S, self.overlay)
+        return ok, bad
+
+# ================== DOSYADAN TOPLU İŞLEM ==================
+# Bütçe döneminde gelen değişiklik listeleri: tablo (PersonRef ya da isim, tutar, işlem ya da havuz/yön) veya her
+# satırı bir Türkçe komut olan metin. Önce plan çıkarılır (hiçbir şey uygulanmaz), sonra ws_apply_rows uygular.
+BATCH_SCHEMA = {
+    "PersonRef": IMPORT_SCHEMA["PersonRef"][0],
+    "isim":  ["ad soyad", "adsoyad", "isim", "fullname", "kişi", "çalışan", "name"],
+    "tutar": ["tutar", "miktar", "amount", "tl", "lira"],
+    "islem": ["işlem", "işlem türü", "tür", "op", "operation"],
+    "havuz": ["havuz", "pool", "kalem", "bütçe"],
+    "yon":   ["yön", "hareket", "action"],
+    "komut": ["komut", "cümle", "metin", "command", "text"],
+}
+PLAN_COLS = ["satir", "kaynak", "PersonRef", "tutar", "islem", "sebep"]  # sebep boşsa satır uygulanır
+
+def batch_columns(header) -> dict:
+    c2orig = {_canon(str(c)): c for c in header}
+    out = {}
+    for name, alts in BATCH_SCHEMA.items():
+        for a in [name] + alts:
+            if _canon(a) in c2orig: out[name] = c2orig[_canon(a)]; break
+    return out
+
+def read_batch_file(path: str, sheet=None):
+    # dönüş: DataFrame (tablo, hücreler ham) ya da satır listesi (.txt: her satır bir komut)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False, sep=None, engine="python", encoding="utf-8-sig")
+    if ext in (".xlsx", ".xlsm", ".xls"):
+        return pd.read_excel(path, sheet_name=sheet or 0, dtype=object)
+    with open(path, encoding="utf-8-sig") as f: return [l.rstrip("\r\n") for l in f]
+
+def batch_amount(v) -> float | None:
+    # sayı hücresi, "1500.50", "1.500,50", "2.500 TL" ya da "bin beş yüz"
+    if v is None or isinstance(v, bool): return None
+    if isinstance(v, (int, float, np.number)): return None if pd.isna(v) else float(v)
+    t = str(v).strip()
+    if re.fullmatch(r"-?\d+(\.\d{1,2})?", t): return float(t)
+    return parse_command(t).amount if t else None
+
+def _batch_op(text: str) -> str | None:
+    t = (text or "").strip()
+    return t if t in OPS else parse_command(t).op
+
+@traced()
+def plan_table(S: SharedState, df: pd.DataFrame, allow_batch: bool = False) -> pd.DataFrame:
+    # satır başına (PersonRef, tutar, işlem, sebep); benzersiz değerler bir kez çözülür
+    cols = batch_columns(df.columns)
+    if "komut" in cols and "tutar" not in cols:
+        return plan_sentences(S, df[cols["komut"]].astype(str).tolist(), allow_batch)
+    n = len(df)
+    get = lambda k: df[cols[k]].reset_index(drop=True) if k in cols else pd.Series([None] * n, dtype=object)
+    txt = lambda k: get(k).map(lambda v: "" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v).strip())
+    refs = pd.to_numeric(get("PersonRef"), errors="coerce")
+    names = txt("isim")
+    byname = refs.isna() & (names != "")
+    if byname.any():
+        found = {nm: find_personref_by_name(S.df, nm)[0] for nm in names[byname].unique()}
+        refs = refs.where(~byname, names.map(found).astype(float))
+    amts = get("tutar"); amts = amts.map({v: batch_amount(v) for v in amts.unique()}).astype(float)
+    optext = (txt("islem") + " " + txt("havuz") + " " + txt("yon")).str.strip()
+    kinds = optext.map({t: _batch_op(t) for t in optext.unique()})
+    known = refs.isin(list(S.ref_index))
+    sebep = np.select(
+        [refs.isna() & byname, refs.isna(), ~known, amts.isna(), amts <= 0, kinds.isna()],
+        ["kişi bulunamadı: " + names, "kişi yok (PersonRef ya da isim)", "PersonRef " + refs.astype("Int64").astype(str) + " bulunamadı",
+         "tutar yok", "tutar pozitif olmalı", "işlem türü yok: " + optext],
+        "")
+    return pd.DataFrame({"satir": np.arange(n) + 2, "kaynak": names.where(names != "", refs.astype("Int64").astype(str)),
+                         "PersonRef": refs.astype("Int64"), "tutar": amts, "islem": kinds, "sebep": sebep})[PLAN_COLS]
+
+@traced()
+def plan_sentences(S: SharedState, lines, allow_batch: bool = False) -> pd.DataFrame:
+    # uygulamadaki sesli komutla aynı çözümleme; birleşik satır hepsi ya da hiçbiri, yönetici toplu işlem allow_batch ile
+    rows = []; mi = S.mgr_index
+    for i, line in enumerate(lines, 1):
+        t = str(line).strip()
+        if not t or t.startswith("#"): continue
+        cmds = parse_commands(t, mi); part = []; errs = []
+        for c in cmds:
+            if c.action is None and (c.history or c.confirm):
+                errs.append(f"“{c.text}”: geri al/onay komutları dosyada kullanılmaz"); continue
+            pref = c.personref
+            if pref is None: pref = find_personref_by_name(S.df, c.text)[0]
+            refs = [] if pref is None else [int(pref)]
+            miss = []
+            if len(cmds) == 1 and c.manager and (c.batch or pref is None):
+                if allow_batch: refs = S.df["PersonRef"].iloc[np.atleast_1d(mi.rows_lower[c.manager])].dropna().astype("int64").tolist()
+                else: miss.append(f"yönetici toplu işlem ({mi.lower[c.manager]}) onay ister")
+            elif pref is None: miss.append("kişi")
+            elif S.ref_pos(pref) is None: miss.append(f"PersonRef {pref} bulunamadı")
+            if c.amount is None or c.amount <= 0: miss.append("tutar")
+            if c.op is None: miss.append("işlem türü")
+            if not miss and len(cmds) == 1 and not c.trigger and c.confidence < CMD_MIN_CONFIDENCE:
+                miss.append(f"belirsiz (güven {c.confidence:.0%})")
+            if miss: errs.append(f"“{c.text}”: " + ", ".join(miss))
+            else: part += [(i, t, r, float(c.amount), c.op, "") for r in refs]
+        rows += [(i, t, None, None, None, "; ".join(errs))] if errs else part
+    out = pd.DataFrame(rows, columns=PLAN_COLS)
+    out["PersonRef"] = out["PersonRef"].astype("Int64"); out["tutar"] = out["tutar"].astype(float)
+    return out
+
+@traced()
+def ws_apply_rows(S: SharedState, ov, ops: list, kpi_delta: dict, refs, amounts, kinds, group: str | None = None):
+    # satır satır uygulamayla aynı sonuç: aynı kişinin k. satırı k. dalgada; dalga içinde işlem türü başına tek ws_apply
+    # dönüş: (uygulanan satır sayısı, [(ref, sebep), ...] başarısızlar, eklenen kayıtlar)
+    refs = np.asarray(refs, dtype=np.int64); amounts = np.asarray(amounts, dtype=float); kinds = np.asarray(kinds, dtype=object)
+    if not len(refs): return 0, [], []
+    wave = pd.Series(refs).groupby(refs).cumcount().to_numpy()
+    n_ok = 0; fails = []; recs = []
+    for w in range(int(wave.max()) + 1):
+        for op in OPS:
+            m = (wave == w) & (kinds == op)
+            if not m.any(): continue
+            a, f, _cells, r = ws_apply(S, ov, ops, kpi_delta, refs[m].tolist(), amounts[m], op, group)
+            n_ok += len(a); fails += f; recs += r
+    return n_ok, fails, recs
+
+# ================== DIŞA AKTARIM ==================
+try:
+    import xlsxwriter  # noqa: F401  (varsa büyük dosyalar sabit bellekle yazılır)
+    XLSX_ENGINE = "xlsxwriter"
+except ImportError:
+    XLSX_ENGINE = "openpyxl"
+
+@traced()
+def to_bytes(df: pd.DataFrame, fmt: str, sheet: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "csv":
+        df.to_csv(buf, index=False, encoding="utf-8-sig")  # BOM: Excel Türkçe karakterleri doğru açsın
+    elif fmt == "parquet":
+        obj = [c for c in df.columns if df[c].dtype == object]
+        df.astype({c: "string" for c in obj}).to_parquet(buf, index=False)
+    else:
+        kw = {"options": {"constant_memory": True}} if XLSX_ENGINE == "xlsxwriter" else {}
+        with pd.ExcelWriter(buf, engine=XLSX_ENGINE, engine_kwargs=kw) as w: df.to_excel(w, index=False, sheet_name=sheet)
+    return buf.getvalue()
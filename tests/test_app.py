@@ -0,0 +1,40 @@
+import os, shutil
+
+import pytest
+
+st = pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BILESIK = "sicil 69337 sistemden 500 tl düş ve sicil 25375 sistemden 100 tl ekle"
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # her test kendi kopyasında: depo/günlük dosyaları geçici dizine yazılır
+    shutil.copy(os.path.join(ROOT, "BÜTÇE ÇALIŞMAA.xlsx"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear(); st.cache_data.clear()
+    at = AppTest.from_file(os.path.join(ROOT, "butce_app.py"), default_timeout=120)
+    at.run()
+    assert not at.exception
+    return at
+
+def _voice(at, text):
+    at.query_params["voice"] = text
+    at.run()
+    assert not at.exception
+
+# ==== Birleşik komut: otomatik uygulama kapalıyken onay beklenir ====
+def test_bilesik_otomatik_kapali_onay_bekler(app):
+    [t for t in app.toggle if t.label == "🎤 Sesle otomatik uygula"][0].set_value(False).run()
+    _voice(app, BILESIK)
+    assert not app.session_state.unsaved_ops
+    assert [r for r, _, _ in app.session_state.pending_batch["items"]] == [69337, 25375]
+    _voice(app, "onayla")
+    assert app.session_state.pending_batch is None
+    assert sorted(r["PersonRef"] for r in app.session_state.unsaved_ops) == [25375, 69337]
+
+def test_bilesik_otomatik_acik_uygular(app):
+    _voice(app, BILESIK)
+    assert app.session_state.pending_batch is None
+    assert len(app.session_state.unsaved_ops) == 2
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+import butce_core as bc
+
+# ==== PersonRef rakamları tutara karışmamalı ====
+@pytest.mark.parametrize("text, amount, ref", [
+    ("sicil 12345 bin lira ekle", 1000, 12345),
+    ("sicil 12345 yüz elli lira düş", 150, 12345),
+    ("12345 numaralı kişiye bin lira ekle", 1000, 12345),
+    ("sicil 12 345 bin lira ekle", 1000, 12345),
+    ("sicil 12345 için 3 bin 500 tl düş", 3500, 12345),
+    ("sicil 12345 3 bin tl düş", 3000, 12345),
+    ("personref 4567 sistemden iki yüz elli lira düş", 250, 4567),
+    ("2500 lira ekle sicil 12345", 2500, 12345),
+    ("3 bin 500 tl düş", 3500, None),
+])
+def test_ref_digits_stay_out_of_amount(text, amount, ref):
+    cmd = bc.parse_command(text)
+    assert cmd.amount == amount
+    assert cmd.personref == ref
+
+# ==== Anlamı değiştiren kelimeler düşmemeli: oran ve olumsuz havuz ====
+@pytest.mark.parametrize("text", ["sicil 12345 yüzde on ekle", "sicil 12345 %10 ekle"])
+def test_percent_is_not_an_amount(text):
+    cmd = bc.parse_command(text)
+    assert cmd.amount is None
+    assert cmd.confidence < bc.CMD_MIN_CONFIDENCE
+
+@pytest.mark.parametrize("text, pool", [
+    ("sistemden 80 düş bütçe dışı değil", "sistem"),
+    ("sistemden değil bütçe dışından 80 düş", "dis"),
+])
+def test_negated_pool(text, pool):
+    cmd = bc.parse_command(text)
+    assert cmd.pool == pool and cmd.amount == 80
+    assert cmd.confidence < bc.CMD_MIN_CONFIDENCE
+
+# ==== Sayı kelimeleri: tam sayı -> kelimeler -> parse_tr_words ====
+def _sample(rng):
+    return rng.choice([rng.randrange(1, 1000), rng.randrange(1, 10**6), rng.randrange(1, 10**9), rng.randrange(1, 10**13)])
+
+def _joined(words, rng):
+    # ASR'nin bitişik yazdığı biçimler: "ikiyüz elli", "binbeşyüz"
+    out = [words[0]]
+    for w in words[1:]:
+        if rng.random() < 0.5: out[-1] += w
+        else: out.append(w)
+    return out
+
+VARIANTS = {
+    "düz": lambda w, rng: w,
+    "aksansız": lambda w, rng: [bc.tr_fold(x) for x in w],
+    "büyük harf": lambda w, rng: [x.upper() for x in w],
+    "ilk harf büyük": lambda w, rng: [w[0].capitalize()] + w[1:],
+    "bitişik": _joined,
+}
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_tr_words_round_trip(variant):
+    rng = random.Random(f"tr-{variant}")
+    bad = []
+    for _ in range(5000):
+        n = _sample(rng)
+        words = VARIANTS[variant](bc.tr_words(n), rng)
+        if bc.parse_tr_words(words) != n: bad.append((n, " ".join(words)))
+    assert not bad, bad[:10]
+
+def test_tr_words_lira_kurus_round_trip():
+    rng = random.Random("tr-kurus")
+    for _ in range(2000):
+        n, k = rng.randrange(1, 10**7), rng.randrange(1, 100)
+        got = bc.parse_tr_words(bc.tr_words(n) + ["lira"] + bc.tr_words(k) + ["kuruş"])
+        assert got == pytest.approx(n + k / 100), (n, k)
+
+@pytest.mark.parametrize("text, value", [
+    ("iki bin buçuk", 2500), ("on iki buçuk", 12.5), ("yüz elli virgül beş", 150.5), ("üç virgül sıfır beş", 3.05),
+])
+def test_tr_words_fractions(text, value):
+    assert bc.parse_tr_words(text.split()) == pytest.approx(value)